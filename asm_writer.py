@@ -0,0 +1,275 @@
+import vm_writer as vm
+
+
+
+"""
+
+Translation of the VM code of a whole program into Hack assembly.
+
+The standard translation writes the whole call and return protocol and
+every comparison inline, about 50 instructions per call and 15 per
+comparison. Here they are shared subroutines written once per program,
+a call site only loads its target and return address and jumps, ex:
+
+call Square.new 3   >>  @Square.new        ($CALL_3)
+                        D=A                @SP
+                        @R13               A=M
+                        M=D                M=D
+                        @$RET0             @3
+                        D=A                D=A
+                        @$CALL_3           @$CALL
+                        0;JMP              0;JMP
+                        ($RET0)
+
+return and eq / gt / lt are jumps to $RETURN, $EQ, $GT and $LT. gt and lt
+compare the signs first so that x - y cannot overflow.
+
+Single instructions are also merged with the next one where the stack
+round trip can be skipped, push x; add adds x to the top of the stack in
+place and push x; pop y copies x to y through D.
+
+Registers R13..R15 are scratch registers of the shared subroutines.
+
+"""
+
+# scratch registers
+TARGET = 'R13'
+FRAME = 'R13'
+RETURN_ADDRESS = 'R14'
+VALUE = 'R15'
+
+# segments reached through a base pointer
+BASE_POINTERS = {'local': 'LCL', 'argument': 'ARG', 'this': 'THIS', 'that': 'THAT'}
+
+# an offset up to this size is added with A=A+1 rather than through D
+MAX_INCREMENTS = 3
+
+# a function with more locals than this initializes them in a loop
+MAX_INLINE_LOCALS = 2
+
+BINARY_COMPUTATIONS = {vm.ADD: 'M=D+M', vm.SUB: 'M=M-D', vm.AND: 'M=D&M', vm.OR: 'M=D|M'}
+UNARY_COMPUTATIONS = {vm.NEG: 'M=-M', vm.NOT: 'M=!M'}
+COMPARISONS = {vm.EQ: '$EQ', vm.GT: '$GT', vm.LT: '$LT'}
+
+PUSH_D = ['@SP', 'AM=M+1', 'A=A-1', 'M=D']
+POP_D = ['@SP', 'AM=M-1', 'D=M']
+
+class AsmWriter:
+	"""
+	Writes the Hack assembly of a list of vm_writer.Instruction holding every
+	function of a program, get_asm_text() returns it as text lines.
+
+	The program starts with SP = 256 and a call to entry, Sys.init by
+	default, and loops forever once entry returns.
+	"""
+
+	def __init__(self, instructions, entry='Sys.init'):
+		self.lines = []
+		self.function_name = None
+		self.return_labels = 0
+		self.call_arities = set()
+		self.write_bootstrap(entry)
+		self.write_program(instructions)
+		self.write_subroutines()
+
+	def get_asm_text(self):
+		return [line + '\n' for line in self.lines]
+
+	def asm_text(self):
+		return ''.join(self.get_asm_text())
+
+	def emit(self, *lines):
+		self.lines.extend(lines)
+
+	def label(self, label):
+		# VM labels are local to their function
+		return f'{self.function_name}${label}'
+
+	def new_return_label(self):
+		label = f'$RET{self.return_labels}'
+		self.return_labels += 1
+		return label
+
+	def write_bootstrap(self, entry):
+		self.emit('@256', 'D=A', '@SP', 'M=D')
+		self.write_call(entry, 0)
+		self.emit('($HALT)', '@$HALT', '0;JMP')
+
+	def write_program(self, instructions):
+		position = 0
+		while position < len(instructions):
+			instruction = instructions[position]
+			following = instructions[position + 1] if position + 1 < len(instructions) else None
+			if instruction.opcode == vm.PUSH and following is not None and self.write_fused(instruction, following):
+				position += 2
+			else:
+				self.write_instruction(instruction)
+				position += 1
+
+	def write_fused(self, push, following):
+		"""writes push followed by following without the stack when it can, returns True if so"""
+
+		if following.opcode in BINARY_COMPUTATIONS:
+			self.load_d(push.arg1, push.arg2)
+			self.emit('@SP', 'A=M-1', BINARY_COMPUTATIONS[following.opcode])
+			return True
+		if following.opcode == vm.POP:
+			self.write_store(following.arg1, following.arg2, lambda: self.load_d(push.arg1, push.arg2))
+			return True
+		return False
+
+	def write_instruction(self, instruction):
+		opcode, arg1, arg2 = instruction
+		if opcode == vm.PUSH:
+			self.load_d(arg1, arg2)
+			self.emit(*PUSH_D)
+		elif opcode == vm.POP:
+			self.write_store(arg1, arg2, lambda: self.emit(*POP_D))
+		elif opcode in BINARY_COMPUTATIONS:
+			self.emit(*POP_D, 'A=A-1', BINARY_COMPUTATIONS[opcode])
+		elif opcode in UNARY_COMPUTATIONS:
+			self.emit('@SP', 'A=M-1', UNARY_COMPUTATIONS[opcode])
+		elif opcode in COMPARISONS:
+			return_label = self.new_return_label()
+			self.emit(f'@{return_label}', 'D=A', f'@{COMPARISONS[opcode]}', '0;JMP', f'({return_label})')
+		elif opcode == vm.LABEL:
+			self.emit(f'({self.label(arg1)})')
+		elif opcode == vm.GOTO:
+			self.emit(f'@{self.label(arg1)}', '0;JMP')
+		elif opcode == vm.IF_GOTO:
+			self.emit(*POP_D, f'@{self.label(arg1)}', 'D;JNE')
+		elif opcode == vm.CALL:
+			self.write_call(arg1, arg2)
+		elif opcode == vm.FUNCTION:
+			self.write_function(arg1, arg2)
+		elif opcode == vm.RETURN:
+			self.emit('@$RETURN', '0;JMP')
+
+	def address_of(self, segment, index):
+		"""returns the symbol holding a static, temp or pointer variable"""
+
+		if segment == 'static':
+			return f'{self.function_name.split(".")[0]}.{index}'
+		elif segment == 'temp':
+			return f'R{5 + index}'
+		elif segment == 'pointer':
+			return 'THIS' if index == 0 else 'THAT'
+		raise ValueError(f'{self.function_name}: unknown segment {segment}')
+
+	def select(self, segment, index):
+		"""
+		emits the instructions setting A to the address of a variable
+		reached through a base pointer, D is kept when the offset is small
+		"""
+
+		base = BASE_POINTERS[segment]
+		if index <= MAX_INCREMENTS:
+			self.emit(f'@{base}', 'A=M', *['A=A+1'] * index)
+		else:
+			self.emit(f'@{index}', 'D=A', f'@{base}', 'A=D+M')
+
+	def load_d(self, segment, index):
+		"""emits the instructions setting D to the value of a variable"""
+
+		if segment == 'constant':
+			if index <= 1:
+				self.emit(f'D={index}')
+			else:
+				self.emit(f'@{index}', 'D=A')
+		elif segment in BASE_POINTERS:
+			self.select(segment, index)
+			self.emit('D=M')
+		else:
+			self.emit(f'@{self.address_of(segment, index)}', 'D=M')
+
+	def write_store(self, segment, index, write_load):
+		"""emits the instructions storing the value write_load sets D to"""
+
+		if segment == 'constant':
+			raise ValueError(f'{self.function_name}: pop constant {index}')
+		elif segment not in BASE_POINTERS:
+			write_load()
+			self.emit(f'@{self.address_of(segment, index)}', 'M=D')
+		elif index <= MAX_INCREMENTS:
+			write_load()
+			self.select(segment, index)
+			self.emit('M=D')
+		else:
+			# the address is computed first, loading the value needs D
+			self.emit(f'@{index}', 'D=A', f'@{BASE_POINTERS[segment]}', 'D=D+M', f'@{VALUE}', 'M=D')
+			write_load()
+			self.emit(f'@{VALUE}', 'A=M', 'M=D')
+
+	def write_call(self, name, n_args):
+		return_label = self.new_return_label()
+		self.call_arities.add(n_args)
+		self.emit(
+			f'@{name}', 'D=A', f'@{TARGET}', 'M=D',
+			f'@{return_label}', 'D=A', f'@$CALL_{n_args}', '0;JMP',
+			f'({return_label})'
+		)
+
+	def write_function(self, name, n_locals):
+		self.function_name = name
+		self.emit(f'({name})')
+		if n_locals <= MAX_INLINE_LOCALS:
+			for _ in range(n_locals):
+				self.emit('@SP', 'AM=M+1', 'A=A-1', 'M=0')
+		else:
+			loop = self.label('$locals')
+			self.emit(f'@{n_locals}', 'D=A', f'({loop})', '@SP', 'AM=M+1', 'A=A-1', 'M=0', f'@{loop}', 'D=D-1;JGT')
+
+	def write_subroutines(self):
+		# $CALL_n pushes the return address in D and passes n to $CALL
+		for n_args in sorted(self.call_arities):
+			self.emit(f'($CALL_{n_args})', '@SP', 'A=M', 'M=D', f'@{n_args}', 'D=A', '@$CALL', '0;JMP')
+
+		# $CALL pushes LCL, ARG, THIS and THAT above the return address,
+		# sets ARG and LCL and jumps to the function in TARGET, D is n_args
+		self.emit('($CALL)', f'@{RETURN_ADDRESS}', 'M=D')
+		for pointer in ('LCL', 'ARG', 'THIS', 'THAT'):
+			self.emit(f'@{pointer}', 'D=M', '@SP', 'AM=M+1', 'M=D')
+		self.emit(
+			'@SP', 'MD=M+1', '@LCL', 'M=D',
+			f'@{RETURN_ADDRESS}', 'D=D-M', '@5', 'D=D-A', '@ARG', 'M=D',
+			f'@{TARGET}', 'A=M', '0;JMP'
+		)
+
+		# $RETURN copies the return value to ARG 0 and restores the frame of the caller
+		self.emit(
+			'($RETURN)', '@LCL', 'D=M', f'@{FRAME}', 'M=D',
+			'@5', 'A=D-A', 'D=M', f'@{RETURN_ADDRESS}', 'M=D',
+			*POP_D, '@ARG', 'A=M', 'M=D',
+			'@ARG', 'D=M+1', '@SP', 'M=D'
+		)
+		for pointer in ('THAT', 'THIS', 'ARG', 'LCL'):
+			self.emit(f'@{FRAME}', 'AM=M-1', 'D=M', f'@{pointer}', 'M=D')
+		self.emit(f'@{RETURN_ADDRESS}', 'A=M', '0;JMP')
+
+		# comparisons, D is the return address, the result replaces x
+		self.emit('($EQ)', f'@{VALUE}', 'M=D', *POP_D, 'A=A-1', 'D=M-D', '@$TRUE', 'D;JEQ', '@$FALSE', '0;JMP')
+		self.write_ordered_comparison('$GT', 'JGT')
+		self.write_ordered_comparison('$LT', 'JLT')
+		self.emit('($TRUE)', '@SP', 'A=M-1', 'M=-1', f'@{VALUE}', 'A=M', '0;JMP')
+		self.emit('($FALSE)', '@SP', 'A=M-1', 'M=0', f'@{VALUE}', 'A=M', '0;JMP')
+
+	def write_ordered_comparison(self, name, jump):
+		"""
+		x > y or x < y, when x and y have different signs the sign of x
+		decides, otherwise x - y cannot overflow and is tested
+		"""
+
+		x_negative = f'{name}_X_NEGATIVE'
+		same_signs = f'{name}_SAME_SIGNS'
+		# with x >= 0 and y < 0, x > y is true and x < y false
+		positive_result = '$TRUE' if name == '$GT' else '$FALSE'
+		negative_result = '$FALSE' if name == '$GT' else '$TRUE'
+		self.emit(
+			f'({name})', f'@{VALUE}', 'M=D',
+			*POP_D, f'@{TARGET}', 'M=D',
+			'@SP', 'A=M-1', 'D=M', f'@{x_negative}', 'D;JLT',
+			f'@{TARGET}', 'D=M', f'@{positive_result}', 'D;JLT', f'@{same_signs}', '0;JMP',
+			f'({x_negative})', f'@{TARGET}', 'D=M', f'@{negative_result}', 'D;JGE',
+			f'({same_signs})', f'@{TARGET}', 'D=M', '@SP', 'A=M-1', 'D=M-D',
+			'@$TRUE', f'D;{jump}', '@$FALSE', '0;JMP'
+		)
@@ -0,0 +1,274 @@
+import sys, os
+import json
+import time
+import random
+import argparse
+import tempfile
+import platform
+import tracemalloc
+from tokenizer import LEXERS, JackTokenizer
+from compilation_engine import CompilationEngine
+from jack_compiler import write_output
+
+
+
+"""
+
+Benchmarks for the compiler.
+
+Ex terminal command to compare the lexers on generated classes:
+"python benchmark.py lexer --sizes 1000 4000 16000"
+
+where every size is the number of statements of the generated class.
+
+the compiler is benchmarked phase by phase, tokenizing, compiling and
+writing the output, on generated classes whose shape is configurable,
+the results are printed as JSON:
+"python benchmark.py compiler --statements 1000 4000 --fields 16 --depth 4"
+
+"""
+
+def generate_class(n_statements, name='Bench'):
+	"""
+	generates the source of a Jack class with n_statements statements,
+	mixing comments, string constants and arithmetic.
+	"""
+
+	lines = [
+		'/** generated class used by the benchmarks */',
+		f'class {name} {{',
+		'\tfield int count;',
+		'\tmethod void run() {',
+		'\t\tvar int x, y;',
+		'\t\tvar String s;',
+	]
+	for i in range(n_statements):
+		lines.append(f'\t\t// statement number {i} updates the counters')
+		lines.append(f'\t\tlet x = x + ({i} * y) - count;')
+		lines.append('\t\t/* keep the string constant on a line of its own */')
+		lines.append(f'\t\tlet s = "string constant number {i}";')
+	lines.extend([
+		'\t\treturn;',
+		'\t}',
+		'}',
+	])
+	return '\n'.join(lines) + '\n'
+
+def time_lexer(scan, text):
+	start = time.perf_counter()
+	tokens = list(scan(text))
+	return time.perf_counter() - start, tokens
+
+def bench_lexer(sizes):
+	"""times every lexer of LEXERS on generated classes of the given sizes"""
+
+	results = []
+	for size in sizes:
+		text = generate_class(size)
+		row = {'statements': size, 'bytes': len(text)}
+		tokens_seen = None
+		for name, scan in LEXERS.items():
+			seconds, tokens = time_lexer(scan, text)
+			if tokens_seen is not None and tokens != tokens_seen:
+				raise AssertionError(f'lexer {name} disagrees on {size} statements')
+			tokens_seen = tokens
+			row[name] = seconds
+		row['tokens'] = len(tokens_seen)
+		results.append(row)
+	return results
+
+def print_lexer_results(results):
+	names = list(LEXERS)
+	header = ['statements', 'bytes', 'tokens'] + [f'{name} (s)' for name in names] + ['speedup']
+	print(' | '.join(header))
+	for row in results:
+		cells = [str(row['statements']), str(row['bytes']), str(row['tokens'])]
+		cells += [f'{row[name]:.3f}' for name in names]
+		cells.append(f"{row['legacy'] / row['regex']:.1f}x")
+		print(' | '.join(cells))
+
+# binary operators used by the generated expressions, / is left out so
+# that constant subexpressions never divide by zero
+GENERATED_OPS = ('+', '-', '*', '&', '|')
+
+def generate_expression(rng, operands, depth):
+	"""returns a random expression nested depth levels deep over operands"""
+
+	if depth == 0:
+		if rng.random() < 0.25:
+			return str(rng.randrange(1000))
+		return rng.choice(operands)
+	left = generate_expression(rng, operands, depth - 1)
+	right = generate_expression(rng, operands, rng.randrange(depth))
+	expression = f'({left} {rng.choice(GENERATED_OPS)} {right})'
+	if rng.random() < 0.1:
+		expression = f'-{expression}'
+	return expression
+
+def generate_program_class(
+		statements=1000, fields=8, local_vars=8, depth=3, string_length=40,
+		comment_lines=1, subroutines=4, name='Bench', seed=0):
+	"""
+	generates the source of a Jack class for the compiler benchmarks.
+
+	the statements are spread over subroutines methods, each declaring
+	local_vars locals next to the fields of the class. expressions are
+	nested depth levels deep, string constants are string_length long and
+	every statement follows comment_lines lines of comments. the same
+	arguments always generate the same class.
+	"""
+
+	rng = random.Random(seed)
+	field_names = [f'field{i}' for i in range(fields)]
+	local_names = [f'local{i}' for i in range(local_vars)]
+	operands = field_names + local_names
+	text = ('lorem ipsum dolor sit amet ' * (string_length // 27 + 1))[:string_length]
+
+	lines = ['/** generated class used by the compiler benchmarks */', f'class {name} {{']
+	lines.extend(f'\tfield int {field};' for field in field_names)
+	for subroutine in range(subroutines):
+		lines.append(f'\t/** generated method {subroutine} */')
+		lines.append(f'\tmethod void run{subroutine}() {{')
+		lines.extend(f'\t\tvar int {local};' for local in local_names)
+		lines.append('\t\tvar String s;')
+		for i in range(statements // subroutines):
+			for line in range(comment_lines):
+				if line % 2:
+					lines.append(f'\t\t/* block comment {line} before statement {i} */')
+				else:
+					lines.append(f'\t\t// line comment {line} before statement {i}')
+			target = rng.choice(operands)
+			expression = generate_expression(rng, operands, depth)
+			kind = rng.random()
+			if kind < 0.6:
+				lines.append(f'\t\tlet {target} = {expression};')
+			elif kind < 0.7:
+				lines.append(f'\t\tif ({expression} < {target}) {{ let {target} = {target} + 1; }} else {{ let {target} = 0; }}')
+			elif kind < 0.8:
+				lines.append(f'\t\twhile ({target} > {expression}) {{ let {target} = {target} - 1; }}')
+			elif kind < 0.9:
+				lines.append(f'\t\tdo Output.printInt({expression});')
+			else:
+				lines.append(f'\t\tlet s = "{text}";')
+		lines.extend(['\t\treturn;', '\t}'])
+	lines.append('}')
+	return '\n'.join(lines) + '\n'
+
+def run_phases(text, optimize, path):
+	"""compiles text phase by phase, returns the tokenizer, engine and the time of each phase"""
+
+	start = time.perf_counter()
+	tokenizer = JackTokenizer(source=text)
+	tokenized = time.perf_counter()
+	c_engine = CompilationEngine(tokenizer, optimize=optimize)
+	compiled = time.perf_counter()
+	write_output(path, c_engine.vm_writer.vm_text())
+	written = time.perf_counter()
+	seconds = {
+		'tokenize': tokenized - start,
+		'compile': compiled - tokenized,
+		'output': written - compiled,
+	}
+	return tokenizer, c_engine, seconds
+
+def measure_peaks(text, optimize, path):
+	"""returns the peak memory allocated during each phase, in bytes"""
+
+	peaks = {}
+	tracemalloc.start()
+	try:
+		tokenizer = JackTokenizer(source=text)
+		peaks['tokenize'] = tracemalloc.get_traced_memory()[1]
+		tracemalloc.reset_peak()
+		c_engine = CompilationEngine(tokenizer, optimize=optimize)
+		peaks['compile'] = tracemalloc.get_traced_memory()[1]
+		tracemalloc.reset_peak()
+		write_output(path, c_engine.vm_writer.vm_text())
+		peaks['output'] = tracemalloc.get_traced_memory()[1]
+	finally:
+		tracemalloc.stop()
+	return peaks
+
+def bench_compiler(sizes, optimize=0, repeat=3, **shape):
+	"""
+	benchmarks every phase of the compiler on generated classes of the given
+	sizes, shape is passed on to generate_program_class. times are the best
+	of repeat runs, peaks are measured in a separate traced run because
+	tracemalloc slows the code down.
+	"""
+
+	results = []
+	with tempfile.TemporaryDirectory() as directory:
+		path = os.path.join(directory, 'Bench_compiled.vm')
+		for size in sizes:
+			text = generate_program_class(size, **shape)
+			best = None
+			for _ in range(repeat):
+				tokenizer, c_engine, seconds = run_phases(text, optimize, path)
+				if best is None:
+					best = seconds
+				else:
+					best = {phase: min(best[phase], seconds[phase]) for phase in best}
+			tokens = len(tokenizer.get_token_text())
+			total = sum(best.values())
+			results.append({
+				'statements': size,
+				'bytes': len(text),
+				'tokens': tokens,
+				'vm_instructions': len(c_engine.vm_writer),
+				'seconds': best,
+				'total_seconds': total,
+				'tokens_per_second': {
+					'tokenize': tokens / best['tokenize'],
+					'total': tokens / total,
+				},
+				'peak_bytes': measure_peaks(text, optimize, path),
+			})
+	return results
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description='Benchmarks for the Jack compiler.')
+	sub = parser.add_subparsers(dest='command', required=True)
+	lexer = sub.add_parser('lexer', help='compare the lexers on generated classes')
+	lexer.add_argument('--sizes', type=int, nargs='+', default=[500, 2000, 8000])
+
+	compiler = sub.add_parser('compiler', help='time every phase of the compiler, printed as JSON')
+	compiler.add_argument(
+		'--statements', type=int, nargs='+', default=[1000, 4000],
+		help='sizes of the generated classes, in statements'
+	)
+	compiler.add_argument('--fields', type=int, default=8)
+	compiler.add_argument('--locals', dest='local_vars', type=int, default=8)
+	compiler.add_argument('--depth', type=int, default=3, help='nesting depth of the expressions')
+	compiler.add_argument('--string-length', type=int, default=40)
+	compiler.add_argument('--comment-lines', type=int, default=1, help='comment lines before every statement')
+	compiler.add_argument('--subroutines', type=int, default=4)
+	compiler.add_argument('--seed', type=int, default=0)
+	compiler.add_argument('-O', dest='optimize', type=int, choices=[0, 1], default=0)
+	compiler.add_argument('--repeat', type=int, default=3, help='runs per size, the best time is kept')
+	compiler.add_argument('-o', '--output', default=None, help='write the JSON to this file instead of stdout')
+	args = parser.parse_args(argv)
+
+	if args.command == 'lexer':
+		print_lexer_results(bench_lexer(args.sizes))
+	elif args.command == 'compiler':
+		shape = dict(
+			fields=args.fields, local_vars=args.local_vars, depth=args.depth,
+			string_length=args.string_length, comment_lines=args.comment_lines,
+			subroutines=args.subroutines, seed=args.seed
+		)
+		report = {
+			'python': platform.python_version(),
+			'optimize': args.optimize,
+			'shape': shape,
+			'results': bench_compiler(args.statements, args.optimize, args.repeat, **shape),
+		}
+		text = json.dumps(report, indent=2) + '\n'
+		if args.output:
+			write_output(args.output, text)
+		else:
+			sys.stdout.write(text)
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
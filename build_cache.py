@@ -0,0 +1,135 @@
+import os
+import json
+import hashlib
+import functools
+
+
+
+"""
+
+On-disk cache of compiled classes.
+
+Every entry is the VM code of a class stored under a key hashing the class
+source, the compiler itself and the compile options, so an entry can only be
+reused by an identical compilation. Entries live in a .jack_cache directory
+next to the sources, one file per key, which lets parallel workers read and
+write the cache without coordinating.
+
+The directory keeps the MAX_ENTRIES entries used last, storing a new entry
+deletes the ones past that, so editing a class does not make it grow for
+ever. Deleting the directory clears the cache.
+
+"""
+
+CACHE_DIRECTORY = '.jack_cache'
+
+# modules whose source is part of the cache key, any change to the
+# compiler invalidates every entry
+COMPILER_MODULES = (
+	'tokenizer.py', 'symbol_table.py', 'expression.py',
+	'optimizer.py', 'cfg.py', 'vm_writer.py', 'compilation_engine.py'
+)
+
+# options that do not change the generated code
+OUTPUT_NEUTRAL_OPTIONS = frozenset(['streaming'])
+
+# characters of a source hashed at a time by file_cache_key
+READ_SIZE = 64 * 1024
+
+# entries kept in the cache directory, the least recently used go first
+MAX_ENTRIES = 512
+
+def atomic_write(path, text):
+	"""writes text to a temporary file renamed over path, so a reader never sees half of it"""
+
+	temp_path = f'{path}.{os.getpid()}.tmp'
+	with open(temp_path, 'w') as f:
+		f.write(text)
+	os.replace(temp_path, path)
+
+@functools.lru_cache(maxsize=None)
+def compiler_fingerprint():
+	digest = hashlib.sha256()
+	compiler_dir = os.path.dirname(os.path.abspath(__file__))
+	for module in COMPILER_MODULES:
+		with open(os.path.join(compiler_dir, module), 'rb') as f:
+			digest.update(f.read())
+	return digest.hexdigest()
+
+def options_digest(options):
+	"""returns the hash of the compiler and options, the source is added to it"""
+
+	options = {
+		name: value for name, value in options.items()
+		if name not in OUTPUT_NEUTRAL_OPTIONS
+	}
+	digest = hashlib.sha256()
+	digest.update(compiler_fingerprint().encode())
+	digest.update(json.dumps(options, sort_keys=True).encode())
+	return digest
+
+def cache_key(source, options):
+	digest = options_digest(options)
+	digest.update(source.encode())
+	return digest.hexdigest()
+
+def file_cache_key(file, options):
+	"""
+	returns the cache_key of the source in file, which is read READ_SIZE
+	characters at a time instead of all at once
+	"""
+
+	digest = options_digest(options)
+	with open(file) as f:
+		for chunk in iter(lambda: f.read(READ_SIZE), ''):
+			digest.update(chunk.encode())
+	return digest.hexdigest()
+
+class BuildCache:
+	"""
+	The cache of the classes of one directory.
+
+	get(key) returns the cached VM code or None, put(key, vm_text) stores it
+	and prunes the entries past max_entries.
+	"""
+
+	def __init__(self, directory, max_entries=MAX_ENTRIES):
+		self.directory = os.path.join(directory, CACHE_DIRECTORY)
+		self.max_entries = max_entries
+
+	def entry_path(self, key):
+		return os.path.join(self.directory, key + '.vm')
+
+	def get(self, key):
+		path = self.entry_path(key)
+		try:
+			with open(path) as f:
+				vm_text = f.read()
+			# the modification time orders the entries for prune
+			os.utime(path)
+		except FileNotFoundError:
+			return None
+		return vm_text
+
+	def put(self, key, vm_text):
+		os.makedirs(self.directory, exist_ok=True)
+		atomic_write(self.entry_path(key), vm_text)
+		self.prune()
+
+	def prune(self):
+		"""deletes the least recently used entries past max_entries"""
+
+		entries = []
+		for entry in os.scandir(self.directory):
+			if entry.name.endswith('.vm'):
+				try:
+					entries.append((entry.stat().st_mtime_ns, entry.path))
+				except FileNotFoundError:
+					# pruned by another worker meanwhile
+					continue
+		entries.sort(reverse=True)
+		for _, path in entries[self.max_entries:]:
+			try:
+				os.remove(path)
+			except FileNotFoundError:
+				continue
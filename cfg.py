@@ -0,0 +1,244 @@
+import collections
+import vm_writer as vm
+from vm_writer import Instruction, format_instruction
+from optimizer import split_functions
+
+
+
+"""
+
+Control flow graph of the VM code of a function.
+
+The code of a function is split into basic blocks, a block starts at the
+labels in front of it and ends with a goto, an if-goto or a return, or
+right before the next label. A block goes on with the block of the label
+it jumps to and, unless it ends with a goto or a return, with the block
+after it, ex:
+
+B0 -> B2, B1          B1 -> B3           B2 (IF_FALSE0) -> B3
+push argument 0       push constant 1    push constant 2
+if-goto IF_FALSE0     pop local 0        pop local 0
+                      goto IF_END0
+
+optimize() then rewrites the graph until nothing changes:
+
+- jump threading, a jump to a block that is only a goto jumps to its
+  target instead, and a goto to a short block ending with return is
+  replaced by a copy of that block
+- blocks no path from the first one reaches are removed, ex: the code
+  after a return
+- a block with a single predecessor is merged into it, when that
+  predecessor falls through or jumps to it and it does not fall through
+  itself
+- labels nobody jumps to and gotos to the next block are dropped
+
+"""
+
+JUMPS = frozenset([vm.GOTO, vm.IF_GOTO])
+TERMINATORS = frozenset([vm.GOTO, vm.IF_GOTO, vm.RETURN])
+
+# a goto to a block ending with return of at most this many instructions
+# is replaced by a copy of the block
+MAX_RETURN_COPY = 2
+
+# a basic block, labels are the names of the labels in front of it and
+# code its instructions without them
+Block = collections.namedtuple('Block', 'labels code')
+
+class ControlFlowGraph:
+	"""
+	The basic blocks of one function, in program order. header is its
+	function instruction, instructions() returns the code of the graph.
+	"""
+
+	def __init__(self, code):
+		if not code or code[0].opcode != vm.FUNCTION:
+			raise ValueError('a control flow graph needs the code of one function')
+		self.header = code[0]
+		self.blocks = []
+		block = None
+		for instruction in code[1:]:
+			if instruction.opcode == vm.LABEL:
+				if block is None or block.code:
+					block = Block([], [])
+					self.blocks.append(block)
+				block.labels.append(instruction.arg1)
+				continue
+			if block is None:
+				block = Block([], [])
+				self.blocks.append(block)
+			block.code.append(instruction)
+			if instruction.opcode in TERMINATORS:
+				block = None
+
+	def name(self):
+		return self.header.arg1
+
+	def label_blocks(self):
+		"""returns a dict of label to the index of the block it names"""
+
+		return {
+			label: index
+			for index, block in enumerate(self.blocks)
+			for label in block.labels
+		}
+
+	def successors(self, index, label_blocks=None):
+		"""returns the indexes of the blocks the block at index goes on with, jump target first"""
+
+		if label_blocks is None:
+			label_blocks = self.label_blocks()
+		block = self.blocks[index]
+		last = block.code[-1] if block.code else None
+		successors = []
+		if last is not None and last.opcode in JUMPS:
+			if last.arg1 not in label_blocks:
+				raise ValueError(f'{self.name()}: jump to undefined label {last.arg1}')
+			successors.append(label_blocks[last.arg1])
+		falls_through = last is None or last.opcode not in (vm.GOTO, vm.RETURN)
+		if falls_through and index + 1 < len(self.blocks):
+			successors.append(index + 1)
+		return successors
+
+	def predecessors(self):
+		"""returns the list of the predecessors of every block, one entry per edge"""
+
+		label_blocks = self.label_blocks()
+		predecessors = [[] for _ in self.blocks]
+		for index in range(len(self.blocks)):
+			for successor in self.successors(index, label_blocks):
+				predecessors[successor].append(index)
+		return predecessors
+
+	def jump_labels(self):
+		"""returns the labels some instruction jumps to"""
+
+		return set(
+			block.code[-1].arg1 for block in self.blocks
+			if block.code and block.code[-1].opcode in JUMPS
+		)
+
+	def thread_jumps(self):
+		"""retargets the jumps to blocks that only jump on, returns True if something changed"""
+
+		label_blocks = self.label_blocks()
+		changed = False
+		for block in self.blocks:
+			if not block.code or block.code[-1].opcode not in JUMPS:
+				continue
+			jump = block.code[-1]
+			label = jump.arg1
+			seen = set()
+			while label not in seen and label in label_blocks:
+				seen.add(label)
+				target = self.blocks[label_blocks[label]].code
+				if len(target) != 1 or target[0].opcode != vm.GOTO:
+					break
+				label = target[0].arg1
+			target = self.blocks[label_blocks[label]].code if label in label_blocks else []
+			if (
+				jump.opcode == vm.GOTO and target and len(target) <= MAX_RETURN_COPY
+				and target[-1].opcode == vm.RETURN
+			):
+				block.code[-1:] = target
+				changed = True
+			elif label != jump.arg1:
+				block.code[-1] = Instruction(jump.opcode, label, None)
+				changed = True
+		return changed
+
+	def remove_unreachable(self):
+		"""removes the blocks the first block does not reach, returns True if there were some"""
+
+		if not self.blocks:
+			return False
+		label_blocks = self.label_blocks()
+		reached = {0}
+		pending = [0]
+		while pending:
+			for successor in self.successors(pending.pop(), label_blocks):
+				if successor not in reached:
+					reached.add(successor)
+					pending.append(successor)
+		if len(reached) == len(self.blocks):
+			return False
+		# a reached block falling through reaches the next one, so the
+		# blocks left keep their order and their fall through
+		self.blocks = [block for index, block in enumerate(self.blocks) if index in reached]
+		return True
+
+	def merge_blocks(self):
+		"""merges a block into its only predecessor where it can, returns True if it did"""
+
+		predecessors = self.predecessors()
+		for index, block in enumerate(self.blocks):
+			if index == 0 or len(predecessors[index]) != 1 or predecessors[index][0] == index:
+				continue
+			previous_index = predecessors[index][0]
+			previous = self.blocks[previous_index]
+			last = previous.code[-1] if previous.code else None
+			if previous_index == index - 1 and (last is None or last.opcode != vm.IF_GOTO):
+				# falls through, or jumps, to the next block
+				if last is not None and last.opcode == vm.GOTO:
+					del previous.code[-1]
+				previous.code.extend(block.code)
+				del self.blocks[index]
+				return True
+			ends = block.code[-1].opcode if block.code else None
+			if last is not None and last.opcode == vm.GOTO and ends in (vm.GOTO, vm.RETURN):
+				# jumped to and not falling through, it moves after its predecessor
+				previous.code[-1:] = block.code
+				del self.blocks[index]
+				return True
+		return False
+
+	def optimize(self):
+		"""runs the passes until nothing changes, returns the graph"""
+
+		while self.thread_jumps() or self.remove_unreachable() or self.merge_blocks():
+			pass
+		return self
+
+	def instructions(self):
+		"""returns the code of the function, without the unused labels and the gotos to the next block"""
+
+		jump_labels = self.jump_labels()
+		code = [self.header]
+		for index, block in enumerate(self.blocks):
+			for label in block.labels:
+				if label in jump_labels:
+					code.append(Instruction(vm.LABEL, label, None))
+			block_code = block.code
+			following = self.blocks[index + 1] if index + 1 < len(self.blocks) else None
+			if (
+				following is not None and block_code and block_code[-1].opcode == vm.GOTO
+				and block_code[-1].arg1 in following.labels
+			):
+				block_code = block_code[:-1]
+			code.extend(block_code)
+		return code
+
+	def dump(self):
+		"""returns the graph as text, every block with its labels, successors and code"""
+
+		label_blocks = self.label_blocks()
+		lines = [f'function {self.name()} {self.header.arg2}']
+		for index, block in enumerate(self.blocks):
+			labels = f' ({", ".join(block.labels)})' if block.labels else ''
+			successors = ', '.join(f'B{successor}' for successor in self.successors(index, label_blocks))
+			lines.append(f'  B{index}{labels} -> {successors or "exit"}')
+			lines.extend(f'    {format_instruction(instruction).rstrip()}' for instruction in block.code)
+		return '\n'.join(lines) + '\n'
+
+def control_flow_graphs(instructions):
+	"""returns the ControlFlowGraph of every function of the code of a class"""
+
+	return [ControlFlowGraph(code) for code in split_functions(instructions)]
+
+def optimize_cfg(instructions):
+	"""returns the code of a class with the graph of every function optimized"""
+
+	optimized = []
+	for graph in control_flow_graphs(instructions):
+		optimized.extend(graph.optimize().instructions())
+	return optimized
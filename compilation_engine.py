@@ -1,7 +1,26 @@
 from symbol_table import SymbolTable
 from vm_writer import VMWriter
-
-
+from tokenizer import SYMBOL, INT_CONST, STRING_CONST
+from expression import (
+	Const, Var, Unary, Binary, Index, Call, String, ThatPointer,
+	fold, write_tree, write_branch, write_pointer, element_address, keeps_pointer,
+	has_calls, is_stable_key, common_subtrees
+)
+from optimizer import peephole
+from cfg import optimize_cfg
+from signature_index import Signature
+
+
+# statement keyword to the method compiling it
+STATEMENT_METHODS = {
+	'let': 'compile_let',
+	'if': 'compile_if',
+	'while': 'compile_while',
+	'do': 'compile_do',
+	'return': 'compile_return',
+}
+
+BINARY_OPS = frozenset(['+', '-', '*', '/', '&', '|', '<', '>', '='])
 
 class CompilationEngine:
 	"""
@@ -13,36 +32,103 @@ class CompilationEngine:
 
 	Second step (not relevant here) is to take the generated VM code to be translated 
 	into assembly instruction according to the Hack computer architecture.
-	"""
 
-	IF_COUNTER = 0
-	WHILE_COUNTER = 0
-	OUTPUT_XML = []
+	Expressions are parsed into trees (see expression.py) before their code is
+	written. With optimize >= 1 constants are folded and algebraic identities
+	simplified on the way, and the control flow graph passes of cfg.py and the
+	peephole pass of optimizer.py run over the code of the class once it is
+	compiled.
+
+	Array elements are reached through pointer 1 once per statement when the
+	base and index allow it, with the constant part of the index as the
+	offset in that (see write_pointer):
+
+	let a[i + 1] = a[i] + a[i + 1]    >>  push local 0 ... pop pointer 1
+	                                      push that 0
+	                                      push that 1
+	                                      add
+	                                      pop that 1
+
+	A pure subexpression a statement computes several times is computed once
+	into a hidden local, $cse0, $cse1 ..., when that is cheaper (see
+	common_subtrees).
+
+	Conditions are then compiled into jumps (see write_branch), and a while
+	loop tests its condition at the bottom, so an iteration runs a single
+	if-goto instead of a not, an if-goto and a goto:
+
+	goto WHILE_EXP0
+	label WHILE_BODY0
+	...                    // statements
+	label WHILE_EXP0
+	...                    // condition
+	if-goto WHILE_BODY0
+
+	With pool_strings the identical string constants of a class share one
+	hidden static, built on first use by a helper function of the class:
+
+	function Main.$str0 0
+	push static 2          // $str0
+	if-goto POOLED
+	push constant 5
+	call String.new 1
+	...                    // appendChar of every character
+	pop static 2
+	label POOLED
+	push static 2
+	return
+
+	and every use of the constant is a call Main.$str0 0. Pooled strings are
+	shared, a caller must not change them with appendChar / setCharAt or
+	dispose of them.
+
+	Given the signatures of the classes of the program (see signature_index.py)
+	a call only passes an object to a method, foo() calls a function of the
+	class without pushing pointer 0, and the number of arguments of a call is
+	checked against the declaration.
+
+	Given a profiler (see profiler.py) the compile_* methods of the engine and
+	the lookups of its symbol table are recorded.
+	"""
 
-	def __init__(self, tokenizer):
+	def __init__(self, tokenizer, optimize=0, pool_strings=False, signatures=None, profiler=None):
 		self.tokenizer = tokenizer
+		self.optimize = optimize
+		# class name to the [kind, arity] of its subroutines, see signature_index.py
+		self.signatures = signatures or {}
+		self.pool_strings = pool_strings
+		# string constant to the name of its helper function, per class
+		self.string_pool = {}
+		# methods are only wrapped when profiling, see profiler.py
+		self.profiler = profiler
+		if profiler is not None:
+			profiler.instrument(self)
+		# number of instructions the control flow graph and peephole passes removed
+		self.removed_instructions = 0
 		self.symbol_table = None
 		self.vm_writer = None
+		# label counters are kept per engine so compilations do not interfere
+		self.if_counter = 0
+		self.while_counter = 0
+		self.condition_counter = 0
 		self.compile_class()
-	
-	def __del__(self):
-		CompilationEngine.IF_COUNTER = 0
-		CompilationEngine.WHILE_COUNTER = 0
-		CompilationEngine.OUTPUT_XML = []
 		
 	def if_label(self, case):
-		label = f'if_{case}{CompilationEngine.IF_COUNTER}'.upper()
+		label = f'if_{case}{self.if_counter}'.upper()
 		return label
 
 	def while_label(self, case):
-		label = f'while_{case}{CompilationEngine.WHILE_COUNTER}'.upper()
+		label = f'while_{case}{self.while_counter}'.upper()
+		return label
+
+	def condition_label(self):
+		label = f'COND_SKIP{self.condition_counter}'
+		self.condition_counter += 1
 		return label
 	
 	def class_fields_count(self):
 		"""asks the symbol table about the number of fields of the current class"""
-		kind_entries = self.symbol_table.class_level.values()
-		fields = list(filter(lambda obj: obj['kind'] == 'field', kind_entries))
-		return len(fields)
+		return self.symbol_table.var_count('field')
 
 	def segment(self, term):
 		segment_switcher = {
@@ -65,7 +151,7 @@ class CompilationEngine:
 	
 	def eat(self, string):
 		if string != self.tokenizer.current_token():
-			raise ValueError(f'Unexpected token {string}')
+			raise ValueError(f'Unexpected token {string} at line {self.tokenizer.current_line()}')
 		else:
 			self.tokenizer.advance()
 	
@@ -83,6 +169,12 @@ class CompilationEngine:
 		return self.symbol_table.type_of(fun_call) not in ['int', 'char', 'boolean', None]
 
 
+	def signature(self, class_name, name):
+		"""returns the Signature of class_name.name, or None if it is not in the index"""
+
+		entry = self.signatures.get(class_name, {}).get(name)
+		return Signature(*entry) if entry is not None else None
+
 	def compile_parameterList(self):
 		# if there are params passed to the subroutineDec
 		if self.tokenizer.current_token() != ')':
@@ -141,87 +233,206 @@ class CompilationEngine:
 			self.eat(';')
 		
 	def compile_expressionList(self):
-		n_args = 0
+		"""returns the expression tree of every argument"""
+
+		args = []
 		# if there are args passed to the subroutineCall
 		if self.tokenizer.current_token() != ')':
-			n_args = 1
-			self.compile_expression()
+			args.append(self.compile_expression())
 			while self.tokenizer.current_token() == ',':
 				self.eat(',')
-				self.compile_expression()
-				n_args += 1
+				args.append(self.compile_expression())
+
+		return args
+
+	def compile_subroutineCall(self, name):
+		"""
+		name is the identifier already eaten in front of the call, the current
+		token is either ( for foo(expressionList) or . for foo.bar(expressionList).
+
+		returns the Call tree, including the object passed as first argument.
+		"""
+
+		this_args = []
+		if self.tokenizer.current_token() == '(': # foo(expressionList)
+			class_name = self.symbol_table.st_class_name()
+			signature = self.signature(class_name, name)
+			# method cannot be called directly unless it resides in its 
+			# own class, so pass the current object as first argument,
+			# a function of the class known to the index gets none
+			if signature is None or signature.kind == 'method':
+				this_args.append(Var('pointer', 0))
+			name = f'{class_name}.{name}'
+		else: # foo.bar(expressionList)
+			self.eat('.')
+			other_name = self.tokenizer.current_token()
+			# if object declared, pass the object as first argument
+			if self.is_class_obj(name):
+				# obtain the class of the object for the call
+				class_type = self.symbol_table.type_of(name)
+				signature = self.signature(class_type, other_name)
+				if signature is None or signature.kind == 'method':
+					this_args.append(Var(*self.segment(name)))
+				name = f'{class_type}.{other_name}'
+			else:
+				# OS class or function call
+				signature = self.signature(name, other_name)
+				name += f'.{other_name}'
+			self.eat(other_name)
 
-		return n_args
+		self.eat('(')
+		args = self.compile_expressionList()
+		if signature is not None and len(args) != signature.arity:
+			raise ValueError(
+				f'{name} takes {signature.arity} arguments, {len(args)} given '
+				f'at line {self.tokenizer.current_line()}'
+			)
+		self.eat(')')
+		return Call(name, tuple(this_args + args))
 
 	def compile_term(self):
-		if self.tokenizer.current_token() == '(': # (expression)
+		"""returns the expression tree of the term"""
+
+		# a string constant can hold the text of a symbol, so its type is checked too
+		is_symbol = self.tokenizer.token_code() == SYMBOL
+		if is_symbol and self.tokenizer.current_token() == '(': # (expression)
 			self.eat('(')
-			self.compile_expression()
+			node = self.compile_expression()
 			self.eat(')')
-		elif self.tokenizer.current_token() in ['-', '~']: # unaryOp 
+			return node
+		elif is_symbol and self.tokenizer.current_token() in ['-', '~']: # unaryOp 
 			op = self.tokenizer.current_token() 
 			self.eat(op) # unaryOp
-			self.compile_term()
-			self.vm_writer.write_arithmatic(op if op == '~' else 'neg')
-		else:
-			term = self.tokenizer.current_token() # foo
-			if term == 'true':
-				self.vm_writer.write_push('constant', 0)
-				self.vm_writer.write_arithmatic('~')
-			elif term in ['false', 'null'] or term.isdigit() or self.symbol_table.kind_of(term):
-				term_segment, term_index = self.segment(term)
-				self.vm_writer.write_push(term_segment, term_index)
-			elif self.tokenizer.token_type() == 'STRING_CONST':
-				self.vm_writer.write_push('constant', len(term))
-				self.vm_writer.write_call('String.new', 1)
-				for ch in term:
-					# ord(ch) gets the ASCII code for each character
-					self.vm_writer.write_push('constant', ord(ch))
-					self.vm_writer.write_call('String.appendChar', 2)
-			self.eat(term)
-
-			if self.tokenizer.current_token() == '[': # foo[expression]
-				self.eat('[')
-				self.compile_expression()
-				self.vm_writer.write_arithmatic('+')
-				self.eat(']')
-				self.vm_writer.write_pop('pointer', 1)
-				self.vm_writer.write_push('that', 0)
-			elif self.tokenizer.current_token() == '(': # foo(expressionList)
-				self.eat('(')
-				# function cannot be called directly unless it resides in 
-				# its own class so, pass the current object as first argument
-				self.vm_writer.write_push('pointer', 0)
-				term = f'{self.symbol_table.st_class_name()}.{term}'
-				this_increment = 1
-				n_args = self.compile_expressionList() + this_increment
-				self.vm_writer.write_call(term, n_args)
-				self.eat(')')
-			elif self.tokenizer.current_token() == '.': # foo.bar(expressionList)
-				self.eat('.')
-				this_increment = 0
-				other_term = self.tokenizer.current_token()
-				if self.is_class_obj(term):
-					# obtain the class of the object for the call
-					class_type = self.symbol_table.type_of(term)
-					term = f'{class_type}.{other_term}'
-					this_increment = 1
-				else:
-					# OS class or function call
-					term += f'.{other_term}'
-				self.eat(other_term)
-				self.eat('(')
-				n_args = self.compile_expressionList() + this_increment
-				self.vm_writer.write_call(term, n_args)
-				self.eat(')')
+			return Unary(op, self.compile_term())
+
+		term = self.tokenizer.current_token() # foo
+		term_code = self.tokenizer.token_code()
+		self.eat(term)
+		if term_code == STRING_CONST:
+			if self.pool_strings:
+				return Call(self.pooled_string(term), ())
+			return String(term)
+		elif term_code == INT_CONST:
+			return Const(int(term))
+		elif term == 'true':
+			return Unary('~', Const(0))
+		elif term in ['false', 'null']:
+			return Const(0)
+		elif term == 'this':
+			return Var('pointer', 0)
+
+		if self.tokenizer.current_token() == '[': # foo[expression]
+			self.eat('[')
+			node = Index(Var(*self.segment(term)), self.compile_expression())
+			self.eat(']')
+			return node
+		elif self.tokenizer.current_token() in ['(', '.']: # foo(...) or foo.bar(...)
+			return self.compile_subroutineCall(term)
+		elif self.symbol_table.kind_of(term):
+			return Var(*self.segment(term))
+
+		raise ValueError(f'Undefined identifier {term} at line {self.tokenizer.current_line()}')
+
+	def pooled_string(self, text):
+		"""returns the helper function of a string constant, its static is defined on first use"""
+
+		name = self.string_pool.get(text)
+		if name is None:
+			# $ cannot start a Jack identifier, so the static never clashes
+			static_name = f'$str{len(self.string_pool)}'
+			self.symbol_table.define_identifier(static_name, 'String', 'static')
+			name = self.string_pool[text] = f'{self.symbol_table.st_class_name()}.{static_name}'
+		return name
+
+	def write_string_pool(self):
+		"""writes the helper function of every pooled string constant"""
+
+		for text, name in self.string_pool.items():
+			index = self.symbol_table.index_of(name.split('.')[1])
+			self.vm_writer.write_function(name, 0)
+			self.vm_writer.write_push('static', index)
+			self.vm_writer.write_if('POOLED')
+			write_tree(String(text), self.vm_writer)
+			self.vm_writer.write_pop('static', index)
+			self.vm_writer.write_label('POOLED')
+			self.vm_writer.write_push('static', index)
+			self.vm_writer.write_return()
 
 	def compile_expression(self):
-		self.compile_term()
-		while self.tokenizer.current_token() in ['+', '-', '*', '/', '&', '|', '<', '>', '=']:
+		"""returns the expression tree, operators apply from left to right"""
+
+		node = self.compile_term()
+		while self.tokenizer.current_token() in BINARY_OPS:
 			op = self.tokenizer.current_token() # op
 			self.eat(op)
-			self.compile_term()
-			self.vm_writer.write_arithmatic(op)
+			node = Binary(op, node, self.compile_term())
+		return node
+
+	def write_expression(self, node):
+		"""emits the code of an expression tree, folding its constants first when optimizing"""
+
+		if self.optimize:
+			node, = self.share_subtrees(fold(node))
+			write_tree(node, self.vm_writer, ThatPointer())
+		else:
+			write_tree(node, self.vm_writer)
+
+	def cse_slot(self, number):
+		"""returns the hidden local holding the number-th shared subtree of a statement"""
+
+		# $ cannot start a Jack identifier, the locals are counted in n_locals
+		name = f'$cse{number}'
+		if self.symbol_table.kind_of(name) is None:
+			self.symbol_table.define_identifier(name, 'int', 'local')
+		return Var('local', self.symbol_table.index_of(name))
+
+	def share_subtrees(self, *trees):
+		"""
+		writes the subtrees the trees of one statement have in common into
+		hidden locals (see common_subtrees) and returns the trees reading them
+		"""
+
+		hoisted, trees = common_subtrees(trees, self.cse_slot)
+		for slot, node in hoisted:
+			write_tree(node, self.vm_writer)
+			self.vm_writer.write_pop(slot.segment, slot.index)
+		return trees
+
+	def write_condition(self, node, label, jump_if):
+		"""emits the code jumping to label when the truth of the condition node is jump_if"""
+
+		node, = self.share_subtrees(fold(node))
+		write_branch(node, label, jump_if, self.vm_writer, self.condition_label, ThatPointer())
+
+	def write_array_store(self, target, value):
+		"""
+		emits let target = value for an array element target. pointer 1 is
+		set before value is computed when the code of value leaves it alone,
+		or after it when value cannot change the address. Otherwise the value
+		waits in temp 0 while pointer 1 is set.
+		"""
+
+		target, value = self.share_subtrees(fold(target), fold(value))
+		that = ThatPointer()
+		key = element_address(target)[0]
+		if keeps_pointer(value, key):
+			offset = write_pointer(target, self.vm_writer, that)
+			write_tree(value, self.vm_writer, that)
+			self.vm_writer.write_pop('that', offset)
+			return
+		if key is not None and (is_stable_key(key) or not has_calls(value)):
+			write_tree(value, self.vm_writer, that)
+			offset = write_pointer(target, self.vm_writer, that)
+			self.vm_writer.write_pop('that', offset)
+			return
+		write_tree(target.base, self.vm_writer, that)
+		write_tree(target.index, self.vm_writer, that)
+		self.vm_writer.write_arithmatic('+')
+		write_tree(value, self.vm_writer, that)
+		self.vm_writer.write_pop('temp', 0)
+		self.vm_writer.write_pop('pointer', 1)
+		self.vm_writer.write_push('temp', 0)
+		self.vm_writer.write_pop('that', 0)
 	
 	def compile_let(self):
 		self.eat('let')
@@ -229,12 +440,20 @@ class CompilationEngine:
 		self.eat(var)
 		# looking ahead one more step LL(2)
 		symbol = self.tokenizer.current_token() 
+		if symbol == '[' and self.optimize:
+			self.eat('[')
+			target = Index(Var(*self.segment(var)), self.compile_expression())
+			self.eat(']')
+			self.eat('=')
+			self.write_array_store(target, self.compile_expression())
+			self.eat(';')
+			return
 		if self.tokenizer.current_token() == '[':
 			# array manipulation
 			var_segment, var_index = self.segment(var)	
 			self.vm_writer.write_push(var_segment, var_index)
 			self.eat('[')
-			self.compile_expression()
+			self.write_expression(self.compile_expression())
 			self.vm_writer.write_arithmatic('+')
 			self.eat(']')
 		elif self.tokenizer.current_token() == '(':
@@ -248,7 +467,7 @@ class CompilationEngine:
 			self.compile_expressionList()
 			self.eat(')')
 		self.eat('=')
-		self.compile_expression()
+		self.write_expression(self.compile_expression())
 
 		if symbol == '[':
 			self.vm_writer.write_pop('temp', 0)
@@ -264,106 +483,95 @@ class CompilationEngine:
 	def compile_if(self):
 		self.eat('if')
 		self.eat('(')
-		self.compile_expression()
+		condition = self.compile_expression()
 
 		label_true = self.if_label('true')
 		label_false = self.if_label('false')
 		label_end = self.if_label('end')
 		
 		# increment the if statement label counter in current scope
-		CompilationEngine.IF_COUNTER += 1
+		self.if_counter += 1
 		
-		self.vm_writer.write_if(label_true) # if true, jump to if
-		# if not true, go to else
-		self.vm_writer.write_goto(label_false)
+		if self.optimize:
+			# skip the statements when the condition is false
+			self.write_condition(condition, label_false, False)
+		else:
+			self.write_expression(condition)
+			self.vm_writer.write_if(label_true) # if true, jump to if
+			# if not true, go to else
+			self.vm_writer.write_goto(label_false)
+			self.vm_writer.write_label(label_true)
 		self.eat(')')
 		self.eat('{')
-		self.vm_writer.write_label(label_true)
 		self.compile_statements()
-		self.vm_writer.write_label(label_false)
 		self.eat('}')
 		if self.tokenizer.current_token() == 'else':
 			self.eat('else')
 			self.eat('{')
 			self.vm_writer.write_goto(label_end)
+			self.vm_writer.write_label(label_false)
 			self.compile_statements()
 			self.eat('}')
 			self.vm_writer.write_label(label_end)
+		else:
+			self.vm_writer.write_label(label_false)
 
 	def compile_while(self):
 		self.eat('while')
 		self.eat('(')
 		
 		label_exp = self.while_label('exp')
+		label_body = self.while_label('body')
 		label_end = self.while_label('end')
 		
 		# increment the while statement label counter in current scope
-		CompilationEngine.WHILE_COUNTER += 1
+		self.while_counter += 1
 		
-		self.vm_writer.write_label(label_exp)
-		self.compile_expression()
-		self.vm_writer.write_arithmatic('~')
-		self.vm_writer.write_if(label_end)
+		condition = self.compile_expression()
 		self.eat(')')
 		self.eat('{')
-		self.compile_statements()
-		self.vm_writer.write_goto(label_exp)
-		self.vm_writer.write_label(label_end)
+		if self.optimize:
+			# the condition is tested at the bottom, as with -O0 the loop
+			# goes on while not condition is false
+			self.vm_writer.write_goto(label_exp)
+			self.vm_writer.write_label(label_body)
+			self.compile_statements()
+			self.vm_writer.write_label(label_exp)
+			self.write_condition(Unary('~', condition), label_body, False)
+		else:
+			self.vm_writer.write_label(label_exp)
+			self.write_expression(condition)
+			self.vm_writer.write_arithmatic('~')
+			self.vm_writer.write_if(label_end)
+			self.compile_statements()
+			self.vm_writer.write_goto(label_exp)
+			self.vm_writer.write_label(label_end)
 		self.eat('}')
 
 	def compile_do(self):
 		self.eat('do')
 		callee = self.tokenizer.current_token()
 		self.eat(callee)
-		this_increment = 0
-		if self.tokenizer.current_token() == '(': # foo(expressionList)
-			# method cannot be called directly unless it resides in its 
-			# own class, so pass the current object as first argument
-			self.vm_writer.write_push('pointer', 0)
-			callee = f'{self.symbol_table.st_class_name()}.{callee}'
-			this_increment = 1
-		else: # foo.bar(expressionList)
-			self.eat('.')
-			other_callee = self.tokenizer.current_token()
-			# if object declared, pass the object as first argument
-			if self.is_class_obj(callee):
-				callee_segment, callee_index = self.segment(callee)
-				self.vm_writer.write_push(callee_segment, callee_index)
-				# obtain the class of the object for the call
-				class_type = self.symbol_table.type_of(callee)
-				callee = f'{class_type}.{other_callee}'
-				this_increment = 1
-			else:
-				# OS class or function call
-				callee += f'.{other_callee}'
-			self.eat(other_callee)
-
-		self.eat('(')
-		n_args = self.compile_expressionList() + this_increment			
-		self.vm_writer.write_call(callee, n_args)
+		self.write_expression(self.compile_subroutineCall(callee))
+		# the returned value is discarded
 		self.vm_writer.write_pop('temp', 0)
-		self.eat(')')
 		self.eat(';')
 
 	def compile_return(self):
 		self.eat('return')
-		term = self.tokenizer.current_token()
-		if term != ';':
-			self.compile_expression()
-			if term == 'this':
-				term_segment, term_index = self.segment(term)
-				self.vm_writer.write_push(term_segment, term_index)
-			self.vm_writer.write_return('return')
+		if self.tokenizer.current_token() != ';':
+			self.write_expression(self.compile_expression())
 		else:
 			self.vm_writer.write_push('constant', 0)
-			self.vm_writer.write_return('return')
+		self.vm_writer.write_return()
 		self.eat(';')
 
 	def compile_statements(self):
-		while self.tokenizer.current_token() in ['let', 'if', 'while', 'do', 'return']:
-			statement_method = f'compile_{self.tokenizer.current_token()}'
+		statement_method = STATEMENT_METHODS.get(self.tokenizer.current_token())
+		while statement_method:
 			_compile_method = getattr(self, statement_method)
 			_compile_method()
+			statement_method = STATEMENT_METHODS.get(self.tokenizer.current_token())
 
 	def compile_subroutineBody(self):
 		self.compile_varDec()
@@ -375,26 +583,23 @@ class CompilationEngine:
 			self.symbol_table.start_subroutine()
 			
 			# reset the if & while statements label counter
-			CompilationEngine.IF_COUNTER = 0
-			CompilationEngine.WHILE_COUNTER = 0
+			self.if_counter = 0
+			self.while_counter = 0
+			self.condition_counter = 0
 			
 			subroutine = self.tokenizer.current_token() # 'constructor', 'function', 'method'
 			# for every new method subroutine 'this' is passed as first arg
 			if subroutine == 'method':
-				self.symbol_table.subroutine_level['this'] = {
-					'type': self.symbol_table.class_name, 'kind': 'argument', 'index': 0 
-				}
+				self.symbol_table.define_identifier('this', self.symbol_table.class_name, 'argument')
 			
 			self.eat(subroutine)
 			subroutine_type = self.tokenizer.current_token() # type
-			# this number should reflect the named var declarations
-			# in each subroutine.. and I do not know how to get this number
-			# before even entring the compile_subroutineBody() routine!
-			n_locals = 0
 			self.eat(subroutine_type)
 			subroutine_name = self.tokenizer.current_token()
 			name = f'{self.symbol_table.st_class_name()}.{subroutine_name}' # name
-			self.vm_writer.write_function(name, n_locals)
+			# the number of locals is not known before compile_varDec has run,
+			# so the function line is reserved now and backpatched after the body
+			function_position = self.vm_writer.write_function(name, 0)
 			self.eat(subroutine_name)
 			self.eat('(')
 			self.compile_parameterList() # subroutine args
@@ -412,6 +617,9 @@ class CompilationEngine:
 			self.eat(')')
 			self.eat('{')
 			self.compile_subroutineBody() # subroutine body
+			self.vm_writer.set_function_locals(
+				function_position, self.symbol_table.var_count('local')
+			)
 			self.eat('}')
 
 	def compile_classVarDec(self):
@@ -449,10 +657,22 @@ class CompilationEngine:
 		# create a new symbol table and vm writer
 		self.symbol_table = SymbolTable(class_name)
 		self.vm_writer = VMWriter()
+		self.string_pool = {}
+		if self.profiler is not None:
+			self.profiler.instrument_symbol_table(self.symbol_table)
 		
 		self.eat(class_name)
 		self.eat('{')
 		while self.tokenizer.current_token() in ['static', 'field']:
 			self.compile_classVarDec()
 		self.compile_subroutineDec()
-		self.eat('}')
\ No newline at end of file
+		self.eat('}')
+		self.write_string_pool()
+
+		if self.optimize:
+			self.optimize_vm()
+
+	def optimize_vm(self):
+		instructions = peephole(optimize_cfg(self.vm_writer.instructions()))
+		self.removed_instructions = len(self.vm_writer) - len(instructions)
+		self.vm_writer.set_instructions(instructions)
\ No newline at end of file
@@ -0,0 +1,532 @@
+import collections
+
+
+
+"""
+
+Expression trees built by the CompilationEngine before any VM code is written.
+
+An expression is compiled in two steps, the engine parses it into a tree
+of the nodes below, then write_tree() walks the tree in postfix order
+emitting the VM instructions. In between, fold() can rewrite the tree to
+compute constant subexpressions at compile time.
+
+The condition of an if or a while is written by write_branch(), which
+jumps on the comparison itself instead of building the boolean value and
+testing it, ex: jumping when x < 10 is false,
+
+push local 0       >>  push local 0
+push constant 10       push constant 9
+lt                     gt
+not                    if-goto IF_FALSE0
+if-goto IF_FALSE0
+
+and x = y is false when x - y is not 0, a sub replaces the eq and the not.
+
+Const  - integer constant                     5, null, false
+Var    - value read from a VM segment          local 0, this 2, pointer 0
+Unary  - unary operator on a node              -x, ~x
+Binary - binary operator on two nodes          x + y
+Index  - array element                         a[i]
+Call   - subroutine call with its argument nodes
+String - string constant
+Doubled - node multiplied by a power of two without Math.multiply
+
+"""
+
+Const = collections.namedtuple('Const', 'value')
+Var = collections.namedtuple('Var', 'segment index')
+Unary = collections.namedtuple('Unary', 'op operand')
+Binary = collections.namedtuple('Binary', 'op left right')
+Index = collections.namedtuple('Index', 'base index')
+Call = collections.namedtuple('Call', 'name args')
+String = collections.namedtuple('String', 'text')
+Doubled = collections.namedtuple('Doubled', 'operand times')
+
+# the Hack platform works with 16-bit two's complement words
+WORD_MIN = -32768
+WORD_MAX = 32767
+
+# segments a call cannot change for its caller
+STABLE_SEGMENTS = frozenset(['local', 'argument', 'pointer'])
+
+# estimated cost of a Math.multiply call in VM instructions, its loop
+# runs once per bit, far longer than the call instruction itself
+MULTIPLY_COST = 20
+
+# comparison to the one it becomes when swapping its operands
+MIRRORED = {'<': '>', '>': '<', '=': '='}
+
+# a power of two multiplier up to this exponent becomes an add chain of
+# the operand, bigger ones double the operand through TEMP_SLOT
+MAX_ADD_CHAIN = 2
+TEMP_SLOT = 1
+
+def wrap(value):
+	"""truncates an integer to a 16-bit word, as the Hack ALU does"""
+
+	return ((value - WORD_MIN) & 0xFFFF) + WORD_MIN
+
+def divide(x, y):
+	"""integer division rounding towards zero, as Math.divide does"""
+
+	quotient = abs(x) // abs(y)
+	return -quotient if (x < 0) != (y < 0) else quotient
+
+def is_pure(node):
+	"""
+	a pure node can be evaluated any number of times, or not at all,
+	without changing the program state.
+
+	calls, array reads (they set pointer 1) and divisions (Math.divide can
+	fail on zero) are not pure.
+	"""
+
+	if isinstance(node, (Const, Var)):
+		return True
+	elif isinstance(node, Unary):
+		return is_pure(node.operand)
+	elif isinstance(node, Binary):
+		return node.op != '/' and is_pure(node.left) and is_pure(node.right)
+	return False
+
+def power_of_two(value):
+	"""returns k when value == 2 ** k with k >= 1, else None"""
+
+	if value >= 2 and value & (value - 1) == 0:
+		return value.bit_length() - 1
+	return None
+
+def fold_binary(op, x, y):
+	"""computes op on two constants, or returns None when it cannot be folded"""
+
+	if op == '+':
+		return wrap(x + y)
+	elif op == '-':
+		return wrap(x - y)
+	elif op == '*':
+		return wrap(x * y)
+	elif op == '/':
+		return wrap(divide(x, y)) if y != 0 else None
+	elif op == '&':
+		return wrap(x & y)
+	elif op == '|':
+		return wrap(x | y)
+	elif op == '<':
+		return -1 if x < y else 0
+	elif op == '>':
+		return -1 if x > y else 0
+	elif op == '=':
+		return -1 if x == y else 0
+	return None
+
+def simplify_binary(op, left, right):
+	"""applies algebraic identities when one side of op is a constant"""
+
+	left_value = left.value if isinstance(left, Const) else None
+	right_value = right.value if isinstance(right, Const) else None
+
+	if op == '+':
+		if right_value == 0:
+			return left
+		if left_value == 0:
+			return right
+	elif op == '-':
+		if right_value == 0:
+			return left
+		if left_value == 0:
+			return Unary('-', right)
+	elif op == '*':
+		if right_value == 1:
+			return left
+		if left_value == 1:
+			return right
+		if right_value == 0 and is_pure(left) or left_value == 0 and is_pure(right):
+			return Const(0)
+		# keep the non-constant side as the operand, x * 2^k becomes additions
+		if right_value is not None and power_of_two(right_value):
+			return double(left, power_of_two(right_value))
+		if left_value is not None and power_of_two(left_value):
+			return double(right, power_of_two(left_value))
+	elif op == '/':
+		if right_value == 1:
+			return left
+	elif op == '&':
+		if right_value == -1:
+			return left
+		if left_value == -1:
+			return right
+		if right_value == 0 and is_pure(left) or left_value == 0 and is_pure(right):
+			return Const(0)
+	elif op == '|':
+		if right_value == 0:
+			return left
+		if left_value == 0:
+			return right
+		if right_value == -1 and is_pure(left) or left_value == -1 and is_pure(right):
+			return Const(-1)
+
+	return Binary(op, left, right)
+
+def double(node, times):
+	"""returns node * 2 ** times using additions only"""
+
+	if times <= MAX_ADD_CHAIN and isinstance(node, Var):
+		for _ in range(times):
+			node = Binary('+', node, node)
+		return node
+	return Doubled(node, times)
+
+def fold(node):
+	"""returns an equivalent tree with constants folded and identities simplified"""
+
+	if isinstance(node, Unary):
+		operand = fold(node.operand)
+		if isinstance(operand, Const):
+			value = -operand.value if node.op == '-' else ~operand.value
+			return Const(wrap(value))
+		if isinstance(operand, Unary) and operand.op == node.op:
+			# double negation
+			return operand.operand
+		return Unary(node.op, operand)
+	elif isinstance(node, Binary):
+		left = fold(node.left)
+		right = fold(node.right)
+		if isinstance(left, Const) and isinstance(right, Const):
+			value = fold_binary(node.op, left.value, right.value)
+			if value is not None:
+				return Const(value)
+		return simplify_binary(node.op, left, right)
+	elif isinstance(node, Index):
+		return Index(fold(node.base), fold(node.index))
+	elif isinstance(node, Call):
+		return Call(node.name, tuple(fold(arg) for arg in node.args))
+	return node
+
+def write_tree(node, vm_writer, that=None):
+	"""
+	emits the VM code of node, leaving its value on top of the stack.
+	Given a ThatPointer, array elements are reached through it (see
+	write_pointer), otherwise every a[i] is computed in full.
+	"""
+
+	if isinstance(node, Const):
+		write_constant(node.value, vm_writer)
+	elif isinstance(node, Var):
+		vm_writer.write_push(node.segment, node.index)
+	elif isinstance(node, Unary):
+		write_tree(node.operand, vm_writer, that)
+		vm_writer.write_arithmatic('~' if node.op == '~' else 'neg')
+	elif isinstance(node, Binary):
+		write_tree(node.left, vm_writer, that)
+		write_tree(node.right, vm_writer, that)
+		vm_writer.write_arithmatic(node.op)
+	elif isinstance(node, Index) and that is not None:
+		offset = write_pointer(node, vm_writer, that)
+		vm_writer.write_push('that', offset)
+	elif isinstance(node, Index):
+		write_tree(node.base, vm_writer)
+		write_tree(node.index, vm_writer)
+		vm_writer.write_arithmatic('+')
+		vm_writer.write_pop('pointer', 1)
+		vm_writer.write_push('that', 0)
+	elif isinstance(node, Call):
+		for arg in node.args:
+			write_tree(arg, vm_writer, that)
+		vm_writer.write_call(node.name, len(node.args))
+		if that is not None:
+			that.called()
+	elif isinstance(node, String):
+		vm_writer.write_push('constant', len(node.text))
+		vm_writer.write_call('String.new', 1)
+		for ch in node.text:
+			# ord(ch) gets the ASCII code for each character
+			vm_writer.write_push('constant', ord(ch))
+			vm_writer.write_call('String.appendChar', 2)
+		if that is not None:
+			that.called()
+	elif isinstance(node, Doubled):
+		write_tree(node.operand, vm_writer, that)
+		for _ in range(node.times):
+			vm_writer.write_pop('temp', TEMP_SLOT)
+			vm_writer.write_push('temp', TEMP_SLOT)
+			vm_writer.write_push('temp', TEMP_SLOT)
+			vm_writer.write_arithmatic('+')
+
+def write_constant(value, vm_writer):
+	"""
+	pushes an integer, the constant segment only holds 0..32767 so a
+	negative value is pushed as its absolute value and negated
+	"""
+
+	if value >= 0:
+		vm_writer.write_push('constant', value)
+	elif value == -1:
+		vm_writer.write_push('constant', 0)
+		vm_writer.write_arithmatic('~')
+	elif value == WORD_MIN:
+		vm_writer.write_push('constant', WORD_MAX)
+		vm_writer.write_arithmatic('neg')
+		vm_writer.write_push('constant', 1)
+		vm_writer.write_arithmatic('-')
+	else:
+		vm_writer.write_push('constant', -value)
+		vm_writer.write_arithmatic('neg')
+
+def subtrees(node):
+	"""yields node and every node below it"""
+
+	yield node
+	if isinstance(node, (Unary, Doubled)):
+		children = (node.operand,)
+	elif isinstance(node, Binary):
+		children = (node.left, node.right)
+	elif isinstance(node, Index):
+		children = (node.base, node.index)
+	elif isinstance(node, Call):
+		children = node.args
+	else:
+		children = ()
+	for child in children:
+		yield from subtrees(child)
+
+def is_stable(node):
+	"""a stable node reads no variable a call could change, calls restore pointer 0 and 1"""
+
+	return all(
+		sub.segment in STABLE_SEGMENTS
+		for sub in subtrees(node) if isinstance(sub, Var)
+	)
+
+def is_stable_key(key):
+	return all(is_stable(part) for part in key if part is not None)
+
+def split_offset(index):
+	"""splits an index into its variable part, None if constant, and a constant offset >= 0"""
+
+	if isinstance(index, Const) and index.value >= 0:
+		return None, index.value
+	if isinstance(index, Binary) and index.op == '+':
+		if isinstance(index.right, Const) and index.right.value >= 0:
+			return index.left, index.right.value
+		if isinstance(index.left, Const) and index.left.value >= 0:
+			return index.right, index.left.value
+	return index, 0
+
+def element_address(node):
+	"""
+	returns the key, the variable part of the index and the offset of the
+	array element node. The key, (base, variable part), names the address
+	pointer 1 is set to, it is None when the address has to be computed
+	every time.
+	"""
+
+	variable, offset = split_offset(node.index)
+	if is_pure(node.base) and (variable is None or is_pure(variable)):
+		return (node.base, variable), variable, offset
+	return None, variable, offset
+
+class ThatPointer:
+	"""
+	The address pointer 1 holds while the code of one statement is written,
+	as a key of element_address() or None when it is not known.
+	"""
+
+	def __init__(self):
+		self.key = None
+
+	def called(self):
+		# pointer 1 is restored by the return, but a field or a static of
+		# the key may have changed
+		if self.key is not None and not is_stable_key(self.key):
+			self.key = None
+
+def write_pointer(node, vm_writer, that):
+	"""
+	sets pointer 1 for the array element node and returns the offset of the
+	element in the that segment, ex: a[i + 2] is that 2 with pointer 1 at a + i.
+	pointer 1 is left alone when it already holds the address.
+	"""
+
+	key, variable, offset = element_address(node)
+	if key is None or key != that.key:
+		write_tree(node.base, vm_writer, that)
+		if variable is not None:
+			write_tree(variable, vm_writer, that)
+			vm_writer.write_arithmatic('+')
+		vm_writer.write_pop('pointer', 1)
+		that.key = key
+	return offset
+
+def keeps_pointer(node, key):
+	"""
+	True if the code of node leaves pointer 1 at the address of key, every
+	array element node reads is reached through it and no call can move it
+	"""
+
+	elements = [sub for sub in subtrees(node) if isinstance(sub, Index)]
+	if not elements:
+		return True
+	if key is None or any(element_address(element)[0] != key for element in elements):
+		return False
+	return not has_calls(node) or is_stable_key(key)
+
+def has_calls(node):
+	return any(isinstance(sub, (Call, String)) for sub in subtrees(node))
+
+def tree_cost(node):
+	"""estimated cost of the code of a pure node, in VM instructions"""
+
+	if isinstance(node, Const):
+		return 1 if node.value >= 0 else 2
+	elif isinstance(node, Unary):
+		return 1 + tree_cost(node.operand)
+	elif isinstance(node, Binary):
+		operator_cost = MULTIPLY_COST if node.op == '*' else 1
+		return tree_cost(node.left) + tree_cost(node.right) + operator_cost
+	return 1
+
+def substitute(node, old, new):
+	"""returns node with every occurrence of the subtree old replaced by new"""
+
+	if node == old:
+		return new
+	elif isinstance(node, Unary):
+		return Unary(node.op, substitute(node.operand, old, new))
+	elif isinstance(node, Binary):
+		return Binary(node.op, substitute(node.left, old, new), substitute(node.right, old, new))
+	elif isinstance(node, Index):
+		return Index(substitute(node.base, old, new), substitute(node.index, old, new))
+	elif isinstance(node, Call):
+		return Call(node.name, tuple(substitute(arg, old, new) for arg in node.args))
+	elif isinstance(node, Doubled):
+		return Doubled(substitute(node.operand, old, new), node.times)
+	return node
+
+def common_subtrees(trees, new_slot):
+	"""
+	finds the pure subtrees the trees of one statement compute more than
+	once and that are cheaper kept in a variable. Computing a subtree of
+	cost c used n times once costs c + 1 + n instructions instead of n * c.
+
+	returns the list of (slot, subtree) to compute into their slot before
+	the statement, in order, and the trees reading the slots instead.
+	new_slot(number) returns the Var of the number-th slot.
+
+	A call in the statement can change fields and statics, subtrees
+	reading them are then left alone, only the arguments of a call at
+	the root of a tree are computed before it.
+	"""
+
+	trees = list(trees)
+	calls = any(
+		has_calls(arg)
+		for tree in trees
+		for arg in (tree.args if isinstance(tree, Call) else (tree,))
+	)
+	seen = dict.fromkeys(
+		sub for tree in trees for sub in subtrees(tree)
+		if isinstance(sub, (Unary, Binary)) and is_pure(sub) and (not calls or is_stable(sub))
+	)
+	# bigger subtrees first, the subtrees inside them are then counted again
+	candidates = sorted(seen, key=tree_cost, reverse=True)
+
+	hoisted = []
+	for node in candidates:
+		uses = sum(
+			sub == node
+			for tree in trees + [subtree for _, subtree in hoisted]
+			for sub in subtrees(tree)
+		)
+		if (uses - 1) * (tree_cost(node) - 1) <= 2:
+			continue
+		slot = new_slot(len(hoisted))
+		trees = [substitute(tree, node, slot) for tree in trees]
+		# a smaller subtree is computed before the bigger ones using it
+		hoisted = [(slot, node)] + [(other, substitute(subtree, node, slot)) for other, subtree in hoisted]
+	return hoisted, trees
+
+def is_boolean(node):
+	"""a boolean node is always true (-1) or false (0)"""
+
+	if isinstance(node, Const):
+		return node.value in (0, -1)
+	elif isinstance(node, Unary):
+		return node.op == '~' and is_boolean(node.operand)
+	elif isinstance(node, Binary):
+		if node.op in MIRRORED:
+			return True
+		return node.op in ('&', '|') and is_boolean(node.left) and is_boolean(node.right)
+	return False
+
+def negated_comparison(node):
+	"""
+	returns the comparison true exactly when node is false, or None,
+	not (x < c) is x > c - 1 as long as c - 1 is still a word
+	"""
+
+	if isinstance(node.left, Const) and not isinstance(node.right, Const):
+		node = Binary(MIRRORED[node.op], node.right, node.left)
+	if not isinstance(node.right, Const):
+		return None
+	value = node.right.value
+	if node.op == '<' and value > WORD_MIN:
+		return Binary('>', node.left, Const(value - 1))
+	elif node.op == '>' and value < WORD_MAX:
+		return Binary('<', node.left, Const(value + 1))
+	return None
+
+def write_branch(node, label, jump_if, vm_writer, new_label, that=None):
+	"""
+	emits the code jumping to label when the truth of node is jump_if and
+	falling through otherwise. As for if-goto a value is true when it is
+	not 0, jumping when a boolean is false is testing not x.
+
+	& and | of boolean nodes are tested one side at a time, the right
+	side is then skipped when the left one decides, so it must be pure.
+	new_label() returns a fresh label for the skip.
+	"""
+
+	if isinstance(node, Const):
+		if (node.value != 0) == jump_if:
+			vm_writer.write_goto(label)
+		return
+	if isinstance(node, Unary) and node.op == '~' and is_boolean(node.operand):
+		write_branch(node.operand, label, not jump_if, vm_writer, new_label, that)
+		return
+	if isinstance(node, Binary):
+		if node.op in ('&', '|') and is_boolean(node) and is_pure(node.right):
+			if (node.op == '&') != jump_if:
+				# the left side alone can take the jump
+				write_branch(node.left, label, jump_if, vm_writer, new_label, that)
+				write_branch(node.right, label, jump_if, vm_writer, new_label, that)
+			else:
+				skip = new_label()
+				write_branch(node.left, skip, not jump_if, vm_writer, new_label, that)
+				write_branch(node.right, label, jump_if, vm_writer, new_label, that)
+				vm_writer.write_label(skip)
+			return
+		if node.op == '=' and not jump_if:
+			# x = y is false exactly when x - y is not 0, x = 0 when x is not 0
+			if node.right == Const(0):
+				write_tree(node.left, vm_writer, that)
+			elif node.left == Const(0):
+				write_tree(node.right, vm_writer, that)
+			else:
+				write_tree(Binary('-', node.left, node.right), vm_writer, that)
+			vm_writer.write_if(label)
+			return
+		if node.op in ('<', '>') and not jump_if:
+			negated = negated_comparison(node)
+			if negated is not None:
+				write_branch(negated, label, True, vm_writer, new_label, that)
+				return
+
+	write_tree(node, vm_writer, that)
+	if not jump_if and is_boolean(node):
+		vm_writer.write_arithmatic('~')
+	elif not jump_if:
+		# not x is only false for x = -1, any other value is tested against 0
+		vm_writer.write_push('constant', 0)
+		vm_writer.write_arithmatic('=')
+	vm_writer.write_if(label)
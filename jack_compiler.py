@@ -1,12 +1,24 @@
 import sys, os
+import time
+import argparse
+import functools
+import collections
+import vm_writer as vm
+from concurrent.futures import ProcessPoolExecutor
 from tokenizer import JackTokenizer
 from compilation_engine import CompilationEngine
+from build_cache import BuildCache, atomic_write, cache_key, file_cache_key
+from linker import link_vm_texts
+from asm_writer import AsmWriter
+from profiler import Profiler
+from cfg import control_flow_graphs
+from signature_index import SignatureIndex, scan_files
 
 
 
 """
 
-Jack compiler accepts either a path to a Jack program file example.jack 
+Jack compiler accepts either a path to a Jack program file example.jack
 or a directory containing as many as Jack files.
 
 Ex terminal command to run the compiler:
@@ -15,28 +27,503 @@ Ex terminal command to run the compiler:
 where Square is the path to the jack files relative
 to the root of script jack_compiler.py
 
-the output is a .vm file with path path\\to\\file_compiled.vm 
+the output is a .vm file with path path\\to\\file_compiled.vm,
+-o - writes the code to stdout instead, to pipe it into a VM translator:
+"python jack_compiler.py Square -o - | ..."
+
+a directory can be compiled in parallel, one worker process per file:
+"python jack_compiler.py Square --jobs 4"
+
+large sources can be tokenized lazily while they are compiled:
+"python jack_compiler.py Square --stream"
+
+the generated code is optimized with:
+"python jack_compiler.py Square -O1"
+
+the compiler can stay resident and recompile a class as soon as its file changes:
+"python jack_compiler.py Square --watch"
+
+a whole program can be linked into a single Square/Square.vm holding only
+the functions reachable from Main.main:
+"python jack_compiler.py Square --link"
+
+or into Hack assembly, Square/Square.asm, with the OS .vm files linked in:
+"python jack_compiler.py Square --asm --lib path/to/os"
+
+the control flow graph of every function is printed, after the -O1
+passes when optimizing, with:
+"python jack_compiler.py Square --dump-cfg -O1"
+
+the time of every phase and engine method is printed, and written as a
+Chrome trace, with:
+"python jack_compiler.py Square --profile trace.json"
+
+compiled classes are cached in Square/.jack_cache, a class whose source,
+options and compiler did not change is not compiled again. the cache is
+bypassed with --force or turned off with --no-cache.
+
+the compiler can also be used in-process, compile_source(text) returns
+the VM code of a Jack class as a string.
 
 """
 
-def parse_file(file):
-	tokenizer = JackTokenizer(file)
-	c_engine = CompilationEngine(tokenizer)
-	with open(file.split('.')[0] + '_compiled.vm', 'w') as f:
-		for line in c_engine.vm_writer.get_vm_text():
-			f.write(line)
+def compile_source(text, **options):
+	"""
+	compiles the Jack source text of a single class and returns its VM code.
+
+	options are passed on to the CompilationEngine, ex: optimize=1.
+
+	every call builds its own tokenizer, engine and writer, so it is safe
+	to call it concurrently from several threads.
+	"""
+
+	tokenizer = JackTokenizer(source=text)
+	c_engine = CompilationEngine(tokenizer, **options)
+	return c_engine.vm_writer.vm_text()
+
+# outcome of the compilation of a file, error is None on success, removed
+# the number of instructions the peephole optimizer removed, cached is True
+# when the code came from the build cache and vm_text holds the code when
+# it goes to stdout instead of a file
+Result = collections.namedtuple('Result', 'file error removed cached vm_text')
+
+def output_path(file, output=None):
+	"""
+	returns where the code of file is written, output is either None for a
+	file next to the source, a path ending with .vm or a directory
+	"""
+
+	if output is None:
+		return os.path.splitext(file)[0] + '_compiled.vm'
+	elif output.endswith('.vm'):
+		return output
+	class_file = os.path.splitext(os.path.basename(file))[0] + '_compiled.vm'
+	return os.path.join(output, class_file)
+
+def write_output(path, vm_text, atomic=False):
+	"""
+	writes vm_text to path in a single write, with atomic it goes to a
+	temporary file first which is then renamed over path, so path never
+	holds partial output
+	"""
+
+	directory = os.path.dirname(path)
+	if directory:
+		os.makedirs(directory, exist_ok=True)
+	if atomic:
+		atomic_write(path, vm_text)
+		return
+	with open(path, 'w') as f:
+		f.write(vm_text)
+
+def is_up_to_date(path, vm_text):
+	try:
+		with open(path) as f:
+			return f.read() == vm_text
+	except FileNotFoundError:
+		return False
+
+def compile_cached(file, force=False, streaming=False, **options):
+	"""
+	returns (vm_text, removed, cached) for file, which is only compiled when
+	the build cache does not hold its code already.
+
+	with streaming the source is hashed and then tokenized in chunks, never
+	held in memory whole. the file is hashed again after the compilation and
+	the code is not cached if it changed in between.
+	"""
+
+	cache = BuildCache(os.path.dirname(file))
+	if streaming:
+		key = file_cache_key(file, options)
+	else:
+		with open(file) as f:
+			source = f.read()
+		key = cache_key(source, options)
+	vm_text = None if force else cache.get(key)
+	if vm_text is not None:
+		return vm_text, 0, True
+
+	if streaming:
+		tokenizer = JackTokenizer(file, streaming=True)
+	else:
+		tokenizer = JackTokenizer(source=source)
+	c_engine = CompilationEngine(tokenizer, **options)
+	vm_text = c_engine.vm_writer.vm_text()
+	if not streaming or file_cache_key(file, options) == key:
+		cache.put(key, vm_text)
+	return vm_text, c_engine.removed_instructions, False
+
+def compile_file(file, use_cache=False, force=False, output=None, atomic=False, **options):
+	"""
+	compiles a single file and returns its Result, with use_cache the build
+	cache is looked up first unless force is set. output and atomic are
+	described in output_path and write_output, an output of - keeps the code
+	in the Result for the caller to print.
+
+	errors are caught here so that a failing class does not stop the rest
+	of the batch, whether it runs serially or inside a worker process.
+	"""
+
+	try:
+		if use_cache:
+			vm_text, removed, cached = compile_cached(file, force, **options)
+		else:
+			streaming = options.pop('streaming', False)
+			c_engine = CompilationEngine(JackTokenizer(file, streaming=streaming), **options)
+			vm_text, removed, cached = c_engine.vm_writer.vm_text(), c_engine.removed_instructions, False
+
+		if output == '-':
+			return Result(file, None, removed, cached, vm_text)
+		path = output_path(file, output)
+		# a cached class is only written when its output changed
+		if not cached or not is_up_to_date(path, vm_text):
+			write_output(path, vm_text, atomic)
+		return Result(file, None, removed, cached, None)
+	except Exception as e:
+		return Result(file, f'{type(e).__name__}: {e}', 0, False, None)
+
+def profile_file(file, profiler, streaming=False, output=None, atomic=False, **options):
+	"""
+	compiles a single file like compile_file, without the build cache,
+	recording the tokenize, compile and output phases in profiler.
+	with streaming most of the tokenizing happens in the compile phase.
+	"""
+
+	try:
+		with profiler.phase('tokenize', file):
+			tokenizer = JackTokenizer(file, streaming=streaming)
+			profiler.instrument_tokenizer(tokenizer)
+		with profiler.phase('compile', file):
+			c_engine = CompilationEngine(tokenizer, profiler=profiler, **options)
+		with profiler.phase('output', file):
+			vm_text = c_engine.vm_writer.vm_text()
+			if output != '-':
+				write_output(output_path(file, output), vm_text, atomic)
+		profiler.record_file(file, tokenizer, c_engine)
+		return Result(file, None, c_engine.removed_instructions, False, vm_text if output == '-' else None)
+	except Exception as e:
+		return Result(file, f'{type(e).__name__}: {e}', 0, False, None)
+
+def dump_cfg_file(file, streaming=False, **options):
+	"""
+	compiles a single file without writing it, the Result holds the text of
+	the control flow graph of every function in place of the code
+	"""
+
+	try:
+		c_engine = CompilationEngine(JackTokenizer(file, streaming=streaming), **options)
+		graphs = control_flow_graphs(c_engine.vm_writer.instructions())
+		dump = ''.join(graph.dump() for graph in graphs)
+		return Result(file, None, c_engine.removed_instructions, False, dump)
+	except Exception as e:
+		return Result(file, f'{type(e).__name__}: {e}', 0, False, None)
+
+def jack_files(path):
+	if os.path.isfile(path) and path.endswith('.jack'):
+		return [path]
+	elif os.path.isdir(path):
+		return [
+			os.path.join(path, file_name)
+			for file_name in sorted(os.listdir(path))
+			if file_name.endswith('.jack')
+		]
+	else:
+		raise IOError('Wrong path provided')
+
+def program_signatures(path, use_cache=True):
+	"""
+	returns the signature index of every Jack file of the directory of path,
+	kept in the build cache directory unless use_cache is False
+	"""
+
+	directory = path if os.path.isdir(path) else os.path.dirname(path) or '.'
+	files = jack_files(directory)
+	if use_cache:
+		return SignatureIndex(directory).signatures(files)
+	return scan_files(files)
+
+def compile_files(files, jobs=1, **options):
+	"""
+	compiles every file and yields their Result in the order of files as
+	soon as each is available, options are passed on to compile_file.
+
+	with jobs > 1 each file is compiled in a separate worker process, every
+	worker writes its own _compiled.vm so the output is the same as the serial run.
+	"""
+
+	compile_one = functools.partial(compile_file, **options)
+	if jobs > 1 and len(files) > 1:
+		with ProcessPoolExecutor(max_workers=jobs) as pool:
+			yield from pool.map(compile_one, files)
+	else:
+		for file in files:
+			yield compile_one(file)
+
+def linked_output_path(path, output=None, extension='.vm'):
+	"""
+	returns where the linked program of path is written, by default a file
+	named after the program directory, ex: Square/Square.vm
+	"""
+
+	if output is not None and output.endswith(extension):
+		return output
+	directory = path if os.path.isdir(path) else os.path.dirname(path)
+	name = os.path.basename(os.path.normpath(os.path.abspath(directory))) + extension
+	return os.path.join(output if output is not None else directory, name)
+
+def library_vm_texts(directory):
+	"""returns the path and VM text of every .vm file of a library directory, ex: the OS"""
+
+	vm_texts = []
+	for file_name in sorted(os.listdir(directory)):
+		if file_name.endswith('.vm'):
+			path = os.path.join(directory, file_name)
+			with open(path) as f:
+				vm_texts.append((path, f.read()))
+	return vm_texts
+
+def link_program(path, files, jobs=1, output=None, atomic=False, asm=False, libraries=(), **options):
+	"""
+	compiles every file in memory and links them, with the .vm files of the
+	libraries directories, into a single file without the unreachable
+	functions, returns True on success.
+
+	the file holds VM code, or Hack assembly with asm, which needs every
+	called function, the OS included, to be part of the program.
+	"""
+
+	succeeded = True
+	vm_texts = []
+	sources = []
+	for result in compile_files(files, jobs, output='-', **options):
+		vm_texts.append(result.vm_text)
+		sources.append(result.file)
+		# the code of each class is only part of the program, it is not printed
+		succeeded = report(result._replace(vm_text=None), options.get('optimize')) and succeeded
+	if not succeeded:
+		return False
+
+	try:
+		for directory in libraries:
+			for library_file, vm_text in library_vm_texts(directory):
+				sources.append(library_file)
+				vm_texts.append(vm_text)
+		result, code = link_vm_texts(vm_texts, sources=sources)
+		if asm:
+			if result.external:
+				raise ValueError(
+					f'functions called but not linked: {", ".join(result.external)}, '
+					'pass the directory of the OS .vm files with --lib'
+				)
+			defined = set(
+				instruction.arg1 for instruction in result.instructions
+				if instruction.opcode == vm.FUNCTION
+			)
+			entry = 'Sys.init' if 'Sys.init' in defined else 'Main.main'
+			code = AsmWriter(result.instructions, entry).asm_text()
+	except (ValueError, OSError) as e:
+		print(f'{path}: {e}', file=sys.stderr)
+		return False
+	if output == '-':
+		sys.stdout.write(code)
+	else:
+		extension = '.asm' if asm else '.vm'
+		write_output(linked_output_path(path, output, extension), code, atomic)
+	print(
+		f'{path}: linked {len(result.instructions)} instructions, removed '
+		f'{len(result.removed)} unreachable functions ({result.removed_instructions} instructions)',
+		file=sys.stderr
+	)
+	for name in result.removed:
+		print(f'  {name}', file=sys.stderr)
+	return True
+
+# seconds between two scans of the watched sources
+WATCH_INTERVAL = 0.05
+
+def report(result, optimize=0):
+	"""
+	prints the outcome of a compilation on stderr, and its code on stdout
+	when it was compiled with an output of -. returns False on error.
+	"""
+
+	if result.vm_text is not None:
+		sys.stdout.write(result.vm_text)
+		sys.stdout.flush()
+
+	if result.error:
+		print(f'{result.file}: {result.error}', file=sys.stderr)
+		return False
+	elif result.cached:
+		print(f'{result.file}: reused from build cache', file=sys.stderr)
+	elif optimize:
+		print(f'{result.file}: optimizer removed {result.removed} instructions', file=sys.stderr)
+	return True
+
+def source_stamps(path):
+	"""returns the (modification time, size) of every Jack file under path"""
+
+	stamps = {}
+	for file in jack_files(path):
+		try:
+			stat = os.stat(file)
+		except FileNotFoundError:
+			continue
+		stamps[file] = (stat.st_mtime_ns, stat.st_size)
+	return stamps
+
+def watch(path, interval=WATCH_INTERVAL, **options):
+	"""
+	compiles every Jack file under path, then keeps polling the files and
+	recompiles each one as soon as it changes, until interrupted.
+
+	the compiler stays loaded in this process, so a recompilation only costs
+	the compilation of the class itself. options are passed on to compile_file,
+	with the signature index of the program, every class is recompiled when
+	a declaration changes.
+	"""
+
+	stamps = {}
+	try:
+		while True:
+			current = source_stamps(path)
+			if current != stamps:
+				signatures = program_signatures(path, options.get('use_cache', True))
+				# a changed declaration can change the code of every caller
+				if signatures != options.get('signatures'):
+					options['signatures'] = signatures
+					stamps = {}
+			for file, stamp in current.items():
+				if stamps.get(file) == stamp:
+					continue
+				start = time.perf_counter()
+				result = compile_file(file, **options)
+				elapsed = (time.perf_counter() - start) * 1000
+				if report(result, options.get('optimize')):
+					print(f'{file}: compiled in {elapsed:.1f} ms', file=sys.stderr)
+			stamps = current
+			time.sleep(interval)
+	except KeyboardInterrupt:
+		return 0
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description='Compiles Jack programs into VM code.')
+	parser.add_argument('path', help='a .jack file or a directory of .jack files')
+	parser.add_argument(
+		'-j', '--jobs', type=int, default=1,
+		help='number of worker processes used to compile a directory (0 = one per CPU)'
+	)
+	parser.add_argument(
+		'--stream', action='store_true',
+		help='read the sources in chunks and tokenize them on demand'
+	)
+	parser.add_argument(
+		'-O', dest='optimize', type=int, choices=[0, 1], default=0,
+		help='optimization level, -O1 folds constant expressions and runs the peephole optimizer'
+	)
+	parser.add_argument(
+		'--pool-strings', action='store_true',
+		help='build every distinct string constant of a class once and share it, '
+		'pooled strings must not be changed or disposed of'
+	)
+	parser.add_argument(
+		'--force', action='store_true',
+		help='compile every class even when the build cache has it'
+	)
+	parser.add_argument(
+		'--no-cache', dest='use_cache', action='store_false',
+		help='neither read nor write the build cache'
+	)
+	parser.add_argument(
+		'--watch', action='store_true',
+		help='keep running and recompile every class as soon as its file changes'
+	)
+	parser.add_argument(
+		'--link', action='store_true',
+		help='link all the classes into one .vm file without the functions Main.main cannot reach'
+	)
+	parser.add_argument(
+		'--asm', action='store_true',
+		help='link like --link and translate the program into Hack assembly'
+	)
+	parser.add_argument(
+		'--lib', dest='libraries', action='append', default=[],
+		help='a directory of .vm files, ex: the OS, linked into the program with --link or --asm'
+	)
+	parser.add_argument(
+		'--profile', nargs='?', const='jack_profile.json', default=None, metavar='TRACE',
+		help='compile serially without the build cache, print the time of every phase and '
+		'engine method and write a Chrome trace, jack_profile.json by default'
+	)
+	parser.add_argument(
+		'--dump-cfg', action='store_true',
+		help='print the control flow graph of every function instead of writing the code'
+	)
+	parser.add_argument(
+		'-o', '--output', default=None,
+		help='- to write the code to stdout, a directory for the _compiled.vm files '
+		'or, for a single .jack file or with --link, the .vm or .asm file to write'
+	)
+	parser.add_argument(
+		'--atomic', action='store_true',
+		help='write every output to a temporary file renamed over the target'
+	)
+	args = parser.parse_args(argv)
+
+	files = jack_files(args.path)
+	args.link = args.link or args.asm
+	if args.output and args.output.endswith('.vm') and len(files) > 1 and not args.link:
+		parser.error('a .vm output file needs a single .jack file')
+	if args.link and args.watch:
+		parser.error('--link cannot be combined with --watch')
+	if args.profile and (args.link or args.watch):
+		parser.error('--profile cannot be combined with --link or --watch')
+	if args.dump_cfg and (args.link or args.watch or args.profile):
+		parser.error('--dump-cfg cannot be combined with --link, --watch or --profile')
+
+	options = dict(
+		use_cache=args.use_cache, force=args.force, output=args.output,
+		atomic=args.atomic, streaming=args.stream, optimize=args.optimize,
+		pool_strings=args.pool_strings
+	)
+	if args.watch:
+		return watch(args.path, **options)
+
+	# calls are resolved against the declarations of every class of the directory
+	signatures = program_signatures(args.path, args.use_cache)
+	options['signatures'] = signatures
 
-# the jack file path is passed as a command line argument   
-path = sys.argv[1]
+	if args.dump_cfg:
+		options = dict(
+			streaming=args.stream, optimize=args.optimize,
+			pool_strings=args.pool_strings, signatures=signatures
+		)
+		succeeded = [report(dump_cfg_file(file, **options), args.optimize) for file in files]
+		return 0 if all(succeeded) else 1
 
-if os.path.isfile(path) and path.endswith('.jack'):
-	parse_file(path)
-elif os.path.isdir(path):
-	for file_name in os.listdir(path):
-		if file_name.endswith('.jack'):
-			parse_file(os.path.join(path, file_name))
-else:
-	raise IOError('Wrong path provided')
+	if args.profile:
+		profiler = Profiler()
+		options = dict(
+			output=args.output, atomic=args.atomic,
+			streaming=args.stream, optimize=args.optimize,
+			pool_strings=args.pool_strings, signatures=signatures
+		)
+		succeeded = [report(profile_file(file, profiler, **options), args.optimize) for file in files]
+		sys.stderr.write(profiler.summary())
+		profiler.write_chrome_trace(args.profile)
+		print(f'Chrome trace written to {args.profile}', file=sys.stderr)
+		return 0 if all(succeeded) else 1
 
+	jobs = args.jobs if args.jobs > 0 else os.cpu_count()
+	if args.link:
+		linked = link_program(args.path, files, jobs, asm=args.asm, libraries=args.libraries, **options)
+		return 0 if linked else 1
+	results = compile_files(files, jobs, **options)
+	succeeded = [report(result, args.optimize) for result in results]
 
+	return 0 if all(succeeded) else 1
 
+if __name__ == '__main__':
+	# the jack file path is passed as a command line argument
+	sys.exit(main())
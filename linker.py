@@ -0,0 +1,156 @@
+import collections
+import vm_writer as vm
+from vm_writer import format_instruction, parse_vm
+from optimizer import split_functions
+
+
+
+"""
+
+Whole-program linking of the VM code of the classes of a program.
+
+The code of every class is split into its functions and a call graph is
+built from the function and call instructions, starting at Main.main and
+Sys.init when the program defines it. Functions no root can reach are
+dropped, and what is left is written as a single .vm file, ex:
+
+Main.main     calls  Square.new, SquareGame.run
+Square.new    calls  Square.draw, Memory.alloc (OS, not linked)
+Square.dispose          unreachable, dropped
+
+Jack has no function pointers, every call names its target, so the call
+graph is exact. Calls to functions that are not part of the program are
+left to the OS.
+
+A VM translator gives every .vm file its own static segment, named after
+the file. The linked classes share one file, so their statics are
+renumbered into a single segment, every class getting the indexes after
+those of the classes before it, ex:
+
+Main         static 0, 1  >>  static 0, 1
+SquareGame   static 0     >>  static 2
+
+"""
+
+ROOTS = ('Sys.init', 'Main.main')
+
+# static variables of the Hack platform, RAM 16..255
+STATIC_SIZE = 240
+
+# outcome of a link, instructions is the linked code, removed the names
+# of the dropped functions and removed_instructions their total size,
+# external the functions called but not part of the program
+LinkResult = collections.namedtuple('LinkResult', 'instructions removed removed_instructions external')
+
+def function_table(instructions):
+	"""returns a dict of function name to its code, in program order"""
+
+	functions = {}
+	for code in split_functions(instructions):
+		if code[0].opcode != vm.FUNCTION:
+			raise ValueError('VM code found outside of a function')
+		name = code[0].arg1
+		if name in functions:
+			raise ValueError(f'function {name} is defined twice')
+		functions[name] = code
+	return functions
+
+def call_graph(functions):
+	"""returns a dict of function name to the set of function names it calls"""
+
+	return {
+		name: set(
+			instruction.arg1 for instruction in code
+			if instruction.opcode == vm.CALL
+		)
+		for name, code in functions.items()
+	}
+
+def reachable_functions(graph, roots=ROOTS):
+	"""returns the names of the functions reachable from the roots defined in graph"""
+
+	pending = [root for root in roots if root in graph]
+	if not pending:
+		raise ValueError(f'the program defines none of {", ".join(roots)}')
+	reached = set(pending)
+	while pending:
+		for callee in graph[pending.pop()]:
+			# functions missing from the graph belong to the OS
+			if callee in graph and callee not in reached:
+				reached.add(callee)
+				pending.append(callee)
+	return reached
+
+def renumber_statics(instructions):
+	"""returns the instructions with the statics of every class moved into one segment"""
+
+	sizes = {}
+	for code in split_functions(instructions):
+		class_name = code[0].arg1.split('.')[0]
+		size = sizes.setdefault(class_name, 0)
+		for instruction in code:
+			if instruction.arg1 == 'static' and instruction.opcode in (vm.PUSH, vm.POP):
+				size = max(size, instruction.arg2 + 1)
+		sizes[class_name] = size
+
+	offsets = {}
+	total = 0
+	for class_name, size in sizes.items():
+		offsets[class_name] = total
+		total += size
+	if total > STATIC_SIZE:
+		raise ValueError(f'the program has {total} static variables, more than the {STATIC_SIZE} of the platform')
+
+	renumbered = []
+	offset = 0
+	for instruction in instructions:
+		if instruction.opcode == vm.FUNCTION:
+			offset = offsets[instruction.arg1.split('.')[0]]
+		elif instruction.arg1 == 'static' and instruction.opcode in (vm.PUSH, vm.POP) and offset:
+			instruction = instruction._replace(arg2=instruction.arg2 + offset)
+		renumbered.append(instruction)
+	return renumbered
+
+def link_functions(functions, roots=ROOTS):
+	"""
+	links the functions of a function_table of all the classes of a program
+	and returns a LinkResult, functions keep their original order
+	"""
+
+	graph = call_graph(functions)
+	reached = reachable_functions(graph, roots)
+	external = sorted(set(
+		callee for name in reached for callee in graph[name]
+		if callee not in functions
+	))
+
+	linked = []
+	removed = []
+	removed_instructions = 0
+	for name, code in functions.items():
+		if name in reached:
+			linked.extend(code)
+		else:
+			removed.append(name)
+			removed_instructions += len(code)
+	return LinkResult(renumber_statics(linked), removed, removed_instructions, external)
+
+def link_vm_texts(vm_texts, roots=ROOTS, sources=None):
+	"""
+	links the VM text of each class, returns the LinkResult and the linked
+	VM text. sources names the origin of each text in the errors, ex: its file.
+	"""
+
+	if sources is None:
+		sources = [f'text {index}' for index in range(len(vm_texts))]
+	functions = {}
+	# the source defining every function, to name both in an error
+	defined_in = {}
+	for vm_text, source in zip(vm_texts, sources):
+		for name, code in function_table(parse_vm(vm_text.splitlines())).items():
+			if name in functions:
+				raise ValueError(f'function {name} is defined in both {defined_in[name]} and {source}')
+			functions[name] = code
+			defined_in[name] = source
+	result = link_functions(functions, roots)
+	return result, ''.join(format_instruction(instruction) for instruction in result.instructions)
@@ -0,0 +1,136 @@
+import vm_writer as vm
+from vm_writer import Instruction
+
+
+
+"""
+
+Optimization passes over the VM code of a class.
+
+The passes work on the list of Instruction tuples of a VMWriter,
+peephole() rewrites short instruction sequences that the CompilationEngine
+produces but that do no useful work, ex:
+
+push local 0       >>  (removed)
+pop local 0
+
+lt                 >>  lt
+if-goto IF_TRUE0       not
+goto IF_FALSE0         if-goto IF_FALSE0
+label IF_TRUE0
+
+"""
+
+NOT = Instruction(vm.NOT, None, None)
+PUSH_ZERO = Instruction(vm.PUSH, 'constant', 0)
+EQUAL = Instruction(vm.EQ, None, None)
+
+# instructions leaving a boolean, true (-1) or false (0), on the stack
+COMPARISONS = frozenset([vm.EQ, vm.LT, vm.GT])
+
+# comparison with a constant and its negation, not (x < c) is x > c - 1
+INVERSE_COMPARISONS = {
+	vm.LT: (vm.GT, -1),
+	vm.GT: (vm.LT, 1),
+}
+
+def split_functions(instructions):
+	"""splits the code of a class into the code of each of its functions"""
+
+	functions = []
+	for instruction in instructions:
+		if instruction.opcode == vm.FUNCTION or not functions:
+			functions.append([])
+		functions[-1].append(instruction)
+	return functions
+
+def pushes_boolean(code, end):
+	"""tells if the value code[:end] leaves on the stack is known to be a boolean"""
+
+	last = end - 1
+	if last >= 0 and code[last] == NOT:
+		last -= 1
+	return last >= 0 and code[last].opcode in COMPARISONS
+
+def rewrite_tail(code):
+	"""
+	rewrites the end of code for as long as one of the patterns matches,
+	it is called after every instruction appended.
+	"""
+
+	while len(code) >= 2:
+		a, b = code[-2], code[-1]
+
+		# push x; pop x stores back the value just read
+		if a.opcode == vm.PUSH and b.opcode == vm.POP and a.arg1 == b.arg1 and a.arg2 == b.arg2:
+			del code[-2:]
+			continue
+		# not; not
+		if a == NOT and b == NOT:
+			del code[-2:]
+			continue
+		# goto to the next instruction
+		if a.opcode == vm.GOTO and b.opcode == vm.LABEL and a.arg1 == b.arg1:
+			del code[-2]
+			continue
+		# a false condition never jumps
+		if a == PUSH_ZERO and b.opcode == vm.IF_GOTO:
+			del code[-2:]
+			continue
+
+		if len(code) < 3:
+			break
+		a, b, c = code[-3], code[-2], code[-1]
+
+		# a true condition always jumps
+		if a == PUSH_ZERO and b == NOT and c.opcode == vm.IF_GOTO:
+			code[-3:] = [Instruction(vm.GOTO, c.arg1, None)]
+			continue
+		# if-goto L1; goto L2; label L1 jumps to L2 when the condition is false,
+		# not only negates a boolean, any other value is tested against 0
+		if a.opcode == vm.IF_GOTO and b.opcode == vm.GOTO and c.opcode == vm.LABEL and a.arg1 == c.arg1:
+			negation = [NOT] if pushes_boolean(code, len(code) - 3) else [PUSH_ZERO, EQUAL]
+			code[-3:] = negation + [Instruction(vm.IF_GOTO, b.arg1, None), c]
+			continue
+		# negated comparison with a constant
+		if a.opcode == vm.PUSH and a.arg1 == 'constant' and b.opcode in INVERSE_COMPARISONS and c == NOT:
+			comparison, offset = INVERSE_COMPARISONS[b.opcode]
+			constant = a.arg2 + offset
+			if 0 <= constant <= 32767:
+				code[-3:] = [
+					Instruction(vm.PUSH, 'constant', constant),
+					Instruction(comparison, None, None)
+				]
+				continue
+		break
+
+def remove_unused_labels(code):
+	jump_targets = set(
+		instruction.arg1 for instruction in code
+		if instruction.opcode == vm.GOTO or instruction.opcode == vm.IF_GOTO
+	)
+	return [
+		instruction for instruction in code
+		if instruction.opcode != vm.LABEL or instruction.arg1 in jump_targets
+	]
+
+def peephole_function(code):
+	"""runs the patterns over the code of one function until nothing changes"""
+
+	while True:
+		optimized = []
+		for instruction in code:
+			optimized.append(instruction)
+			rewrite_tail(optimized)
+		optimized = remove_unused_labels(optimized)
+		if optimized == code:
+			return optimized
+		code = optimized
+
+def peephole(instructions):
+	"""returns the optimized instructions, labels are local to each function"""
+
+	optimized = []
+	for code in split_functions(instructions):
+		optimized.extend(peephole_function(code))
+	return optimized
@@ -0,0 +1,200 @@
+import os
+import json
+import time
+import threading
+import contextlib
+import functools
+import collections
+from vm_writer import COMMANDS
+
+
+
+"""
+
+Instrumentation of the compile pipeline.
+
+A Profiler records the phases of the compilation of every file, tokenize,
+compile and output, and the calls of the methods of the CompilationEngine
+it is given to, ex: CompilationEngine(tokenizer, profiler=profiler).
+
+Nothing is wrapped unless a profiler is given, the methods of an engine
+are only replaced on that engine instance, so the cost of the profiler is
+zero when it is not used.
+
+Every finished phase or method call is an Event, kept for the Chrome trace
+and passed to the hooks of the profiler, ex:
+
+profiler = Profiler(hooks=[lambda event: print(event.name, event.duration)])
+
+"""
+
+# a finished phase or method call, start and duration are in seconds
+Event = collections.namedtuple('Event', 'name category file start duration')
+
+# statistics of the calls of one method, own excludes the time of the
+# profiled methods it called
+MethodStats = collections.namedtuple('MethodStats', 'calls total own')
+
+# the methods of a CompilationEngine recorded by the profiler
+PROFILED_PREFIXES = ('compile_', 'write_expression', 'write_condition', 'optimize_vm')
+
+class Profiler:
+	"""
+	Collects the events of the compilation of one or more files.
+
+	summary() returns a text table, chrome_trace() the events in the Chrome
+	trace event format, to load in chrome://tracing or Perfetto.
+	"""
+
+	def __init__(self, hooks=()):
+		self.hooks = list(hooks)
+		self.events = []
+		self.origin = time.perf_counter()
+		self.files = collections.OrderedDict()
+		self.methods = collections.defaultdict(lambda: [0, 0.0, 0.0])
+		# time spent in profiled callees, per open call
+		self.child_times = []
+		self.file = None
+
+	def record(self, name, category, start, duration):
+		event = Event(name, category, self.file, start - self.origin, duration)
+		self.events.append(event)
+		for hook in self.hooks:
+			hook(event)
+
+	def file_stats(self, file):
+		stats = self.files.get(file)
+		if stats is None:
+			stats = self.files[file] = {
+				'tokenize': 0.0, 'compile': 0.0, 'output': 0.0,
+				'tokens': 0, 'instructions': 0, 'lookups': 0, 'opcodes': {},
+			}
+		return stats
+
+	@contextlib.contextmanager
+	def phase(self, name, file):
+		"""times one phase of the compilation of file"""
+
+		self.file = file
+		stats = self.file_stats(file)
+		start = time.perf_counter()
+		try:
+			yield
+		finally:
+			duration = time.perf_counter() - start
+			stats[name] += duration
+			self.record(name, 'phase', start, duration)
+
+	def wrap_method(self, name, method):
+		stats = self.methods[name]
+		child_times = self.child_times
+
+		@functools.wraps(method)
+		def profiled(*args, **kwargs):
+			child_times.append(0.0)
+			start = time.perf_counter()
+			try:
+				return method(*args, **kwargs)
+			finally:
+				duration = time.perf_counter() - start
+				own = duration - child_times.pop()
+				if child_times:
+					child_times[-1] += duration
+				stats[0] += 1
+				stats[1] += duration
+				stats[2] += own
+				self.record(name, 'method', start, duration)
+		return profiled
+
+	def instrument(self, c_engine):
+		"""replaces the profiled methods of c_engine by timed ones"""
+
+		for name in dir(c_engine):
+			if name.startswith(PROFILED_PREFIXES) and callable(getattr(c_engine, name)):
+				setattr(c_engine, name, self.wrap_method(name, getattr(c_engine, name)))
+
+	def instrument_symbol_table(self, symbol_table):
+		"""counts the lookups of a symbol table, every accessor goes through lookup"""
+
+		stats = self.file_stats(self.file)
+		lookup = symbol_table.lookup
+
+		def counted_lookup(name):
+			stats['lookups'] += 1
+			return lookup(name)
+		symbol_table.lookup = counted_lookup
+
+	def instrument_tokenizer(self, tokenizer):
+		"""counts the tokens a streaming tokenizer produces as they are pulled"""
+
+		if not tokenizer.streaming:
+			return
+		stats = self.file_stats(self.file)
+
+		def counted(tokens):
+			for token in tokens:
+				stats['tokens'] += 1
+				yield token
+		tokenizer.token_stream = counted(tokenizer.token_stream)
+
+	def record_file(self, file, tokenizer, c_engine):
+		"""records the token and instruction counts of a compiled file"""
+
+		stats = self.file_stats(file)
+		if not tokenizer.streaming:
+			stats['tokens'] = len(tokenizer.get_token_text())
+		opcodes = c_engine.vm_writer.opcodes
+		stats['instructions'] = len(opcodes)
+		stats['opcodes'] = {
+			COMMANDS[opcode]: count
+			for opcode, count in sorted(collections.Counter(opcodes).items())
+		}
+
+	def method_stats(self):
+		"""returns the MethodStats of every profiled method, by decreasing own time"""
+
+		stats = {
+			name: MethodStats(*values)
+			for name, values in self.methods.items() if values[0]
+		}
+		return dict(sorted(stats.items(), key=lambda item: -item[1].own))
+
+	def summary(self):
+		"""returns the per file and per method tables as text"""
+
+		lines = ['file | tokens | tokenize (ms) | compile (ms) | output (ms) | instructions | lookups']
+		for file, stats in self.files.items():
+			lines.append(
+				f"{file} | {stats['tokens']} | {stats['tokenize'] * 1000:.2f} | "
+				f"{stats['compile'] * 1000:.2f} | {stats['output'] * 1000:.2f} | "
+				f"{stats['instructions']} | {stats['lookups']}"
+			)
+		lines.append('')
+		lines.append('method | calls | total (ms) | own (ms)')
+		for name, stats in self.method_stats().items():
+			lines.append(f'{name} | {stats.calls} | {stats.total * 1000:.2f} | {stats.own * 1000:.2f}')
+		return '\n'.join(lines) + '\n'
+
+	def chrome_trace(self):
+		"""returns the events as a Chrome trace, a dict ready for json.dump"""
+
+		pid = os.getpid()
+		tid = threading.get_ident()
+		trace_events = [
+			{
+				'name': event.name,
+				'cat': event.category,
+				'ph': 'X',
+				'ts': event.start * 1e6,
+				'dur': event.duration * 1e6,
+				'pid': pid,
+				'tid': tid,
+				'args': {'file': event.file},
+			}
+			for event in self.events
+		]
+		return {'traceEvents': trace_events, 'otherData': {'files': self.files}}
+
+	def write_chrome_trace(self, path):
+		with open(path, 'w') as f:
+			json.dump(self.chrome_trace(), f)
@@ -0,0 +1,134 @@
+import os
+import json
+import collections
+from tokenizer import scan_codes, KEYWORD, SYMBOL
+from build_cache import CACHE_DIRECTORY, atomic_write
+
+
+
+"""
+
+Declarations of the subroutines of every class of a program.
+
+A call foo() or Foo.bar() does not tell whether its target is a method,
+which takes the object as a hidden first argument, or a function. The
+index answers it from a pre-scan of the declarations of every .jack file
+of a directory, the bodies of the subroutines are skipped, ex:
+
+Square.new        constructor  3
+Square.moveUp     method       0
+Main.main         function     0
+
+Scanning a file is a single pass of the lexer, and the result is kept in
+.jack_cache/signatures.json with the modification time and size of every
+file, so only the files that changed are scanned again.
+
+The index is a dict of class name to a dict of subroutine name to
+[kind, arity]. It only holds JSON types so that it can go to the worker
+processes and into the build cache key.
+
+"""
+
+INDEX_FILE = 'signatures.json'
+
+SUBROUTINE_KINDS = frozenset(['constructor', 'function', 'method'])
+
+# declaration of a subroutine, arity does not count the object of a method
+Signature = collections.namedtuple('Signature', 'kind arity')
+
+def scan_declarations(jack_text):
+	"""returns the class name of jack_text and a dict of its subroutine names to their Signature"""
+
+	tokens = ((value, code) for value, code, _, _ in scan_codes(jack_text))
+	class_name = None
+	subroutines = {}
+	depth = 0
+	for value, code in tokens:
+		if code == SYMBOL and value == '{':
+			depth += 1
+		elif code == SYMBOL and value == '}':
+			depth -= 1
+		elif code == KEYWORD and depth == 0 and value == 'class':
+			class_name = next(tokens)[0]
+		elif code == KEYWORD and depth == 1 and value in SUBROUTINE_KINDS:
+			kind = value
+			next(tokens) # return type
+			name = next(tokens)[0]
+			next(tokens) # (
+			# parameters are type name pairs separated by commas
+			arity = 0
+			for value, code in tokens:
+				if code == SYMBOL and value == ')':
+					break
+				if arity == 0 or (code == SYMBOL and value == ','):
+					arity += 1
+			subroutines[name] = Signature(kind, arity)
+	if class_name is None:
+		raise ValueError('no class declaration found')
+	return class_name, subroutines
+
+def scan_file(file):
+	"""returns the index entry of file, its class name and subroutines"""
+
+	with open(file) as f:
+		class_name, subroutines = scan_declarations(f.read())
+	return {
+		'class': class_name,
+		'subroutines': {name: list(signature) for name, signature in subroutines.items()},
+	}
+
+def scan_files(files):
+	"""returns the index of files, without the files that cannot be scanned"""
+
+	signatures = {}
+	for file in files:
+		try:
+			entry = scan_file(file)
+		except (OSError, ValueError, StopIteration):
+			# the compilation of the file reports the error
+			continue
+		signatures[entry['class']] = entry['subroutines']
+	return signatures
+
+def file_stamp(file):
+	stat = os.stat(file)
+	return [stat.st_mtime_ns, stat.st_size]
+
+class SignatureIndex:
+	"""
+	The signature index of the classes of one directory, kept on disk.
+
+	signatures(files) returns the index of files, only the files whose
+	modification time or size changed since the last call are scanned.
+	"""
+
+	def __init__(self, directory):
+		self.path = os.path.join(directory, CACHE_DIRECTORY, INDEX_FILE)
+
+	def load(self):
+		try:
+			with open(self.path) as f:
+				return json.load(f)
+		except (FileNotFoundError, ValueError):
+			return {}
+
+	def save(self, entries):
+		os.makedirs(os.path.dirname(self.path), exist_ok=True)
+		atomic_write(self.path, json.dumps(entries))
+
+	def signatures(self, files):
+		entries = self.load()
+		updated = {}
+		for file in files:
+			name = os.path.basename(file)
+			try:
+				stamp = file_stamp(file)
+				entry = entries.get(name)
+				if entry is None or entry['stamp'] != stamp:
+					entry = dict(scan_file(file), stamp=stamp)
+			except (OSError, ValueError, StopIteration):
+				continue
+			updated[name] = entry
+		if updated != entries:
+			self.save(updated)
+		return {entry['class']: entry['subroutines'] for entry in updated.values()}
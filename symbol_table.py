@@ -1,3 +1,10 @@
+import collections
+
+
+
+# an entry of the symbol table
+SYMBOL = collections.namedtuple('SYMBOL', 'type kind index')
+
 class SymbolTable:
 	"""
 	It provides a container to save identifiers such as local variables in a subroutine
@@ -12,32 +19,39 @@ class SymbolTable:
 	p2   - Point - local    - 1
 	x    - int   - argument	- 0
 	"""
-	
+
 	def __init__(self, name):
 		self.class_name = name
 		self.class_level = {}
 		self.subroutine_level = {}
-	
+		# running count of the identifiers defined so far of each kind
+		self.kind_counts = {'field': 0, 'static': 0, 'local': 0, 'argument': 0}
+
 	def st_class_name(self):
 		return self.class_name
 
 	def start_subroutine(self):
 		# resets the subroutine table
 		self.subroutine_level = {}
-		
+		self.kind_counts['local'] = 0
+		self.kind_counts['argument'] = 0
+
 	def new_index(self, kind):
-		if kind in ['field', 'static']:
-			s_table = self.class_level
-		else:
-			s_table = self.subroutine_level
+		return self.kind_counts[kind]
+
+	def var_count(self, kind):
+		"""returns the number of identifiers of the given kind in the current scope"""
 
-		kind_entries = list(filter(lambda obj: obj['kind'] == kind, s_table.values()))
-		return len(kind_entries)
+		return self.kind_counts[kind]
+
+	def lookup(self, name):
+		entry = self.subroutine_level.get(name)
+		if entry is None:
+			entry = self.class_level.get(name)
+		return entry
 
 	def index_of(self, name):
-		class_level_lookup = self.class_level.get(name, None)
-		index_lookup = self.subroutine_level.get(name, class_level_lookup)
-		return index_lookup.get('index')
+		return self.lookup(name).index
 
 	def type_of(self, name):
 		"""
@@ -45,10 +59,8 @@ class SymbolTable:
 		int, char, boolean, or a class type such as Point.
 		"""
 
-		class_level_lookup = self.class_level.get(name, None)
-		type_lookup = self.subroutine_level.get(name, class_level_lookup)
-		
-		return type_lookup.get('type') if type_lookup else None
+		entry = self.lookup(name)
+		return entry.type if entry else None
 
 	def kind_of(self, name):
 		"""
@@ -56,25 +68,22 @@ class SymbolTable:
 		in case of subroutine name or a class name.
 		"""
 
-		class_level_lookup = self.class_level.get(name, None)
-		kind_lookup = self.subroutine_level.get(name, class_level_lookup)
-		
-		return kind_lookup.get('kind') if kind_lookup else None
+		entry = self.lookup(name)
+		return entry.kind if entry else None
 
 	def define_identifier(self, name, _type, kind):
 		"""
-		index starts at 0 so length of existing identifiers should be the 
-		index of the new identifier.
-		len() == 0 >> first index is 0
-		len() == 1 >> second index is 1
+		index of the new identifier is the running count of its kind,
+		the count is then incremented for the next one.
+		count == 0 >> first index is 0
+		count == 1 >> second index is 1
 		"""
-		
+
 		if kind in ['field', 'static']:
 			s_table = self.class_level
 		else:
-			s_table = self.subroutine_level		
+			s_table = self.subroutine_level
 
 		index = self.new_index(kind)
-		s_table[name] = {
-			'type': _type, 'kind': kind, 'index': index 
-		}
\ No newline at end of file
+		self.kind_counts[kind] = index + 1
+		s_table[name] = SYMBOL(_type, kind, index)
@@ -0,0 +1,142 @@
+import pytest
+from jack_compiler import compile_source
+from linker import link_vm_texts
+from vm_writer import parse_vm
+from asm_writer import AsmWriter
+from vm_interpreter import VirtualMachine
+
+
+
+# a program without OS calls, so it runs on the bare Hack CPU
+MAIN = '''class Main {
+	static int calls, sum, signs;
+	function int fib(int n) {
+		let calls = calls + 1;
+		if (n < 2) { return n; }
+		return Main.fib(n - 1) + Main.fib(n - 2);
+	}
+	function int compare(int x, int y) {
+		var int result;
+		if (x < y) { let result = result + 1; }
+		if (x > y) { let result = result + 2; }
+		if (x = y) { let result = result + 4; }
+		return result;
+	}
+	function int main() {
+		var int i;
+		while (i < 10) {
+			let sum = sum + Main.fib(i);
+			let i = i + 1;
+		}
+		let signs = Main.compare(-32000, 32000) + Main.compare(32000, -32000) + Main.compare(-5, -5);
+		do Counter.bump(); do Counter.bump();
+		return ~(sum & 255) | -(Counter.bump());
+	}
+}
+'''
+
+COUNTER = '''class Counter {
+	static int n;
+	function int bump() { let n = n + 1; return n; }
+}
+'''
+
+# computations of the Hack ALU by mnemonic, A stands for M as well
+COMPUTATIONS = {
+	'0': lambda d, a: 0, '1': lambda d, a: 1, '-1': lambda d, a: -1,
+	'D': lambda d, a: d, 'A': lambda d, a: a,
+	'!D': lambda d, a: ~d, '!A': lambda d, a: ~a, '-D': lambda d, a: -d, '-A': lambda d, a: -a,
+	'D+1': lambda d, a: d + 1, 'A+1': lambda d, a: a + 1, 'D-1': lambda d, a: d - 1, 'A-1': lambda d, a: a - 1,
+	'D+A': lambda d, a: d + a, 'A+D': lambda d, a: d + a, 'D-A': lambda d, a: d - a, 'A-D': lambda d, a: a - d,
+	'D&A': lambda d, a: d & a, 'A&D': lambda d, a: d & a, 'D|A': lambda d, a: d | a, 'A|D': lambda d, a: d | a,
+}
+
+JUMPS = {
+	'': lambda x: False, 'JMP': lambda x: True, 'JEQ': lambda x: x == 0, 'JNE': lambda x: x != 0,
+	'JGT': lambda x: x > 0, 'JGE': lambda x: x >= 0, 'JLT': lambda x: x < 0, 'JLE': lambda x: x <= 0,
+}
+
+def assemble(asm_text):
+	"""returns the instructions and symbol table of Hack assembly"""
+
+	symbols = {f'R{i}': i for i in range(16)}
+	symbols.update(SP=0, LCL=1, ARG=2, THIS=3, THAT=4, SCREEN=16384, KBD=24576)
+	lines = []
+	for line in asm_text.splitlines():
+		line = line.split('//')[0].strip()
+		if line.startswith('('):
+			symbols[line[1:-1]] = len(lines)
+		elif line:
+			lines.append(line)
+
+	variable = 16
+	program = []
+	for line in lines:
+		if line.startswith('@'):
+			value = line[1:]
+			if not value.isdigit() and value not in symbols:
+				symbols[value] = variable
+				variable += 1
+			program.append(('@', int(value) if value.isdigit() else symbols[value]))
+		else:
+			dest, _, rest = line.rpartition('=')
+			computation, _, jump = rest.partition(';')
+			program.append((dest, computation, jump))
+	return program, symbols
+
+def word(value):
+	return (value + 32768) % 65536 - 32768
+
+def run_hack(program, halt, max_steps=10 ** 6):
+	"""runs the program until it reaches halt and returns the RAM"""
+
+	ram = [0] * 32768
+	a = d = pc = 0
+	for _ in range(max_steps):
+		if pc == halt:
+			return ram
+		instruction = program[pc]
+		if instruction[0] == '@':
+			a = instruction[1]
+			pc += 1
+			continue
+		dest, computation, jump = instruction
+		y = ram[a] if 'M' in computation else a
+		result = word(COMPUTATIONS[computation.replace('M', 'A')](d, y))
+		address = a
+		if 'M' in dest:
+			ram[address] = result
+		if 'A' in dest:
+			a = result % 32768
+		if 'D' in dest:
+			d = result
+		pc = address if JUMPS[jump](result) else pc + 1
+	raise AssertionError(f'not halted after {max_steps} instructions')
+
+def test_assembly_matches_the_interpreter():
+	_, vm_text = link_vm_texts([compile_source(MAIN), compile_source(COUNTER)])
+	instructions = list(parse_vm(vm_text.splitlines()))
+	program, symbols = assemble(AsmWriter(instructions, 'Main.main').asm_text())
+	ram = run_hack(program, symbols['$HALT'])
+
+	machine = VirtualMachine(instructions)
+	value = machine.run()
+	# the value of the bootstrap call replaces its return address
+	assert ram[256] == value == ~(88 & 255) | -3
+	assert ram[0] == 257
+	for static in range(3):
+		assert ram[symbols[f'Main.{static}']] == machine.ram[machine.static_address('Main', static)]
+	assert [ram[symbols[f'Main.{static}']] for static in range(3)] == [276, 88, 7]
+	# the static of Counter was renumbered past the statics of Main
+	assert ram[symbols['Counter.3']] == machine.ram[machine.static_address('Counter', 3)] == 3
+
+@pytest.mark.parametrize('x, y', [(-32000, 32000), (32000, -32000), (-5, -5), (7, 3)])
+def test_ordered_comparisons_do_not_overflow(x, y):
+	vm_text = (
+		f'function Main.main 0\npush constant {abs(x)}\n' + ('neg\n' if x < 0 else '')
+		+ f'push constant {abs(y)}\n' + ('neg\n' if y < 0 else '')
+		+ 'lt\nreturn\n'
+	)
+	program, symbols = assemble(AsmWriter(list(parse_vm(vm_text.splitlines())), 'Main.main').asm_text())
+	ram = run_hack(program, symbols['$HALT'])
+	assert ram[256] == (-1 if x < y else 0)
@@ -0,0 +1,80 @@
+import os
+import pytest
+import build_cache
+import tokenizer
+from build_cache import BuildCache, cache_key, file_cache_key
+from jack_compiler import compile_file
+
+
+
+SOURCE = '''class Main {
+	function int f(int x) { return x + (2 * 3); }
+}
+'''
+
+@pytest.fixture
+def jack_file(tmp_path):
+	path = tmp_path / 'Main.jack'
+	path.write_text(SOURCE)
+	return str(path)
+
+def compiled(jack_file):
+	with open(os.path.splitext(jack_file)[0] + '_compiled.vm') as f:
+		return f.read()
+
+def test_cache_hit(jack_file):
+	first = compile_file(jack_file, use_cache=True)
+	vm_text = compiled(jack_file)
+	second = compile_file(jack_file, use_cache=True)
+	assert (first.error, first.cached) == (None, False)
+	assert (second.error, second.cached) == (None, True)
+	assert compiled(jack_file) == vm_text
+
+def test_cache_miss_after_an_option_change(jack_file):
+	compile_file(jack_file, use_cache=True)
+	assert not compile_file(jack_file, use_cache=True, optimize=1).cached
+	assert compile_file(jack_file, use_cache=True, optimize=1).cached
+	# streaming does not change the code, it shares the entries
+	assert compile_file(jack_file, use_cache=True, optimize=1, streaming=True).cached
+
+def test_cache_miss_after_a_source_change(jack_file):
+	compile_file(jack_file, use_cache=True)
+	with open(jack_file, 'a') as f:
+		f.write('// edited\n')
+	assert not compile_file(jack_file, use_cache=True).cached
+
+def test_cache_miss_after_a_compiler_change(jack_file, monkeypatch):
+	compile_file(jack_file, use_cache=True)
+	monkeypatch.setattr(build_cache, 'compiler_fingerprint', lambda: 'another compiler')
+	assert not compile_file(jack_file, use_cache=True).cached
+
+def test_force_recompiles(jack_file):
+	compile_file(jack_file, use_cache=True)
+	assert not compile_file(jack_file, use_cache=True, force=True).cached
+
+def test_file_key_matches_text_key(jack_file, monkeypatch):
+	monkeypatch.setattr(build_cache, 'READ_SIZE', 7)
+	options = {'optimize': 1}
+	assert file_cache_key(jack_file, options) == cache_key(SOURCE, options)
+
+def test_streaming_compile_never_reads_the_whole_file(jack_file, monkeypatch):
+	def read_input(self):
+		raise AssertionError('the whole source was read')
+	monkeypatch.setattr(tokenizer.JackTokenizer, 'read_input', read_input)
+	result = compile_file(jack_file, use_cache=True, streaming=True)
+	assert (result.error, result.cached) == (None, False)
+	assert compile_file(jack_file, use_cache=True, streaming=True).cached
+
+def test_least_recently_used_entries_are_pruned(tmp_path):
+	cache = BuildCache(str(tmp_path), max_entries=3)
+	for age, key in enumerate('abcd'):
+		cache.put(key, key)
+		# one second apart, oldest first
+		os.utime(cache.entry_path(key), (1000 + age, 1000 + age))
+	cache.put('e', 'e')
+	assert cache.get('a') is None
+	assert cache.get('b') is None
+	# a hit makes c the most recently used entry, d is now the oldest
+	assert cache.get('c') == 'c'
+	cache.put('f', 'f')
+	assert [cache.get(key) for key in 'cdef'] == ['c', None, 'e', 'f']
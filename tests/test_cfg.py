@@ -0,0 +1,52 @@
+from build_cache import COMPILER_MODULES
+from cfg import ControlFlowGraph, optimize_cfg
+from vm_writer import parse_vm, format_instruction
+
+
+
+def code(vm_text):
+	return list(parse_vm(vm_text.splitlines()))
+
+def text(instructions):
+	return ''.join(format_instruction(instruction) for instruction in instructions)
+
+IF_ELSE = '''function Main.f 1
+push argument 0
+if-goto IF_FALSE0
+push constant 1
+pop local 0
+goto IF_END0
+label IF_FALSE0
+push constant 2
+pop local 0
+label IF_END0
+push local 0
+return
+'''
+
+def test_blocks_and_successors():
+	graph = ControlFlowGraph(code(IF_ELSE))
+	assert [block.labels for block in graph.blocks] == [[], [], ['IF_FALSE0'], ['IF_END0']]
+	assert [graph.successors(index) for index in range(4)] == [[2, 1], [3], [3], []]
+
+def test_jump_to_a_goto_is_threaded():
+	graph = ControlFlowGraph(code(
+		'function Main.f 0\npush argument 0\nif-goto A\npush constant 1\nreturn\n'
+		'label A\ngoto B\nlabel B\npush argument 0\npush argument 0\nadd\nreturn\n'
+	))
+	graph.optimize()
+	assert 'if-goto B\n' in text(graph.instructions())
+	assert 'goto A' not in text(graph.instructions())
+
+def test_unreachable_blocks_are_removed():
+	assert text(optimize_cfg(code('function Main.f 0\npush constant 0\nreturn\npush constant 1\nreturn\n'))) == (
+		'function Main.f 0\npush constant 0\nreturn\n'
+	)
+
+def test_optimized_graph_keeps_the_if_else():
+	optimized = text(optimize_cfg(code(IF_ELSE)))
+	assert 'if-goto IF_FALSE0\n' in optimized
+	assert 'push constant 2\npop local 0\n' in optimized
+
+def test_cfg_is_part_of_the_compiler_fingerprint():
+	assert 'cfg.py' in COMPILER_MODULES
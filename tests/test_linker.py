@@ -0,0 +1,71 @@
+import pytest
+from jack_compiler import compile_source
+from linker import link_vm_texts
+
+
+
+MAIN = '''class Main {
+	static int a, b;
+	function void main() { let a = 1; let b = Counter.bump(); return; }
+}
+'''
+
+COUNTER = '''class Counter {
+	static int n;
+	function int bump() { let n = n + 1; return n; }
+	function void unused() { return; }
+}
+'''
+
+def statics(vm_text):
+	return [line for line in vm_text.splitlines() if ' static ' in line]
+
+def test_unreachable_functions_are_dropped():
+	result, vm_text = link_vm_texts([compile_source(MAIN), compile_source(COUNTER)])
+	assert result.removed == ['Counter.unused']
+	assert result.removed_instructions == 3
+	assert 'function Counter.unused' not in vm_text
+	assert vm_text.startswith('function Main.main 0\n')
+
+def test_sys_init_is_a_root():
+	sys_text = 'function Sys.init 0\ncall Counter.bump 0\nreturn\n'
+	result, _ = link_vm_texts([sys_text, compile_source(COUNTER)])
+	assert result.removed == ['Counter.unused']
+
+def test_a_program_needs_a_root():
+	with pytest.raises(ValueError, match='Main.main'):
+		link_vm_texts([compile_source(COUNTER)])
+
+def test_statics_are_renumbered_across_classes():
+	_, vm_text = link_vm_texts([compile_source(MAIN), compile_source(COUNTER)])
+	assert statics(vm_text) == [
+		'pop static 0', 'pop static 1',
+		# static 0 of Counter comes after the two of Main
+		'push static 2', 'pop static 2', 'push static 2',
+	]
+
+def test_statics_of_dropped_functions_take_no_slot():
+	other = 'function Other.unused 0\npush static 0\nreturn\n'
+	_, vm_text = link_vm_texts([compile_source(MAIN), other, compile_source(COUNTER)])
+	assert 'push static 2' in vm_text
+
+def test_too_many_statics():
+	# three classes of 100 statics each, Main.main calls C0.f calls C1.f ...
+	texts = ['function Main.main 0\ncall C0.f 0\nreturn\n']
+	for i in range(3):
+		texts.append(f'function C{i}.f 0\npush static 99\ncall C{i + 1}.f 0\nreturn\n')
+	with pytest.raises(ValueError, match='300 static variables'):
+		link_vm_texts(texts)
+
+def test_duplicate_functions_name_both_sources():
+	duplicate = 'function Counter.bump 0\npush constant 1\nreturn\n'
+	with pytest.raises(ValueError, match='Counter.bump is defined in both Counter.jack and lib/Counter.vm'):
+		link_vm_texts(
+			[compile_source(MAIN), compile_source(COUNTER), duplicate],
+			sources=['Main.jack', 'Counter.jack', 'lib/Counter.vm']
+		)
+
+def test_duplicate_functions_in_one_source():
+	twice = 'function Main.main 0\nreturn\nfunction Main.main 0\nreturn\n'
+	with pytest.raises(ValueError, match='Main.main is defined twice'):
+		link_vm_texts([twice])
@@ -0,0 +1,50 @@
+from jack_compiler import compile_source
+from vm_writer import parse_vm, format_instruction
+from optimizer import peephole
+
+
+
+def optimized(vm_text):
+	return ''.join(format_instruction(instruction) for instruction in peephole(parse_vm(vm_text.splitlines())))
+
+def compile_function(body, optimize=1):
+	"""returns the VM code of a class with one function f(x, y) of body"""
+
+	source = f'class Main {{ function int f(int x, int y) {{ var int r; {body} return r; }} }}'
+	return compile_source(source, optimize=optimize)
+
+def test_push_pop_of_the_same_variable():
+	assert optimized('function Main.f 1\npush local 0\npop local 0\npush constant 0\nreturn\n') == (
+		'function Main.f 1\npush constant 0\nreturn\n'
+	)
+
+def test_jump_over_goto_negates_a_comparison():
+	code = 'function Main.f 0\npush argument 0\npush argument 1\nlt\nif-goto A\ngoto B\nlabel A\npush constant 1\nreturn\nlabel B\npush constant 0\nreturn\n'
+	assert optimized(code) == (
+		'function Main.f 0\npush argument 0\npush argument 1\nlt\nnot\nif-goto B\n'
+		'push constant 1\nreturn\nlabel B\npush constant 0\nreturn\n'
+	)
+
+def test_jump_over_goto_tests_other_values_against_zero():
+	# not 4 is -5, still true, so x & 4 cannot be negated with not
+	code = 'function Main.f 0\npush argument 0\npush constant 4\nand\nif-goto A\ngoto B\nlabel A\npush constant 1\nreturn\nlabel B\npush constant 0\nreturn\n'
+	assert optimized(code) == (
+		'function Main.f 0\npush argument 0\npush constant 4\nand\npush constant 0\neq\nif-goto B\n'
+		'push constant 1\nreturn\nlabel B\npush constant 0\nreturn\n'
+	)
+
+def test_non_boolean_if_condition():
+	code = compile_function('let r = 0; if (x & 4) { let r = 1; }')
+	assert 'and\npush constant 0\neq\nif-goto IF_FALSE0\n' in code
+	assert 'and\nnot\n' not in code
+
+def test_non_boolean_if_condition_with_else():
+	code = compile_function('let r = 0; if (x & 4) {} else { let r = 1; }')
+	assert 'and\nnot\n' not in code
+
+def test_comparison_if_condition():
+	code = compile_function('let r = 0; if (x < y) { let r = 1; }')
+	assert 'lt\nnot\nif-goto IF_FALSE0\n' in code
+
+def test_unoptimized_code_is_unchanged():
+	assert 'if-goto IF_TRUE0\ngoto IF_FALSE0\nlabel IF_TRUE0\n' in compile_function('if (x & 4) { let r = 1; }', optimize=0)
@@ -0,0 +1,55 @@
+import collections
+import pytest
+from jack_compiler import compile_source
+from vm_interpreter import VirtualMachine
+
+
+
+# the body of Main.run(int x, int y) with a local r, the arguments it is
+# run with and the value it returns at every optimization level
+Regression = collections.namedtuple('Regression', 'name body args expected')
+
+REGRESSIONS = [
+	# a false x = y jumps on x - y, not of a non-boolean is still true
+	Regression(
+		'empty then, else on a false x = y',
+		'if (x = y) {} else { let r = 7; } let r = r + 1; let r = r + 1;',
+		(3, 5), 9
+	),
+	Regression(
+		'empty then, else on a true x = y',
+		'if (x = y) {} else { let r = 7; } let r = r + 1;',
+		(5, 5), 1
+	),
+	Regression('false x = 0', 'if (x = 0) { let r = 1; } else { let r = 2; }', (3, 0), 2),
+	Regression('true x = 0', 'if (x = 0) { let r = 1; } else { let r = 2; }', (0, 0), 1),
+	# a non-boolean condition is true when it is not 0
+	Regression('non-boolean if condition', 'if (x & 4) { let r = 1; }', (5, 0), 1),
+	Regression('non-boolean if condition with an empty then', 'if (x & 4) {} else { let r = 1; }', (5, 0), 0),
+	# a while loop ends when not condition is true, for any value but -1
+	Regression('non-boolean while condition', 'while (x & 7) { let x = x - 1; let r = r + 1; }', (5, 0), 0),
+	Regression('while condition of -1', 'while (x | y) { let x = 0; let r = r + 1; }', (-1, 0), 1),
+	Regression('negated comparison', 'if (~(x < 3)) { let r = 1; } else { let r = 2; }', (3, 0), 1),
+	Regression('or of comparisons, left side', 'if ((x < 0) | (x > 10)) { let r = 1; }', (-3, 0), 1),
+	Regression('or of comparisons, neither side', 'if ((x < 0) | (x > 10)) { let r = 1; }', (5, 0), 0),
+	Regression('or of comparisons, right side', 'if ((x < 0) | (x > 10)) { let r = 1; }', (11, 0), 1),
+	Regression(
+		'and of comparisons in a while loop',
+		'while ((x < 10) & (y > -1)) { let x = x + 1; let r = r + 1; }',
+		(0, 0), 10
+	),
+	Regression('comparison with the smallest constant', 'if (x < -32767) { let r = 1; }', (-32767, 0), 0),
+	Regression('comparison with the largest constant', 'if (x > 32766) { let r = 1; }', (32767, 0), 1),
+	Regression('comparison with a wrapped difference', 'if (x > y) { let r = 1; }', (32000, -32000), 1),
+]
+
+def run_regression(regression, optimize, fast):
+	source = f'class Main {{ function int run(int x, int y) {{ var int r; {regression.body} return r; }} }}'
+	machine = VirtualMachine.from_vm_texts([compile_source(source, optimize=optimize)])
+	return machine.run('Main.run', regression.args, fast=fast)
+
+@pytest.mark.parametrize('fast', [False, True], ids=['loop', 'fast'])
+@pytest.mark.parametrize('optimize', [0, 1], ids=['O0', 'O1'])
+@pytest.mark.parametrize('regression', REGRESSIONS, ids=[regression.name for regression in REGRESSIONS])
+def test_optimization_levels_compute_the_same_value(regression, optimize, fast):
+	assert run_regression(regression, optimize, fast) == regression.expected
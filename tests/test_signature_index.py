@@ -0,0 +1,52 @@
+import pytest
+import signature_index
+from jack_compiler import compile_source
+from signature_index import Signature, SignatureIndex, scan_declarations
+
+
+
+MAIN = '''class Main {
+	field int size;
+	method int area() { return size; }
+	function int twice(int a, int b) { return helper(a) + helper(b); }
+	function int helper(int a) { return a; }
+	method int call() { return area(); }
+}
+'''
+
+def test_scan_declarations():
+	class_name, subroutines = scan_declarations(MAIN)
+	assert class_name == 'Main'
+	assert subroutines == {
+		'area': Signature('method', 0), 'twice': Signature('function', 2),
+		'helper': Signature('function', 1), 'call': Signature('method', 0),
+	}
+
+def test_unqualified_calls_follow_the_kind_of_their_target():
+	_, subroutines = scan_declarations(MAIN)
+	signatures = {'Main': {name: list(signature) for name, signature in subroutines.items()}}
+	vm_text = compile_source(MAIN, signatures=signatures)
+	# the function helper gets no object, the method area gets this
+	assert 'push argument 0\ncall Main.helper 1\n' in vm_text
+	assert 'push pointer 0\ncall Main.area 1\n' in vm_text
+
+def test_wrong_number_of_arguments():
+	source = 'class Main { function int f() { return Math.max(1); } }'
+	with pytest.raises(ValueError, match='Math.max takes 2 arguments, 1 given'):
+		compile_source(source, signatures={'Math': {'max': ['function', 2]}})
+
+def test_only_changed_files_are_scanned(tmp_path, monkeypatch):
+	main = tmp_path / 'Main.jack'
+	main.write_text(MAIN)
+	index = SignatureIndex(str(tmp_path))
+	assert index.signatures([str(main)])['Main']['twice'] == ['function', 2]
+
+	scanned = []
+	scan_file = signature_index.scan_file
+	monkeypatch.setattr(signature_index, 'scan_file', lambda file: scanned.append(file) or scan_file(file))
+	SignatureIndex(str(tmp_path)).signatures([str(main)])
+	assert scanned == []
+
+	main.write_text(MAIN.replace('int a, int b', 'int a'))
+	assert SignatureIndex(str(tmp_path)).signatures([str(main)])['Main']['twice'] == ['function', 1]
+	assert scanned == [str(main)]
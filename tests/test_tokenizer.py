@@ -0,0 +1,85 @@
+import io
+import pytest
+from tokenizer import TOKEN, JackTokenizer, scan_tokens, scan_codes, legacy_scan_tokens, stream_codes
+
+
+
+CLASS_TEXT = '''
+/** a class with every kind of token */
+class Main {
+	field int count; // a line comment
+	/* a block
+	   comment */
+	method void run() {
+		let count = count + 12;
+		do Output.printString("not // a comment");
+		return;
+	}
+}
+'''
+
+def test_scan_tokens_categories():
+	tokens = list(scan_tokens('let x = "a /* b */"; // done\nreturn 12;'))
+	assert tokens == [
+		TOKEN('let', 'KEYWORD'),
+		TOKEN('x', 'IDENTIFIER'),
+		TOKEN('=', 'SYMBOL'),
+		TOKEN('a /* b */', 'STRING_CONST'),
+		TOKEN(';', 'SYMBOL'),
+		TOKEN('return', 'KEYWORD'),
+		TOKEN('12', 'INT_CONST'),
+		TOKEN(';', 'SYMBOL'),
+	]
+
+def test_scan_tokens_matches_legacy_lexer():
+	assert list(scan_tokens(CLASS_TEXT)) == list(legacy_scan_tokens(CLASS_TEXT))
+
+def test_unterminated_string():
+	with pytest.raises(ValueError, match='line 2'):
+		list(scan_tokens('let s = 1;\nlet s = "no end;\n'))
+
+def test_unterminated_comment():
+	with pytest.raises(ValueError, match='line 3'):
+		list(scan_tokens('let s = 1;\n\n/* no end\nlet s = 2;\n'))
+
+def test_tokenizer_reads_files_and_text(tmp_path):
+	path = tmp_path / 'Main.jack'
+	path.write_text(CLASS_TEXT)
+	from_file = JackTokenizer(str(path))
+	from_text = JackTokenizer(source=CLASS_TEXT)
+	assert list(from_file.get_token_text()) == list(from_text.get_token_text())
+	assert len(from_text.get_token_text()) == 32
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 5, 7, 64])
+def test_stream_codes_across_chunk_boundaries(chunk_size):
+	# every token, comment and string gets cut by some chunk size, the
+	# lines and columns must not move either
+	streamed = list(stream_codes(io.StringIO(CLASS_TEXT), chunk_size))
+	assert streamed == list(scan_codes(CLASS_TEXT))
+
+def test_codes_positions():
+	codes = list(scan_codes('class Main {\n\tfield int x;\n}\n'))
+	assert [(value, line, column) for value, _, line, column in codes] == [
+		('class', 1, 1), ('Main', 1, 7), ('{', 1, 12),
+		('field', 2, 2), ('int', 2, 8), ('x', 2, 12), (';', 2, 13),
+		('}', 3, 1),
+	]
+
+@pytest.mark.parametrize('chunk_size', [1, 4, 64])
+def test_stream_codes_unterminated(chunk_size):
+	with pytest.raises(ValueError, match='line 3'):
+		list(stream_codes(io.StringIO('let s = 1;\n\n/* no end\n'), chunk_size))
+	with pytest.raises(ValueError, match='line 2'):
+		list(stream_codes(io.StringIO('let s = 1;\nlet s = "no end;\n'), chunk_size))
+
+def test_streaming_tokenizer_peeks_ahead():
+	tokenizer = JackTokenizer(source=CLASS_TEXT, streaming=True)
+	assert tokenizer.peek_token(3)[0] == '{'
+	tokenizer.advance()
+	assert tokenizer.current_token() == 'class'
+	assert tokenizer.peek_token()[0] == 'Main'
+	values = [tokenizer.current_token()]
+	while tokenizer.has_more_tokens():
+		tokenizer.advance()
+		values.append(tokenizer.current_token())
+	assert values == [token.value for token in scan_tokens(CLASS_TEXT)]
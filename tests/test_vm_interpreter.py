@@ -0,0 +1,109 @@
+import pytest
+from jack_compiler import compile_source
+from linker import link_vm_texts
+from vm_interpreter import VirtualMachine, VMError, STATIC_BASE, STACK_BASE, STACK_END
+
+
+
+MAIN = '''class Main {
+	static int calls, last;
+	function int fib(int n) {
+		let calls = calls + 1;
+		if (n < 2) { return n; }
+		return Main.fib(n - 1) + Main.fib(n - 2);
+	}
+	function int main() {
+		var Array a;
+		let a = Array.new(3);
+		let a[2] = Counter.bump() * 7;
+		let last = Main.fib(10);
+		do Output.printString("fib ");
+		do Output.printInt(last);
+		do Output.println();
+		return a[2] + 32767;
+	}
+}
+'''
+
+COUNTER = '''class Counter {
+	static int n;
+	function int bump() { let n = n + 1; return n; }
+}
+'''
+
+LOOP = '''class Main {
+	function void main() { while (true) { } return; }
+}
+'''
+
+def machine(*sources, **options):
+	return VirtualMachine.from_vm_texts([compile_source(source) for source in sources], **options)
+
+def test_run_returns_the_value_of_main():
+	vm = machine(MAIN, COUNTER)
+	# 7 + 32767 wraps around to -32762
+	assert vm.run() == -32762
+	assert vm.output_text() == 'fib 55\n'
+
+def test_statics_of_each_class():
+	vm = machine(MAIN, COUNTER)
+	vm.run()
+	assert vm.ram[vm.static_address('Main', 0)] == 177
+	assert vm.ram[vm.static_address('Main', 1)] == 55
+	assert vm.ram[vm.static_address('Counter', 0)] == 1
+	assert vm.static_address('Counter', 0) == STATIC_BASE + 2
+
+def test_run_calls_any_function():
+	vm = machine(MAIN, COUNTER)
+	assert vm.run('Main.fib', [12]) == 144
+	with pytest.raises(ValueError, match='Main.missing'):
+		vm.run('Main.missing')
+
+def test_linked_statics_keep_their_addresses():
+	_, vm_text = link_vm_texts([compile_source(MAIN), compile_source(COUNTER)])
+	linked = VirtualMachine.from_vm_texts([vm_text])
+	separate = machine(MAIN, COUNTER)
+	assert linked.run() == separate.run()
+	assert linked.ram[STATIC_BASE:STATIC_BASE + 3] == separate.ram[STATIC_BASE:STATIC_BASE + 3]
+
+@pytest.mark.parametrize('optimize', [0, 1])
+@pytest.mark.parametrize('x, expected', [(1, 10), (2, 20)])
+def test_if_else_runs_one_branch(x, expected, optimize):
+	source = f'''class Main {{
+		function int main() {{
+			var int r;
+			if ({x} = 1) {{ let r = 10; }} else {{ let r = 20; }}
+			return r;
+		}}
+	}}'''
+	assert VirtualMachine.from_vm_texts([compile_source(source, optimize=optimize)]).run() == expected
+
+def test_max_steps_stops_a_runaway_program():
+	vm = machine(LOOP)
+	with pytest.raises(VMError):
+		vm.run(max_steps=1000)
+
+def test_undefined_function_is_an_error():
+	with pytest.raises(ValueError, match='Main.f: function Foo.bar is not defined'):
+		VirtualMachine.from_vm_texts(['function Main.f 0\ncall Foo.bar 0\nreturn\n'])
+
+WRAPPED = '''class Main {
+	function int main() {
+		var int a, b;
+		let a = 32767;
+		let b = 3;
+		return ((a + b) * 2) + (-(a + b)) + (~(a + 1));
+	}
+}
+'''
+
+@pytest.mark.parametrize('sources', [(MAIN, COUNTER), (WRAPPED,)])
+def test_fast_path_matches_the_loop(sources):
+	loop = machine(*sources)
+	fast = machine(*sources)
+	assert fast.run(fast=True) == loop.run()
+	assert fast.steps == loop.steps
+	assert fast.output_text() == loop.output_text()
+	# only the stack may differ, frames are not written on the fast path
+	assert fast.ram[:STACK_BASE] == loop.ram[:STACK_BASE]
+	assert fast.ram[STACK_END:] == loop.ram[STACK_END:]
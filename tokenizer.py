@@ -1,18 +1,51 @@
+import io
 import re
+import sys
+import functools
 import collections
+from array import array
 
 
 
-KEYWORDS = [
+KEYWORDS = frozenset([
 	'class', 'constructor', 'function', 'method', 'field', 'static',
 	'var', 'int', 'char', 'boolean', 'void', 'true', 'false',
 	'null', 'this', 'let', 'do', 'if', 'else', 'while', 'return'
-]
+])
 
-SYMBOLS = [
+SYMBOLS = frozenset([
 	'{', '}', '(', ')', '[', ']', '.', ',', ';', '+', '-', '*',
 	'/', '&', '|', '<', '>', '=', '~'
-]
+])
+
+# data structure representing a token
+TOKEN = collections.namedtuple('TOKEN', 'value type')
+
+# token types are kept as small integer codes, TOKEN_TYPES maps a code back to its name
+KEYWORD, SYMBOL, IDENTIFIER, INT_CONST, STRING_CONST = range(5)
+TOKEN_TYPES = ('KEYWORD', 'SYMBOL', 'IDENTIFIER', 'INT_CONST', 'STRING_CONST')
+TYPE_CODES = {name: code for code, name in enumerate(TOKEN_TYPES)}
+
+# master pattern of the single pass lexer, one named group per lexical category.
+# whitespace and comments are matched so they can be skipped, an opening quote or
+# comment that is never closed is caught by the unterminated group
+TOKEN_PATTERN = re.compile(r'''
+	(?P<skip>\s+|//[^\n]*|/\*.*?\*/)
+	| "(?P<string>[^"\n]*)"
+	| (?P<int>\d+)
+	| (?P<word>[A-Za-z_]\w*)
+	| (?P<unterminated>/\*|")
+	| (?P<symbol>[{}()\[\].,;+\-*/&|<>=~])
+''', re.VERBOSE | re.DOTALL)
+
+# type code of every token group of the master pattern, a word is a keyword
+# when it is found in KEYWORDS
+GROUP_CODES = {
+	'word': IDENTIFIER,
+	'symbol': SYMBOL,
+	'int': INT_CONST,
+	'string': STRING_CONST,
+}
 
 def is_symbol(s):
 	return s in SYMBOLS
@@ -83,6 +116,197 @@ def get_comment_length(text):
 
 	return len(comment_text)
 
+def scan_tokens(jack_text):
+	"""
+	Yields the tokens of jack_text in one pass of the master pattern.
+
+	the text is never sliced, every match starts where the previous one ended.
+	"""
+
+	for value, code, line, column in scan_codes(jack_text):
+		yield TOKEN(value, TOKEN_TYPES[code])
+
+def scan_codes(jack_text):
+	"""
+	Yields (value, type code, line, column) for every token of jack_text.
+
+	the whole text is handed to the lexer as a single chunk.
+	"""
+
+	return lex_codes(functools.partial(next, iter([jack_text]), ''))
+
+def legacy_scan_tokens(jack_text):
+	"""
+	Yields the tokens of jack_text by marching through it one character at a time.
+
+	this is the original lexer, it is kept to compare against the single pass one.
+	"""
+
+	i = 0
+	current_token = ''
+	while i < len(jack_text):
+		"""while loop is used instead of for..loop because the index i is used
+		to jump over text as needed
+		"""
+		ch = jack_text[i]
+
+		# handling inline comments and comment blocks
+		if is_slash(ch):
+			# not to include the dividing slash
+			next_ch = jack_text[i + 1]
+			if start_of_comment(ch, next_ch):
+				comment_length = get_comment_length(jack_text[i:])
+
+				# jump after the end of comment
+				i += comment_length
+				continue
+
+		# handling string constants
+		if is_quote(ch):
+			quoted_text = get_quoted_text(jack_text[i:])
+			yield TOKEN(quoted_text[1:-1], 'STRING_CONST')
+
+			# jump after the end of quote
+			i += len(quoted_text)
+			
+			# start looking for a new token
+			current_token = ''
+			continue
+
+		# a boundry is hit, inspect current token
+		if is_whitespace(ch) or is_symbol(ch):
+			if is_keyword(current_token):
+				yield TOKEN(current_token, 'KEYWORD')
+			elif current_token.isdigit():
+				yield TOKEN(current_token, 'INT_CONST')
+			else:
+				# not to count any block of whitespace as identifier 
+				if not is_whitespace(current_token):
+					yield TOKEN(current_token, 'IDENTIFIER')
+
+			# if the boundry is symbol, add it as token
+			if is_symbol(ch):
+				yield TOKEN(ch, 'SYMBOL')
+
+			# start looking for a new token
+			current_token = ''
+		else:
+			# if no boundry, continue marching through text
+			current_token += ch
+
+		# go to next character
+		i += 1
+
+# characters read at a time by the streaming lexer
+CHUNK_SIZE = 64 * 1024
+
+def stream_codes(jack_file, chunk_size=CHUNK_SIZE):
+	"""Yields (value, type code, line, column) for every token of an open Jack file"""
+
+	return lex_codes(functools.partial(jack_file.read, chunk_size))
+
+def lex_codes(read_chunk):
+	"""
+	Yields (value, type code, line, column) for every token of the text returned
+	by successive read_chunk() calls, an empty chunk marks the end of input.
+
+	only the unconsumed tail of the current chunk is kept, a match that reaches
+	the end of the buffer may continue in the next chunk so more text is read
+	before it is trusted. token text is interned so repeated names share one string.
+	"""
+
+	match = TOKEN_PATTERN.match
+	intern = sys.intern
+	buffer = ''
+	pos = 0
+	line = 1
+	# buffer offset where the current line starts, to compute columns
+	line_start = 0
+	eof = False
+	while True:
+		m = match(buffer, pos) if pos < len(buffer) else None
+		incomplete = m is None or m.end() == len(buffer) or m.lastgroup == 'unterminated'
+		if incomplete and not eof:
+			chunk = read_chunk()
+			eof = not chunk
+			buffer = buffer[pos:] + chunk
+			line_start -= pos
+			pos = 0
+			continue
+
+		if pos >= len(buffer):
+			return
+		if m is None or m.lastgroup == 'unterminated':
+			raise ValueError(f'Unexpected character {buffer[pos]!r} at line {line}')
+
+		kind = m.lastgroup
+		end = m.end()
+		if kind == 'skip':
+			# only whitespace and comments can span lines
+			newlines = buffer.count('\n', pos, end)
+			if newlines:
+				line += newlines
+				line_start = buffer.rindex('\n', pos, end) + 1
+		else:
+			value = intern(m.group(kind))
+			code = GROUP_CODES[kind]
+			if code == IDENTIFIER and value in KEYWORDS:
+				code = KEYWORD
+			yield value, code, line, pos - line_start + 1
+		pos = end
+
+class TokenStore:
+	"""
+	Compact storage for a tokenized file.
+
+	token text is interned and kept in one list, type codes and the line and
+	column of every token are kept in parallel arrays. indexing or iterating
+	gives back TOKEN(value, type) tuples.
+	"""
+
+	__slots__ = ('values', 'types', 'lines', 'columns')
+
+	def __init__(self):
+		self.values = []
+		self.types = array('B')
+		self.lines = array('i')
+		self.columns = array('i')
+
+	def __len__(self):
+		return len(self.values)
+
+	def __getitem__(self, index):
+		return TOKEN(self.values[index], TOKEN_TYPES[self.types[index]])
+
+	def __iter__(self):
+		for value, code in zip(self.values, self.types):
+			yield TOKEN(value, TOKEN_TYPES[code])
+
+	def append(self, value, code, line=0, column=0):
+		self.values.append(value)
+		self.types.append(code)
+		self.lines.append(line)
+		self.columns.append(column)
+
+	def extend(self, tokens):
+		"""adds (value, type code, line, column) tuples"""
+
+		for value, code, line, column in tokens:
+			self.values.append(value)
+			self.types.append(code)
+			self.lines.append(line)
+			self.columns.append(column)
+
+	def codes(self):
+		"""iterates the tokens as (value, type code, line, column)"""
+
+		return zip(self.values, self.types, self.lines, self.columns)
+
+LEXERS = {
+	'regex': scan_tokens,
+	'legacy': legacy_scan_tokens,
+}
+
 class JackTokenizer:
 	"""
 	The input is a Jack program file written in Jack programming language.
@@ -95,22 +319,30 @@ class JackTokenizer:
 	SYMBOL, etc. These categories are defined in the compiler specification.
 	"""
 	
-	CURRENT_TOKEN_INDEX = -1
-	OUTPUT_TOKENS = []
+	def __init__(self, input_file=None, source=None, lexer='regex', streaming=False):
+		"""
+		the input is either a path to a .jack file or the Jack source text itself.
+
+		lexer picks the scanner from LEXERS, the single pass 'regex' one by default
+		or the original character by character 'legacy' one.
+
+		with streaming=True the input is read in chunks and tokens are produced
+		on demand as the engine advances, so get_token_text() stays empty and
+		memory does not grow with the number of tokens.
+
+		all the state lives on the instance, so several tokenizers can be used
+		at the same time in one process.
+		"""
 
-	def __init__(self, input_file):
 		self.input_file = input_file
+		self.source = source
+		self.lexer = lexer
+		self.streaming = streaming
 		self.cur_token = None
+		self.output_tokens = TokenStore()
+		# tokens pulled from the stream but not consumed yet
+		self.lookahead = collections.deque()
 		self.tokenize_input()
-	
-	def __del__(self):
-		"""
-		destructor method is called so that the class variables are reinitialized
-		for any new instance created
-		"""
-		
-		JackTokenizer.CURRENT_TOKEN_INDEX = -1
-		JackTokenizer.OUTPUT_TOKENS = []
 		
 	def __getattr__(self, attr):
 		err_msg = 'Invalid attribute for current token type.'
@@ -127,85 +359,70 @@ class JackTokenizer:
 		return token_type
 	
 	def get_token_text(self):
-		return JackTokenizer.OUTPUT_TOKENS
+		return self.output_tokens
 	
-	def add_to_tokens(self, token):
-		JackTokenizer.OUTPUT_TOKENS.append(token)
+	def read_input(self):
+		if self.source is not None:
+			return self.source
 
-	def tokenize_input(self):
 		with open(self.input_file) as jack_file:
-			jack_text = jack_file.read()
+			return jack_file.read()
 
-			# data structure representing a token
-			TOKEN = collections.namedtuple('TOKEN', 'value type')
+	def open_input(self):
+		if self.source is not None:
+			return io.StringIO(self.source)
+		return open(self.input_file)
 
-			i = 0
-			current_token = ''
-			while i < len(jack_text):
-				"""while loop is used instead of for..loop because the index i is used
-				to jump over text as needed
-				"""
-				ch = jack_text[i]
-
-				# handling inline comments and comment blocks
-				if is_slash(ch):
-					# not to include the dividing slash
-					next_ch = jack_text[i + 1]
-					if start_of_comment(ch, next_ch):
-						comment_length = get_comment_length(jack_text[i:])
-
-						# jump after the end of comment
-						i += comment_length
-						continue
-
-				# handling string constants
-				if is_quote(ch):
-					quoted_text = get_quoted_text(jack_text[i:])
-					self.add_to_tokens(TOKEN(quoted_text[1:-1], 'STRING_CONST'))
-
-					# jump after the end of quote
-					i += len(quoted_text)
-					
-					# start looking for a new token
-					current_token = ''
-					continue
-
-				# a boundry is hit, inspect current token
-				if is_whitespace(ch) or is_symbol(ch):
-					if is_keyword(current_token):
-						self.add_to_tokens(TOKEN(current_token, 'KEYWORD'))
-					elif current_token.isdigit():
-						self.add_to_tokens(TOKEN(current_token, 'INT_CONST'))
-					else:
-						# not to count any block of whitespace as identifier 
-						if not is_whitespace(current_token):
-							self.add_to_tokens(TOKEN(current_token, 'IDENTIFIER'))
-
-					# if the boundry is symbol, add it as token
-					if is_symbol(ch):
-						self.add_to_tokens(TOKEN(ch, 'SYMBOL'))
-
-					# start looking for a new token
-					current_token = ''
-				else:
-					# if no boundry, continue marching through text
-					current_token += ch
-
-				# go to next character
-				i += 1
+	def generate_tokens(self):
+		with self.open_input() as jack_file:
+			yield from stream_codes(jack_file)
+
+	def tokenize_input(self):
+		if self.streaming:
+			self.token_stream = self.generate_tokens()
+			return
+
+		jack_text = self.read_input()
+		if self.lexer == 'regex':
+			tokens = scan_codes(jack_text)
+		else:
+			# other lexers only know the (value, type) of their tokens
+			scan = LEXERS[self.lexer]
+			tokens = ((value, TYPE_CODES[_type], 0, 0) for value, _type in scan(jack_text))
+		self.output_tokens.extend(tokens)
+		self.token_stream = self.output_tokens.codes()
+
+	def peek_token(self, offset=1):
+		"""
+		returns the token offset positions after the current one without
+		consuming it, as (value, type code, line, column), or None past the
+		end of input.
+		"""
+
+		while len(self.lookahead) < offset:
+			token = next(self.token_stream, None)
+			if token is None:
+				return None
+			self.lookahead.append(token)
+		return self.lookahead[offset - 1]
 
 	def has_more_tokens(self):
-		return JackTokenizer.CURRENT_TOKEN_INDEX < len(JackTokenizer.OUTPUT_TOKENS) - 1
+		return self.peek_token() is not None
 
 	def advance(self):
 		if self.has_more_tokens():
-			JackTokenizer.CURRENT_TOKEN_INDEX += 1
-			self.cur_token = JackTokenizer.OUTPUT_TOKENS[JackTokenizer.CURRENT_TOKEN_INDEX]
-		else:
-			JackTokenizer.CURRENT_TOKEN_INDEX += 1
+			self.cur_token = self.lookahead.popleft()
 
 	def current_token(self):
-		return self.cur_token.value
+		return self.cur_token[0]
 		
 	def token_type(self):
-		return self.cur_token.type
\ No newline at end of file
+		return TOKEN_TYPES[self.cur_token[1]]
+
+	def token_code(self):
+		"""the type of the current token as one of the integer codes KEYWORD, SYMBOL, etc."""
+
+		return self.cur_token[1]
+
+	def current_line(self):
+		return self.cur_token[2]
\ No newline at end of file
@@ -0,0 +1,388 @@
+import functools
+from vm_interpreter import (
+	PUSH_CONSTANT, PUSH_LOCAL, PUSH_ARGUMENT, PUSH_THIS, PUSH_THAT, PUSH_ADDRESS,
+	POP_LOCAL, POP_ARGUMENT, POP_THIS, POP_THAT, POP_ADDRESS,
+	ADD, SUB, NEG, EQ, GT, LT, AND, OR, NOT,
+	GOTO, IF_GOTO, CALL, CALL_OS, FUNCTION, RETURN,
+	SP, LCL, THIS, THAT, STACK_END, FRAME_SIZE, VMError
+)
+
+
+
+"""
+
+Fast path of the VM interpreter, every function of a loaded program is
+translated once into the source of a Python function which is then
+compiled and run instead of dispatching each instruction.
+
+The code of a function is split into basic blocks at jump targets. Inside
+a block the VM stack is tracked at translation time, a push becomes a
+Python expression and an arithmetic instruction combines the expressions
+on top of it, so a whole statement becomes one assignment, ex:
+
+push local 0       >>  ram[lcl] = ((((ram[lcl] + 1) + 32768) & 65535) - 32768)
+push constant 1
+add
+pop local 0
+
+Values only go through the RAM stack where a block ends or before a call.
+A block is an `if block == n:` test in a loop, a forward jump falls through
+the tests and a backward jump restarts the loop.
+
+A VM call is a call of the Python function of the callee with the address
+of its arguments and locals, a callee that sets THIS or THAT saves and
+restores them, the return value is a Python value. The frame words are
+reserved on the stack but not written, nothing reads them.
+
+The generated code counts the same executed instructions as the
+interpreter loop and leaves the same RAM outside the stack: pointers,
+temps, statics, heap and screen, and the same output. The stack, RAM
+256..2047, differs since the frames are not written and the values a
+block keeps in Python never reach it.
+
+"""
+
+# python expression of a 16-bit wrapped sum, parenthesized as a whole
+# since it becomes the operand of *, - and ~
+WRAP = '(((({}) + 32768) & 65535) - 32768)'
+
+class Entry:
+	"""
+	a value of the VM stack during translation, code is a Python expression,
+	reads is True when it reads the RAM and condition True when code is a
+	Python boolean standing for the VM values -1 (true) and 0 (false)
+	"""
+
+	__slots__ = ('code', 'reads', 'condition')
+
+	def __init__(self, code, reads=False, condition=False):
+		self.code = code
+		self.reads = reads
+		self.condition = condition
+
+	def value(self):
+		return f'(-1 if {self.code} else 0)' if self.condition else self.code
+
+	def test(self):
+		return self.code if self.condition else f'{self.code} != 0'
+
+def offset(base, x):
+	return f'{base} + {x}' if x else base
+
+class FunctionTranslator:
+	"""translates the operations start..end of a program into a Python function"""
+
+	def __init__(self, program, name, start, end):
+		self.program = program
+		self.name = name
+		self.start = start
+		self.end = end
+		self.lines = []
+		self.stack = []
+		self.temps = 0
+		# indentation of the code of a block
+		self.indent = 3
+
+	def emit(self, line, depth=0):
+		"""emits a line of the current block, depth is the nesting inside it"""
+
+		self.lines.append('\t' * (self.indent + depth) + line)
+
+	def new_temp(self):
+		self.temps += 1
+		return f't{self.temps}'
+
+	def materialize(self, entry):
+		"""computes entry into a Python local now, so later stores cannot change it"""
+
+		temp = self.new_temp()
+		self.emit(f'{temp} = {entry.value()}')
+		return Entry(temp)
+
+	def protect_stack(self):
+		"""materializes every value of the stack that depends on the RAM"""
+
+		self.stack[:] = [
+			self.materialize(entry) if entry.reads else entry
+			for entry in self.stack
+		]
+
+	def pop(self):
+		if self.stack:
+			return self.stack.pop()
+		# the value was left on the RAM stack by a previous block
+		temp = self.new_temp()
+		self.emit('sp -= 1')
+		self.emit(f'{temp} = ram[sp]')
+		return Entry(temp)
+
+	def spill(self):
+		"""writes the stack tracked so far to the RAM stack"""
+
+		if not self.stack:
+			return
+		values = [entry.value() for entry in self.stack]
+		if len(values) == 1:
+			self.emit(f'ram[sp] = {values[0]}')
+		else:
+			self.emit(f'ram[sp:sp + {len(values)}] = ({", ".join(values)})')
+		self.emit(f'sp += {len(values)}')
+		self.stack = []
+
+	def store(self, target, entry):
+		value = entry.value()
+		self.protect_stack()
+		self.emit(f'{target} = {value}')
+
+	def writes_pointers(self):
+		"""True when the function may change THIS or THAT, which it must then restore"""
+
+		program = self.program
+		for position in range(self.start, self.end):
+			operation = program.operations[position]
+			if operation == POP_ADDRESS and program.args1[position] in (THIS, THAT):
+				return True
+			if operation == CALL_OS and program.os_names[program.args1[position]] == 'Memory.poke':
+				return True
+		return False
+
+	def block_leaders(self):
+		operations, args1 = self.program.operations, self.program.args1
+		leaders = set([self.start])
+		for position in range(self.start, self.end):
+			if operations[position] in (GOTO, IF_GOTO):
+				leaders.add(args1[position])
+				leaders.add(position + 1)
+			elif operations[position] == RETURN:
+				leaders.add(position + 1)
+		return sorted(leader for leader in leaders if leader < self.end)
+
+	def translate(self):
+		"""returns the source of the Python function"""
+
+		program = self.program
+		n_locals = program.args2[self.start]
+		leaders = self.block_leaders()
+		block_numbers = {leader: number for number, leader in enumerate(leaders)}
+
+		self.restores_pointers = self.writes_pointers()
+
+		self.indent = 0
+		# ram is bound as a default argument, a local is faster to read than a global
+		self.emit(f'def {self.name}(arg, lcl, ram=ram):')
+		self.indent = 1
+		self.emit('global steps')
+		self.emit(f'if lcl + {n_locals} >= {STACK_END}:')
+		self.emit("raise VMError('stack overflow')", 1)
+		self.emit('if steps >= limit:')
+		self.emit("raise VMError(f'stopped after {steps} steps')", 1)
+		if self.restores_pointers:
+			self.emit(f'saved_this = ram[{THIS}]')
+			self.emit(f'saved_that = ram[{THAT}]')
+		if len(leaders) > 1:
+			self.emit('block = 0')
+			self.emit('while True:')
+
+		bounds = leaders[1:] + [self.end]
+		for number, (first, last) in enumerate(zip(leaders, bounds)):
+			if len(leaders) > 1:
+				self.indent = 2
+				self.emit(f'if block == {number}:')
+				self.indent = 3
+			self.emit(f'steps += {last - first}')
+			ends_with_jump = False
+			for position in range(first, last):
+				ends_with_jump = self.translate_operation(position, block_numbers, number)
+			if not ends_with_jump:
+				self.spill()
+				if last < self.end:
+					self.emit(f'block = {number + 1}')
+				else:
+					self.emit("raise VMError('function ends without a return')")
+		return '\n'.join(self.lines) + '\n'
+
+	def jump(self, target_number, number, condition=None):
+		backward = target_number <= number
+		if condition is None:
+			self.emit(f'block = {target_number}')
+			if backward:
+				self.emit('if steps >= limit:')
+				self.emit("raise VMError(f'stopped after {steps} steps')", 1)
+				self.emit('continue')
+		elif backward:
+			self.emit(f'if {condition}:')
+			self.emit(f'block = {target_number}', 1)
+			self.emit('if steps >= limit:', 1)
+			self.emit("raise VMError(f'stopped after {steps} steps')", 2)
+			self.emit('continue', 1)
+			self.emit(f'block = {number + 1}')
+		else:
+			self.emit(f'block = {target_number} if {condition} else {number + 1}')
+
+	def translate_operation(self, position, block_numbers, number):
+		"""translates one operation, returns True when it ends its block"""
+
+		program = self.program
+		operation = program.operations[position]
+		x = program.args1[position]
+		y = program.args2[position]
+		stack = self.stack
+
+		if operation == PUSH_CONSTANT:
+			stack.append(Entry(str(x)))
+		elif operation == PUSH_LOCAL:
+			stack.append(Entry(f'ram[{offset("lcl", x)}]', True))
+		elif operation == PUSH_ARGUMENT:
+			stack.append(Entry(f'ram[{offset("arg", x)}]', True))
+		elif operation == PUSH_THIS:
+			stack.append(Entry(f'ram[{offset(f"ram[{THIS}]", x)}]', True))
+		elif operation == PUSH_THAT:
+			stack.append(Entry(f'ram[{offset(f"ram[{THAT}]", x)}]', True))
+		elif operation == PUSH_ADDRESS:
+			stack.append(Entry(f'ram[{x}]', True))
+		elif operation == POP_LOCAL:
+			self.store(f'ram[{offset("lcl", x)}]', self.pop())
+		elif operation == POP_ARGUMENT:
+			self.store(f'ram[{offset("arg", x)}]', self.pop())
+		elif operation == POP_THIS:
+			self.store(f'ram[{offset(f"ram[{THIS}]", x)}]', self.pop())
+		elif operation == POP_THAT:
+			self.store(f'ram[{offset(f"ram[{THAT}]", x)}]', self.pop())
+		elif operation == POP_ADDRESS:
+			self.store(f'ram[{x}]', self.pop())
+		elif operation in (ADD, SUB):
+			right = self.pop()
+			left = self.pop()
+			sign = '+' if operation == ADD else '-'
+			code = WRAP.format(f'{left.value()} {sign} {right.value()}')
+			stack.append(Entry(code, left.reads or right.reads))
+		elif operation == NEG:
+			operand = self.pop()
+			stack.append(Entry(WRAP.format(f'-{operand.value()}'), operand.reads))
+		elif operation == NOT:
+			operand = self.pop()
+			if operand.condition:
+				stack.append(Entry(f'not ({operand.code})', operand.reads, True))
+			else:
+				stack.append(Entry(f'~{operand.code}', operand.reads))
+		elif operation in (AND, OR):
+			right = self.pop()
+			left = self.pop()
+			reads = left.reads or right.reads
+			if left.condition and right.condition:
+				junction = 'and' if operation == AND else 'or'
+				stack.append(Entry(f'({left.code}) {junction} ({right.code})', reads, True))
+			else:
+				sign = '&' if operation == AND else '|'
+				stack.append(Entry(f'({left.value()} {sign} {right.value()})', reads))
+		elif operation in (EQ, GT, LT):
+			right = self.pop()
+			left = self.pop()
+			comparison = {EQ: '==', GT: '>', LT: '<'}[operation]
+			code = f'{left.value()} {comparison} {right.value()}'
+			stack.append(Entry(code, left.reads or right.reads, True))
+		elif operation == GOTO:
+			self.spill()
+			self.jump(block_numbers[x], number)
+			return True
+		elif operation == IF_GOTO:
+			condition = self.pop()
+			test = condition.test()
+			if self.stack:
+				# the condition is computed before the stack is written back
+				test = self.materialize(condition).code + ' != 0'
+			self.spill()
+			self.jump(block_numbers[x], number, test)
+			return True
+		elif operation == CALL:
+			values = [self.pop().value() for _ in range(y)][::-1]
+			self.protect_stack()
+			# the arguments go where the callee reads them, above the RAM stack
+			if y == 1:
+				self.emit(f'ram[sp] = {values[0]}')
+			elif y > 1:
+				self.emit(f'ram[sp:sp + {y}] = ({", ".join(values)})')
+			temp = self.new_temp()
+			self.emit(f'{temp} = f{x}(sp, sp + {y + FRAME_SIZE})')
+			self.stack.append(Entry(temp))
+		elif operation == CALL_OS:
+			args = [self.pop() for _ in range(y)][::-1]
+			if program.os_names[x] == 'Math.multiply':
+				# pure, computed inline
+				code = WRAP.format(f'{args[0].value()} * {args[1].value()}')
+				stack.append(Entry(code, args[0].reads or args[1].reads))
+				return False
+			values = ''.join(f', {arg.value()}' for arg in args)
+			self.protect_stack()
+			temp = self.new_temp()
+			self.emit(f'{temp} = os{x}(machine{values})')
+			self.stack.append(Entry(temp))
+		elif operation == FUNCTION:
+			for index in range(y):
+				self.emit(f'ram[lcl + {index}] = 0')
+			self.emit(f'sp = lcl + {y}')
+		elif operation == RETURN:
+			value = self.pop().value()
+			if self.restores_pointers:
+				self.emit(f'value = {value}')
+				self.emit(f'ram[{THIS}] = saved_this')
+				self.emit(f'ram[{THAT}] = saved_that')
+				self.emit('return value')
+			else:
+				self.emit(f'return {value}')
+			self.stack = []
+			return True
+		return False
+
+@functools.lru_cache(maxsize=None)
+def compile_source(source):
+	"""compiled code of a generated source, a program is only compiled once per process"""
+
+	return compile(source, '<vm fast path>', 'exec')
+
+def program_source(program):
+	"""returns the source of the Python functions of every function of program"""
+
+	starts = sorted(program.functions.values())
+	ends = starts[1:] + [len(program.operations)]
+	return ''.join(
+		FunctionTranslator(program, f'f{start}', start, end).translate()
+		for start, end in zip(starts, ends)
+	)
+
+class FastPath:
+	"""
+	The translated functions of a VirtualMachine, run() has the same
+	interface as VirtualMachine.run.
+	"""
+
+	def __init__(self, machine):
+		self.machine = machine
+		self.source = program_source(machine)
+		self.namespace = {
+			'ram': machine.ram,
+			'machine': machine,
+			'VMError': VMError,
+			'steps': 0,
+			'limit': 0,
+		}
+		for index, function in enumerate(machine.os_functions):
+			self.namespace[f'os{index}'] = function
+		exec(compile_source(self.source), self.namespace)
+
+	def run(self, function, arg, lcl, max_steps=None):
+		"""calls the function whose arguments are at arg and locals at lcl"""
+
+		namespace = self.namespace
+		namespace['steps'] = 0
+		namespace['limit'] = max_steps if max_steps is not None else float('inf')
+		ram = self.machine.ram
+		try:
+			value = namespace[f'f{self.machine.functions[function]}'](arg, lcl)
+		finally:
+			self.machine.steps += namespace['steps']
+		# returns into the bootstrap frame like the interpreter does
+		ram[arg] = value
+		ram[SP] = arg + 1
+		ram[LCL:THAT + 1] = ram[lcl - 4:lcl]
+		return value
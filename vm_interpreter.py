@@ -0,0 +1,672 @@
+import sys, os
+import time
+import math
+import argparse
+import vm_writer as vm
+from vm_writer import parse_vm
+from expression import WORD_MIN, WORD_MAX, wrap, divide
+from tokenizer import JackTokenizer
+from compilation_engine import CompilationEngine
+from signature_index import scan_files
+
+
+
+"""
+
+Headless execution engine for the VM code of a Jack program.
+
+The code is loaded either straight from the instruction stream of the
+VMWriter of every class or from parsed .vm text, and translated once into
+a flat program of integer operations: push and pop are specialized per
+segment, static, temp and pointer operands become RAM addresses, labels
+are dropped and jumps and calls hold the index of their target. The
+interpreter loop then only does integer and list work.
+
+RAM is a list of 32K words, reading a list item is cheaper than reading an
+array item which boxes the value every time, laid out as on the Hack platform:
+
+0..4          SP, LCL, ARG, THIS, THAT
+5..12         temp segment
+16..255       static variables, one block per class in load order
+256..2047     stack
+2048..16383   heap
+16384..24575  screen, 512 x 256 pixels
+24576         keyboard
+
+Every value is kept as a signed 16-bit word, arithmetic wraps around as
+the Hack ALU does.
+
+The OS classes are Python stubs working on the same RAM, see OS_FUNCTIONS.
+Keyboard input is scripted, Sys.wait does not wait and Output appends its
+text to VirtualMachine.output.
+
+"""
+
+SP, LCL, ARG, THIS, THAT = range(5)
+TEMP_BASE = 5
+STATIC_BASE = 16
+STATIC_END = 256
+STACK_BASE = 256
+STACK_END = 2048
+HEAP_BASE = 2048
+HEAP_END = 16384
+SCREEN = 16384
+SCREEN_WIDTH = 512
+SCREEN_HEIGHT = 256
+KBD = 24576
+RAM_SIZE = 32768
+
+# size of the frame a call pushes, return address, LCL, ARG, THIS, THAT
+FRAME_SIZE = 5
+
+# return address of the bootstrap frame, returning to it ends the run
+HALT_ADDRESS = -1
+
+# operations of a loaded program
+(
+	PUSH_CONSTANT, PUSH_LOCAL, PUSH_ARGUMENT, PUSH_THIS, PUSH_THAT, PUSH_ADDRESS,
+	POP_LOCAL, POP_ARGUMENT, POP_THIS, POP_THAT, POP_ADDRESS,
+	ADD, SUB, NEG, EQ, GT, LT, AND, OR, NOT,
+	GOTO, IF_GOTO, CALL, CALL_OS, FUNCTION, RETURN
+) = range(26)
+
+# segments addressed from a base pointer
+POINTER_SEGMENTS = {
+	'local': (PUSH_LOCAL, POP_LOCAL),
+	'argument': (PUSH_ARGUMENT, POP_ARGUMENT),
+	'this': (PUSH_THIS, POP_THIS),
+	'that': (PUSH_THAT, POP_THAT),
+}
+
+# VM opcodes that map one to one to an operation
+ARITHMETIC_OPERATIONS = {
+	vm.ADD: ADD, vm.SUB: SUB, vm.NEG: NEG, vm.EQ: EQ, vm.GT: GT,
+	vm.LT: LT, vm.AND: AND, vm.OR: OR, vm.NOT: NOT, vm.RETURN: RETURN,
+}
+
+class VMError(RuntimeError):
+	"""an error of the running program, ex: a division by zero or a full heap"""
+
+class Halt(Exception):
+	"""raised by Sys.halt to stop the program"""
+
+def to_word(value):
+	"""returns the signed 16-bit word of an unsigned one"""
+
+	return value - 0x10000 if value > WORD_MAX else value
+
+class VirtualMachine:
+	"""
+	Loads the VM code of a whole program and runs it.
+
+	instructions is a list of vm_writer.Instruction holding every function
+	of the program, keys a script of the values Keyboard.keyPressed returns,
+	one per call, the last value is held once the script runs out.
+
+	run() calls Main.main, or Sys.init when the program defines it, and
+	returns the value it returns. steps counts the VM instructions executed.
+	"""
+
+	def __init__(self, instructions, keys=()):
+		self.ram = [0] * RAM_SIZE
+		self.operations = []
+		self.args1 = []
+		self.args2 = []
+		self.functions = {}
+		self.os_functions = []
+		self.os_names = []
+		self.static_bases = {}
+		self.load(instructions)
+		# translated on the first fast run, see vm_fastpath.py
+		self.translated = None
+
+		self.steps = 0
+		self.keys = iter(keys)
+		self.output = []
+		self.color = True
+		self.waited = 0
+		self.heap_top = HEAP_BASE
+		self.free_blocks = {}
+
+	@classmethod
+	def from_vm_texts(cls, vm_texts, **options):
+		"""loads the code of each class from its VM text"""
+
+		instructions = []
+		for vm_text in vm_texts:
+			instructions.extend(parse_vm(vm_text.splitlines()))
+		return cls(instructions, **options)
+
+	def static_address(self, class_name, index):
+		return STATIC_BASE + self.static_bases[class_name] + index
+
+	def allocate_statics(self, instructions):
+		"""
+		gives every class a block of static variables, in load order, from
+		the lowest index it uses to the highest. the statics of a linked
+		program do not start at 0 past its first class.
+		"""
+
+		bounds = {}
+		function_name = None
+		for opcode, arg1, arg2 in instructions:
+			if opcode == vm.FUNCTION:
+				function_name = arg1
+				bounds.setdefault(arg1.split('.')[0], None)
+			elif arg1 == 'static' and (opcode == vm.PUSH or opcode == vm.POP):
+				class_name = function_name.split('.')[0]
+				low, high = bounds[class_name] or (arg2, arg2)
+				bounds[class_name] = (min(low, arg2), max(high, arg2))
+
+		base = 0
+		for class_name, used in bounds.items():
+			low, high = used or (0, -1)
+			self.static_bases[class_name] = base - low
+			base += high - low + 1
+		if STATIC_BASE + base > STATIC_END:
+			raise ValueError(f'the program has {base} static variables, more than the static segment holds')
+
+	def load(self, instructions):
+		"""
+		translates the instructions into the operations of the program, two
+		passes, the first finds the index of every function and label
+		"""
+
+		self.allocate_statics(instructions)
+
+		labels = {}
+		function_name = None
+		position = 0
+		for opcode, arg1, arg2 in instructions:
+			if opcode == vm.FUNCTION:
+				function_name = arg1
+				if arg1 in self.functions:
+					raise ValueError(f'function {arg1} is defined twice')
+				self.functions[arg1] = position
+			elif opcode == vm.LABEL:
+				# labels are local to their function
+				labels[function_name, arg1] = position
+				continue
+			elif function_name is None:
+				raise ValueError('VM code found outside of a function')
+			position += 1
+
+		os_indexes = {}
+		for opcode, arg1, arg2 in instructions:
+			if opcode == vm.FUNCTION:
+				function_name = arg1
+				self.emit(FUNCTION, 0, arg2)
+			elif opcode == vm.LABEL:
+				continue
+			elif opcode == vm.PUSH or opcode == vm.POP:
+				self.emit_memory_access(opcode, arg1, arg2, function_name)
+			elif opcode == vm.GOTO or opcode == vm.IF_GOTO:
+				target = labels.get((function_name, arg1))
+				if target is None:
+					raise ValueError(f'{function_name}: label {arg1} is not defined')
+				self.emit(GOTO if opcode == vm.GOTO else IF_GOTO, target)
+			elif opcode == vm.CALL:
+				if arg1 in self.functions:
+					self.emit(CALL, self.functions[arg1], arg2)
+				elif arg1 in OS_FUNCTIONS:
+					if arg1 not in os_indexes:
+						os_indexes[arg1] = len(self.os_functions)
+						self.os_functions.append(OS_FUNCTIONS[arg1])
+						self.os_names.append(arg1)
+					self.emit(CALL_OS, os_indexes[arg1], arg2)
+				else:
+					raise ValueError(f'{function_name}: function {arg1} is not defined')
+			else:
+				self.emit(ARITHMETIC_OPERATIONS[opcode])
+
+	def emit(self, operation, arg1=0, arg2=0):
+		self.operations.append(operation)
+		self.args1.append(arg1)
+		self.args2.append(arg2)
+
+	def emit_memory_access(self, opcode, segment, index, function_name):
+		is_push = opcode == vm.PUSH
+		if segment == 'constant':
+			if not is_push:
+				raise ValueError(f'{function_name}: pop constant {index}')
+			self.emit(PUSH_CONSTANT, index)
+		elif segment in POINTER_SEGMENTS:
+			push, pop = POINTER_SEGMENTS[segment]
+			self.emit(push if is_push else pop, index)
+		else:
+			if segment == 'static':
+				address = self.static_address(function_name.split('.')[0], index)
+			elif segment == 'temp':
+				address = TEMP_BASE + index
+			else:
+				address = THIS + index
+			self.emit(PUSH_ADDRESS if is_push else POP_ADDRESS, address)
+
+	def fast_path(self):
+		"""returns the program translated into Python functions, on first use"""
+
+		if self.translated is None:
+			from vm_fastpath import FastPath
+			self.translated = FastPath(self)
+		return self.translated
+
+	def run(self, function=None, args=(), max_steps=None, fast=False):
+		"""
+		calls function with args and runs until it returns, Sys.halt is
+		called or max_steps instructions were executed, which raises VMError.
+		returns the value the function returned, or None when halted.
+
+		with fast the translated functions of fast_path() run instead of the
+		interpreter loop, with the same result.
+		"""
+
+		if function is None:
+			function = 'Sys.init' if 'Sys.init' in self.functions else 'Main.main'
+		if function not in self.functions:
+			raise ValueError(f'function {function} is not defined')
+
+		ram = self.ram
+		# bootstrap frame, the function returns to HALT_ADDRESS
+		sp = STACK_BASE
+		for value in args:
+			ram[sp] = wrap(value)
+			sp += 1
+		ram[sp] = HALT_ADDRESS
+		ram[sp + 1:sp + FRAME_SIZE] = [0] * (FRAME_SIZE - 1)
+		ram[ARG] = sp - len(args)
+		ram[SP] = ram[LCL] = sp + FRAME_SIZE
+		self.pc = self.functions[function]
+
+		try:
+			if fast:
+				return self.fast_path().run(function, ram[ARG], ram[LCL], max_steps)
+			return self.execute(max_steps)
+		except Halt:
+			return None
+
+	def execute(self, max_steps=None):
+		ram = self.ram
+		operations = self.operations
+		args1 = self.args1
+		args2 = self.args2
+		os_functions = self.os_functions
+		pc = self.pc
+		sp = ram[SP]
+		lcl = ram[LCL]
+		arg = ram[ARG]
+		steps = 0
+		# the limit is only checked on jumps and calls, the only way to loop
+		limit = max_steps if max_steps is not None else sys.maxsize
+
+		try:
+			while True:
+				operation = operations[pc]
+				x = args1[pc]
+				pc += 1
+				steps += 1
+
+				if operation == PUSH_CONSTANT:
+					ram[sp] = x
+					sp += 1
+				elif operation == PUSH_LOCAL:
+					ram[sp] = ram[lcl + x]
+					sp += 1
+				elif operation == PUSH_ARGUMENT:
+					ram[sp] = ram[arg + x]
+					sp += 1
+				elif operation == POP_LOCAL:
+					sp -= 1
+					ram[lcl + x] = ram[sp]
+				elif operation == IF_GOTO:
+					sp -= 1
+					if ram[sp]:
+						pc = x
+					if steps >= limit:
+						raise VMError(f'stopped after {steps} steps')
+				elif operation == PUSH_THIS:
+					ram[sp] = ram[ram[THIS] + x]
+					sp += 1
+				elif operation == PUSH_THAT:
+					ram[sp] = ram[ram[THAT] + x]
+					sp += 1
+				elif operation == PUSH_ADDRESS:
+					ram[sp] = ram[x]
+					sp += 1
+				elif operation == POP_ADDRESS:
+					sp -= 1
+					ram[x] = ram[sp]
+				elif operation == POP_THIS:
+					sp -= 1
+					ram[ram[THIS] + x] = ram[sp]
+				elif operation == POP_THAT:
+					sp -= 1
+					ram[ram[THAT] + x] = ram[sp]
+				elif operation == POP_ARGUMENT:
+					sp -= 1
+					ram[arg + x] = ram[sp]
+				elif operation == ADD:
+					sp -= 1
+					value = ram[sp - 1] + ram[sp]
+					ram[sp - 1] = ((value - WORD_MIN) & 0xFFFF) + WORD_MIN
+				elif operation == SUB:
+					sp -= 1
+					value = ram[sp - 1] - ram[sp]
+					ram[sp - 1] = ((value - WORD_MIN) & 0xFFFF) + WORD_MIN
+				elif operation == LT:
+					sp -= 1
+					ram[sp - 1] = -1 if ram[sp - 1] < ram[sp] else 0
+				elif operation == GT:
+					sp -= 1
+					ram[sp - 1] = -1 if ram[sp - 1] > ram[sp] else 0
+				elif operation == EQ:
+					sp -= 1
+					ram[sp - 1] = -1 if ram[sp - 1] == ram[sp] else 0
+				elif operation == NOT:
+					ram[sp - 1] = ~ram[sp - 1]
+				elif operation == AND:
+					sp -= 1
+					ram[sp - 1] &= ram[sp]
+				elif operation == OR:
+					sp -= 1
+					ram[sp - 1] |= ram[sp]
+				elif operation == NEG:
+					value = ram[sp - 1]
+					ram[sp - 1] = -value if value != WORD_MIN else value
+				elif operation == GOTO:
+					pc = x
+					if steps >= limit:
+						raise VMError(f'stopped after {steps} steps')
+				elif operation == CALL:
+					if sp >= STACK_END - FRAME_SIZE:
+						raise VMError('stack overflow')
+					ram[sp] = pc
+					ram[sp + 1] = lcl
+					ram[sp + 2] = arg
+					ram[sp + 3] = ram[THIS]
+					ram[sp + 4] = ram[THAT]
+					arg = sp - args2[pc - 1]
+					sp += FRAME_SIZE
+					lcl = sp
+					pc = x
+					if steps >= limit:
+						raise VMError(f'stopped after {steps} steps')
+				elif operation == FUNCTION:
+					for _ in range(args2[pc - 1]):
+						ram[sp] = 0
+						sp += 1
+				elif operation == RETURN:
+					frame = lcl
+					pc = ram[frame - 5]
+					ram[arg] = ram[sp - 1]
+					sp = arg + 1
+					ram[THAT] = ram[frame - 1]
+					ram[THIS] = ram[frame - 2]
+					arg = ram[frame - 3]
+					lcl = ram[frame - 4]
+					if pc == HALT_ADDRESS:
+						return ram[sp - 1]
+				elif operation == CALL_OS:
+					sp -= args2[pc - 1]
+					ram[SP] = sp
+					ram[sp] = os_functions[x](self, *ram[sp:sp + args2[pc - 1]])
+					sp += 1
+		finally:
+			ram[SP] = sp
+			ram[LCL] = lcl
+			ram[ARG] = arg
+			self.pc = pc
+			self.steps += steps
+
+	def output_text(self):
+		return ''.join(self.output)
+
+	# Memory, a block keeps its size in the word before it
+
+	def alloc(self, size):
+		if size <= 0:
+			raise VMError(f'Memory.alloc: size {size} must be positive')
+		free = self.free_blocks.get(size)
+		if free:
+			return free.pop()
+		block = self.heap_top + 1
+		if block + size > HEAP_END:
+			raise VMError('Memory.alloc: heap overflow')
+		self.ram[block - 1] = size
+		self.heap_top = block + size
+		return block
+
+	def de_alloc(self, block):
+		self.free_blocks.setdefault(self.ram[block - 1], []).append(block)
+		return 0
+
+	# Screen, a pixel is one bit of the screen memory map
+
+	def check_point(self, x, y):
+		if not (0 <= x < SCREEN_WIDTH and 0 <= y < SCREEN_HEIGHT):
+			raise VMError(f'Screen: illegal coordinates ({x}, {y})')
+
+	def fill_row(self, y, x1, x2):
+		"""sets the pixels x1..x2 of row y to the current color"""
+
+		ram = self.ram
+		row = SCREEN + y * (SCREEN_WIDTH // 16)
+		for word in range(x1 // 16, x2 // 16 + 1):
+			low = max(x1, word * 16) % 16
+			high = min(x2, word * 16 + 15) % 16
+			mask = ((1 << (high + 1)) - 1) ^ ((1 << low) - 1)
+			value = ram[row + word] & 0xFFFF
+			value = value | mask if self.color else value & ~mask
+			ram[row + word] = to_word(value)
+
+	def draw_rectangle(self, x1, y1, x2, y2):
+		self.check_point(x1, y1)
+		self.check_point(x2, y2)
+		if x1 > x2 or y1 > y2:
+			raise VMError(f'Screen.drawRectangle: illegal rectangle ({x1}, {y1}, {x2}, {y2})')
+		for y in range(y1, y2 + 1):
+			self.fill_row(y, x1, x2)
+		return 0
+
+	def draw_line(self, x1, y1, x2, y2):
+		self.check_point(x1, y1)
+		self.check_point(x2, y2)
+		steps = max(abs(x2 - x1), abs(y2 - y1))
+		for step in range(steps + 1):
+			x = x1 + (x2 - x1) * step // steps if steps else x1
+			y = y1 + (y2 - y1) * step // steps if steps else y1
+			self.fill_row(y, x, x)
+		return 0
+
+	def draw_circle(self, x, y, r):
+		self.check_point(x - r, y - r)
+		self.check_point(x + r, y + r)
+		for dy in range(-r, r + 1):
+			dx = math.isqrt(r * r - dy * dy)
+			self.fill_row(y + dy, x - dx, x + dx)
+		return 0
+
+	def clear_screen(self):
+		self.ram[SCREEN:KBD] = [0] * (KBD - SCREEN)
+		return 0
+
+	def set_color(self, color):
+		self.color = color != 0
+		return 0
+
+	def draw_pixel(self, x, y):
+		self.check_point(x, y)
+		self.fill_row(y, x, x)
+		return 0
+
+	# Keyboard
+
+	def key_pressed(self):
+		key = next(self.keys, None)
+		if key is not None:
+			self.ram[KBD] = key
+		return self.ram[KBD]
+
+	# String, an object holds its capacity, its length then its characters
+
+	def string_new(self, capacity):
+		if capacity < 0:
+			raise VMError(f'String.new: capacity {capacity} must not be negative')
+		string = self.alloc(capacity + 2)
+		self.ram[string] = capacity
+		self.ram[string + 1] = 0
+		return string
+
+	def append_char(self, string, char):
+		length = self.ram[string + 1]
+		if length >= self.ram[string]:
+			raise VMError('String.appendChar: string is full')
+		self.ram[string + 2 + length] = char
+		self.ram[string + 1] = length + 1
+		return string
+
+	def string_text(self, string):
+		start = string + 2
+		return ''.join(map(chr, self.ram[start:start + self.ram[string + 1]]))
+
+	def print_text(self, text):
+		self.output.append(text)
+		return 0
+
+def math_divide(machine, x, y):
+	if y == 0:
+		raise VMError('Math.divide: division by zero')
+	return wrap(divide(x, y))
+
+def math_sqrt(machine, x):
+	if x < 0:
+		raise VMError('Math.sqrt: negative argument')
+	return math.isqrt(x)
+
+def memory_poke(machine, address, value):
+	machine.ram[address] = value
+	return 0
+
+def sys_halt(machine):
+	raise Halt()
+
+def sys_error(machine, code):
+	raise VMError(f'Sys.error {code}')
+
+def sys_wait(machine, duration):
+	# a headless run does not wait, the total is kept for inspection
+	machine.waited += duration
+	return 0
+
+# the OS functions a program can call, each takes the machine and the
+# arguments of the call and returns the value pushed back on the stack
+OS_FUNCTIONS = {
+	'Math.multiply': lambda machine, x, y: wrap(x * y),
+	'Math.divide': math_divide,
+	'Math.min': lambda machine, x, y: min(x, y),
+	'Math.max': lambda machine, x, y: max(x, y),
+	'Math.abs': lambda machine, x: wrap(abs(x)),
+	'Math.sqrt': math_sqrt,
+	'Memory.alloc': lambda machine, size: machine.alloc(size),
+	'Memory.deAlloc': lambda machine, block: machine.de_alloc(block),
+	'Memory.peek': lambda machine, address: machine.ram[address],
+	'Memory.poke': memory_poke,
+	'Array.new': lambda machine, size: machine.alloc(size),
+	'Array.dispose': lambda machine, array: machine.de_alloc(array),
+	'String.new': lambda machine, capacity: machine.string_new(capacity),
+	'String.dispose': lambda machine, string: machine.de_alloc(string),
+	'String.appendChar': lambda machine, string, char: machine.append_char(string, char),
+	'String.length': lambda machine, string: machine.ram[string + 1],
+	'String.charAt': lambda machine, string, i: machine.ram[string + 2 + i],
+	'String.newLine': lambda machine: 128,
+	'String.backSpace': lambda machine: 129,
+	'String.doubleQuote': lambda machine: 34,
+	'Screen.clearScreen': lambda machine: machine.clear_screen(),
+	'Screen.setColor': lambda machine, color: machine.set_color(color),
+	'Screen.drawPixel': lambda machine, x, y: machine.draw_pixel(x, y),
+	'Screen.drawLine': lambda machine, x1, y1, x2, y2: machine.draw_line(x1, y1, x2, y2),
+	'Screen.drawRectangle': lambda machine, x1, y1, x2, y2: machine.draw_rectangle(x1, y1, x2, y2),
+	'Screen.drawCircle': lambda machine, x, y, r: machine.draw_circle(x, y, r),
+	'Keyboard.keyPressed': lambda machine: machine.key_pressed(),
+	'Output.moveCursor': lambda machine, i, j: 0,
+	'Output.printChar': lambda machine, char: machine.print_text(chr(char)),
+	'Output.printString': lambda machine, string: machine.print_text(machine.string_text(string)),
+	'Output.printInt': lambda machine, i: machine.print_text(str(i)),
+	'Output.println': lambda machine: machine.print_text('\n'),
+	'Output.backSpace': lambda machine: 0,
+	'Sys.halt': sys_halt,
+	'Sys.error': sys_error,
+	'Sys.wait': sys_wait,
+}
+
+def load_program(path, optimize=0):
+	"""
+	returns the instructions of the program at path, the Jack classes of a
+	directory or file are compiled in memory, otherwise its .vm files are parsed
+	"""
+
+	if os.path.isdir(path):
+		files = [os.path.join(path, name) for name in sorted(os.listdir(path))]
+	else:
+		files = [path]
+	jack = [file for file in files if file.endswith('.jack')]
+
+	instructions = []
+	if jack:
+		# the instruction stream of each writer is used as is, no VM text
+		signatures = scan_files(jack)
+		for file in jack:
+			c_engine = CompilationEngine(JackTokenizer(file), optimize=optimize, signatures=signatures)
+			instructions.extend(c_engine.vm_writer.instructions())
+		return instructions
+	for file in files:
+		if file.endswith('.vm'):
+			with open(file) as f:
+				instructions.extend(parse_vm(f))
+	return instructions
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description='Runs the VM code of a Jack program.')
+	parser.add_argument('path', help='a directory or file of .jack classes, or of .vm files')
+	parser.add_argument(
+		'--keys', default='',
+		help='comma separated key codes Keyboard.keyPressed returns, one per call, ex: 0,133,0,81,0'
+	)
+	parser.add_argument(
+		'--max-steps', type=int, default=None,
+		help='stop with an error after this many VM instructions'
+	)
+	parser.add_argument(
+		'--fast', action='store_true',
+		help='translate every function into Python once and run that instead of the interpreter loop'
+	)
+	parser.add_argument(
+		'-O', dest='optimize', type=int, choices=[0, 1], default=0,
+		help='optimization level used to compile .jack sources'
+	)
+	args = parser.parse_args(argv)
+
+	keys = [int(key) for key in args.keys.split(',') if key]
+	machine = VirtualMachine(load_program(args.path, args.optimize), keys=keys)
+	if args.fast:
+		# the translation is not part of the timed run
+		machine.fast_path()
+	start = time.perf_counter()
+	try:
+		value = machine.run(max_steps=args.max_steps, fast=args.fast)
+	except VMError as e:
+		print(f'{args.path}: {e}', file=sys.stderr)
+		return 1
+	finally:
+		elapsed = time.perf_counter() - start
+		sys.stdout.write(machine.output_text())
+		rate = machine.steps / elapsed if elapsed else 0
+		print(
+			f'{args.path}: {machine.steps} instructions in {elapsed:.3f} s, '
+			f'{rate / 1e6:.2f} M instructions/s',
+			file=sys.stderr
+		)
+	print(f'returned {value}', file=sys.stderr)
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -1,66 +1,182 @@
+import collections
+from array import array
+
+
+
+# opcodes of the VM instructions
+(
+	PUSH, POP, ADD, SUB, NEG, EQ, GT, LT, AND, OR, NOT,
+	LABEL, GOTO, IF_GOTO, CALL, FUNCTION, RETURN
+) = range(17)
+
+COMMANDS = (
+	'push', 'pop', 'add', 'sub', 'neg', 'eq', 'gt', 'lt', 'and', 'or', 'not',
+	'label', 'goto', 'if-goto', 'call', 'function', 'return'
+)
+OPCODES = {command: opcode for opcode, command in enumerate(COMMANDS)}
+
+# memory segments are kept as their index in SEGMENTS
+SEGMENTS = ('constant', 'argument', 'local', 'static', 'this', 'that', 'pointer', 'temp')
+SEGMENT_CODES = {segment: code for code, segment in enumerate(SEGMENTS)}
+
+# instructions whose first argument is a label or a function name
+NAMED = frozenset([LABEL, GOTO, IF_GOTO, CALL, FUNCTION])
+
+# Jack operator to the VM instruction implementing it,
+# multiplication and division are calls to the OS Math class
+ARITHMETIC = {
+	'+': (ADD, None),
+	'-': (SUB, None),
+	'*': (CALL, 'Math.multiply'),
+	'/': (CALL, 'Math.divide'),
+	'=': (EQ, None),
+	'>': (GT, None),
+	'<': (LT, None),
+	'&': (AND, None),
+	'|': (OR, None),
+	'~': (NOT, None),
+	'neg': (NEG, None),
+}
+
+# a decoded VM instruction, arg1 is a segment name, a label or a function
+# name, arg2 an int, unused arguments are None
+Instruction = collections.namedtuple('Instruction', 'opcode arg1 arg2')
+
+def format_instruction(instruction):
+	"""returns the VM text line of an instruction"""
+
+	opcode, arg1, arg2 = instruction
+	if arg2 is not None:
+		return f'{COMMANDS[opcode]} {arg1} {arg2}\n'
+	elif arg1 is not None:
+		return f'{COMMANDS[opcode]} {arg1}\n'
+	return f'{COMMANDS[opcode]}\n'
+
+def parse_vm(lines):
+	"""parses lines of VM text into a list of Instruction, comments are skipped"""
+
+	instructions = []
+	for line in lines:
+		parts = line.split('//')[0].split()
+		if not parts:
+			continue
+		arg1 = parts[1] if len(parts) > 1 else None
+		arg2 = int(parts[2]) if len(parts) > 2 else None
+		instructions.append(Instruction(OPCODES[parts[0]], arg1, arg2))
+	return instructions
+
 class VMWriter:
 	"""
 	VMWriter is the engine for VM code generating.
 
 	It provides an interface API for the compilation engine to use during compile time.
+
+	The code is kept as an in-memory instruction stream, an array of opcodes and
+	two arrays of integer operands. Segments are stored as their SEGMENT_CODES and
+	labels and function names as an index into the interned names list. The VM
+	text is only produced when the code is read back with vm_text() or get_vm_text().
 	"""
 
 	def __init__(self):
-		self.output_vm = []
+		self.opcodes = array('B')
+		self.arg1 = array('i')
+		self.arg2 = array('i')
+		self.names = []
+		self.name_codes = {}
+
+	def __len__(self):
+		return len(self.opcodes)
+
+	def name_code(self, name):
+		code = self.name_codes.get(name)
+		if code is None:
+			code = self.name_codes[name] = len(self.names)
+			self.names.append(name)
+		return code
+
+	def emit(self, opcode, arg1=-1, arg2=-1):
+		self.opcodes.append(opcode)
+		self.arg1.append(arg1)
+		self.arg2.append(arg2)
+
+	def instruction(self, position):
+		"""decodes the instruction at position"""
+
+		opcode = self.opcodes[position]
+		arg1 = self.arg1[position]
+		arg2 = self.arg2[position]
+		if opcode == PUSH or opcode == POP:
+			return Instruction(opcode, SEGMENTS[arg1], arg2)
+		elif opcode in NAMED:
+			return Instruction(opcode, self.names[arg1], arg2 if arg2 >= 0 else None)
+		return Instruction(opcode, None, None)
+
+	def instructions(self):
+		"""returns the code as a list of Instruction"""
+
+		return [self.instruction(position) for position in range(len(self.opcodes))]
+
+	def set_instructions(self, instructions):
+		"""replaces the code with a list of Instruction"""
+
+		self.opcodes = array('B')
+		self.arg1 = array('i')
+		self.arg2 = array('i')
+		for opcode, arg1, arg2 in instructions:
+			if opcode == PUSH or opcode == POP:
+				self.emit(opcode, SEGMENT_CODES[arg1], arg2)
+			elif opcode in NAMED:
+				self.emit(opcode, self.name_code(arg1), -1 if arg2 is None else arg2)
+			else:
+				self.emit(opcode)
 
 	def get_vm_text(self):
-		return self.output_vm
+		"""returns the code as VM text lines"""
+
+		return [format_instruction(instruction) for instruction in self.instructions()]
+
+	def vm_text(self):
+		return ''.join(self.get_vm_text())
 
 	def write_push(self, segment, index):
-		string = f'push {segment} {index}\n'
-		self.output_vm.append(string)
+		self.emit(PUSH, SEGMENT_CODES[segment], int(index))
 
 	def write_pop(self, segment, index):
-		string = f'pop {segment} {index}\n'
-		self.output_vm.append(string)
+		self.emit(POP, SEGMENT_CODES[segment], int(index))
 
 	def write_arithmatic(self, command):
-		op_dict = {
-			'+': 'add',
-			'-': 'sub',
-			'*': 'call Math.multiply 2',
-			'/': 'call Math.divide 2',
-			'=': 'eq',
-			'>': 'gt',
-			'<': 'lt',
-			'&': 'and',
-			'|': 'or',
-			'~': 'not'
-		}
-
 		# if not specified, so op is negate
-		command = op_dict.get(command, 'neg')
-		string = f'{command}\n'
-		self.output_vm.append(string)
-		
+		opcode, name = ARITHMETIC.get(command, ARITHMETIC['neg'])
+		if name:
+			self.emit(opcode, self.name_code(name), 2)
+		else:
+			self.emit(opcode)
+
 	def write_label(self, label):
-		string = f'label {label}\n'
-		self.output_vm.append(string)
+		self.emit(LABEL, self.name_code(label))
 
 	def write_goto(self, label):
-		string = f'goto {label}\n'
-		self.output_vm.append(string)
+		self.emit(GOTO, self.name_code(label))
 
 	def write_if(self, label):
-		string = f'if-goto {label}\n'
-		self.output_vm.append(string)
-
-	def write_while(self, label):
-		self.output_vm.append()
+		self.emit(IF_GOTO, self.name_code(label))
 
 	def write_call(self, name, n_args):
-		string = f'call {name} {n_args}\n'
-		self.output_vm.append(string)
+		self.emit(CALL, self.name_code(name), n_args)
 
 	def write_function(self, name, n_locals):
-		string = f'function {name} {n_locals}\n'
-		self.output_vm.append(string)
-	
-	def write_return(self, label):
-		string = f'{label}\n'
-		self.output_vm.append(string)
\ No newline at end of file
+		"""
+		returns the position of the function instruction so that n_locals can
+		be backpatched with set_function_locals once the locals are known
+		"""
+
+		self.emit(FUNCTION, self.name_code(name), n_locals)
+		return len(self.opcodes) - 1
+
+	def set_function_locals(self, position, n_locals):
+		"""rewrites in place the local count of the function written at position"""
+
+		self.arg2[position] = n_locals
+
+	def write_return(self):
+		self.emit(RETURN)